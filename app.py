@@ -1,25 +1,82 @@
 import os
+import cProfile
 import csv
+import heapq
 import io
+import pstats
 import json
+import tempfile
 import time
+import zlib
 import threading
+from contextlib import contextmanager
 from pathlib import Path
 from flask import (
     Flask, render_template, request, redirect, url_for, session,
-    jsonify, send_file, flash
+    jsonify, flash, make_response, g, send_from_directory
 )
+from utils.broadcast import Broadcaster
+from utils.csv_import import REQUIRED_HEADERS, ImportJob, ImportJobs, open_csv, run_import
+from utils.fileio import replace_file
 from utils.github_sync import GithubSync
+from utils.locks import LockManager, flocked, try_flock
+from utils.metrics import Counter, Gauge, Registry
+from utils.product_cache import ProductCache
+from utils.product_index import ProductIndex, ensure_ids, is_id, new_id
+from utils.product_journal import ProductJournal
+from utils import product_snapshot
+from utils.sqlite_store import SqliteStore
+from utils.sync_queue import SyncQueue
 from werkzeug.utils import secure_filename
 
 APP_DIR = Path(__file__).parent.resolve()
-DATA_DIR = APP_DIR / "data"
+DATA_DIR = Path(os.environ.get("DATA_DIR", APP_DIR / "data"))
 DATA_DIR.mkdir(exist_ok=True)
+# Multi-process mode: several workers on one DATA_DIR (e.g. gunicorn -w 4
+# -k gthread --threads 32 app:app, without --preload, so each worker starts
+# its own threads; live event streams need the threaded worker). File
+# locks become OS locks under SHARED_DIR, the sync queue is shared through its
+# file, one elected worker pushes to GitHub and the session key is shared.
+MULTI_PROCESS = os.environ.get("MULTI_PROCESS", "0") == "1"
+SHARED_DIR = Path(os.environ.get("SHARED_DIR", APP_DIR / ".shared"))
+if MULTI_PROCESS:
+    SHARED_DIR.mkdir(parents=True, exist_ok=True)
+
+def _shared_secret(path: Path):
+    """A session key generated by the first worker and read by the rest."""
+    with flocked(path.with_name(f".{path.name}.lock")):
+        if not path.exists():
+            path.write_text(os.urandom(32).hex(), encoding="utf-8")
+        return path.read_text(encoding="utf-8").strip()
 
 app = Flask(__name__)
-app.secret_key = os.environ.get("SECRET_KEY", "dev-" + os.urandom(16).hex())
+app.secret_key = os.environ.get("SECRET_KEY") or (
+    _shared_secret(SHARED_DIR / "secret_key") if MULTI_PROCESS else "dev-" + os.urandom(16).hex())
+
+# One reader-writer lock per data file (keyed by file name); see utils/locks.py
+locks = LockManager(lock_dir=SHARED_DIR / "locks" if MULTI_PROCESS else None)
 
-data_lock = threading.Lock()
+# ---- Metrics (served at /metrics; see utils/metrics.py) ----
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram(
+    "inventory_request_seconds", "Request latency by route", ("method", "route"))
+REQUESTS = metrics.counter(
+    "inventory_requests_total", "Requests by route and status", ("method", "route", "status"))
+FILE_SECONDS = metrics.histogram(
+    "inventory_file_seconds", "Products file read/parse/serialize/write time", ("file", "phase"))
+FILE_BYTES = metrics.gauge(
+    "inventory_file_bytes", "Size of each products file when last loaded or written", ("file",))
+GITHUB_SECONDS = metrics.histogram(
+    "inventory_github_request_seconds", "GitHub API call latency", ("method", "endpoint"))
+GITHUB_REQUESTS = metrics.counter(
+    "inventory_github_requests_total", "GitHub API calls by status", ("method", "endpoint", "status"))
+SCAN_PASS_SECONDS = metrics.histogram(
+    "inventory_scan_pass_seconds", "Snapshot decode time per preprocessing pass, as reported by pages",
+    ("pass", "result"))
+SCAN_SNAPSHOTS = metrics.counter(
+    "inventory_scan_snapshots_total", "Snapshot decodes by the pass and engine that found the code",
+    ("pass", "engine"))
+SCAN_PASSES = ("raw", "threshold", "invert", "sharpen")  # as named by static/decode-worker.js
 
 # ---- Config you can tweak quickly ----
 REPO_OWNER = "suhedges"
@@ -27,77 +84,881 @@ REPO_NAME = "InventSB"
 REPO_PATH_PREFIX = "data"  # push JSON files into repo/data/
 USERS_FILE = DATA_DIR / "users.txt"      # one username per line, 3 chars, uppercase
 WAREHOUSES_FILE = DATA_DIR / "warehouses.json"
+PRODUCT_CACHE_MB = int(os.environ.get("PRODUCT_CACHE_MB", "64"))  # in-memory product cache bound
+# Journal mode: single-product edits append to products_<wh>.journal instead of
+# rewriting products_<wh>.json; the journal is folded back (and pushed) once it
+# passes either limit below, or after JOURNAL_MAX_AGE seconds. Not available
+# with MULTI_PROCESS: journal sequence numbers are kept per process.
+PRODUCT_JOURNAL = os.environ.get("PRODUCT_JOURNAL", "0") == "1" and not MULTI_PROCESS
+JOURNAL_MAX_ENTRIES = int(os.environ.get("JOURNAL_MAX_ENTRIES", "500"))
+JOURNAL_MAX_BYTES = int(os.environ.get("JOURNAL_MAX_BYTES", str(1024 * 1024)))
+JOURNAL_MAX_AGE = int(os.environ.get("JOURNAL_MAX_AGE", "60"))
+# Storage backend: 'json' (data/*.json files) or 'sqlite'. The sqlite database
+# lives outside DATA_DIR so it is never pushed; the JSON files GitHub sees are
+# exported from it by the background pusher. Seed it with:
+#   python -m utils.sqlite_store migrate data inventory.db
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+SQLITE_PATH = Path(os.environ.get("SQLITE_PATH", APP_DIR / "inventory.db"))
+# Products file format (JSON backend): 'json' (the default), or 'compact' to
+# keep each warehouse in products_<wh>.snap (see utils/product_snapshot.py):
+# about half the size and quicker to write, but loads are only slightly faster
+# since the product dicts and indexes are rebuilt either way. In compact mode
+# products_<wh>.json is only an export for GitHub, refreshed at most every
+# JSON_EXPORT_INTERVAL seconds; a newer JSON file (e.g. pulled) wins on load.
+PRODUCT_FORMAT = os.environ.get("PRODUCT_FORMAT", "json")
+JSON_EXPORT_INTERVAL = float(os.environ.get("JSON_EXPORT_INTERVAL", "60"))
+# Background pushes: wait for SYNC_DEBOUNCE quiet seconds so bursts of edits
+# share one commit, but never hold a change back longer than SYNC_MAX_LATENCY.
+SYNC_DEBOUNCE = float(os.environ.get("SYNC_DEBOUNCE", "3"))
+SYNC_MAX_LATENCY = float(os.environ.get("SYNC_MAX_LATENCY", "30"))
+# Dirty markers for files not yet pushed, kept outside DATA_DIR so they are never synced
+SYNC_QUEUE_PATH = Path(os.environ.get("SYNC_QUEUE_PATH", APP_DIR / "sync_queue.json"))
+SYNC_RETRY_MAX = float(os.environ.get("SYNC_RETRY_MAX", "300"))  # cap on push retry backoff (s)
+# Login pulls: parallel downloads, and logins within PULL_MIN_INTERVAL seconds
+# of the last pull share it.
+PULL_WORKERS = int(os.environ.get("PULL_WORKERS", "4"))
+PULL_MIN_INTERVAL = float(os.environ.get("PULL_MIN_INTERVAL", "30"))
+# /metrics: Prometheus text. With METRICS_TOKEN set, scrapers send it as a
+# bearer token; otherwise a logged-in session is required. ADMIN_USERS may
+# add ?profile=1 to any request to get a cProfile summary instead of the page.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+ADMIN_USERS = {u.strip().upper() for u in os.environ.get("ADMIN_USERS", "JMH").split(",") if u.strip()}
+PROFILE_TOP = int(os.environ.get("PROFILE_TOP", "40"))  # rows in a ?profile=1 summary
+BATCH_MAX_OPS = int(os.environ.get("BATCH_MAX_OPS", "1000"))  # ops accepted per /products/batch call
+LIST_MAX_LIMIT = int(os.environ.get("LIST_MAX_LIMIT", "1000"))  # largest ?limit= page of /products
+DASHBOARD_REORDER = int(os.environ.get("DASHBOARD_REORDER", "200"))  # under-min rows kept per warehouse
+# Live product events (/api/warehouse/<wh>/events): a stream more than
+# SSE_MAX_QUEUE events behind is dropped; idle streams get a keep-alive
+# comment every SSE_HEARTBEAT seconds. Each open stream holds a request
+# thread for as long as the page is open, so serve the app with a threaded
+# or async worker (gunicorn -k gthread --threads N), never the default sync
+# one; past SSE_MAX_STREAMS per process new streams get a 503 and the page
+# polls /products/changes instead.
+SSE_MAX_QUEUE = int(os.environ.get("SSE_MAX_QUEUE", "256"))
+SSE_HEARTBEAT = float(os.environ.get("SSE_HEARTBEAT", "25"))
+SSE_MAX_STREAMS = int(os.environ.get("SSE_MAX_STREAMS", "64"))
 
 # Make sure baseline files exist
 if not USERS_FILE.exists():
-    USERS_FILE.write_text("JMH\n", encoding="utf-8")
+    replace_file(USERS_FILE, "JMH\n")
 
 if not WAREHOUSES_FILE.exists():
-    WAREHOUSES_FILE.write_text(json.dumps({"warehouses": []}, indent=2))
+    replace_file(WAREHOUSES_FILE, json.dumps({"warehouses": []}, indent=2))
 
 def load_users():
     return {u.strip().upper() for u in USERS_FILE.read_text(encoding="utf-8").splitlines() if u.strip()}
 
+def _products_key(wh):
+    return "".join(ch for ch in wh if ch.isalnum() or ch in ("-", "_")).strip()
+
 def _products_path(wh):
-    safe = "".join(ch for ch in wh if ch.isalnum() or ch in ("-", "_")).strip()
-    return DATA_DIR / f"products_{safe}.json"
+    return DATA_DIR / f"products_{_products_key(wh)}.json"
+
+sql_store = SqliteStore(SQLITE_PATH) if STORAGE_BACKEND == "sqlite" else None
+# products_<wh>.json files (by name) whose database rows changed since the last export
+_sql_exports = set()
 
 def load_warehouses():
-    with data_lock:
+    if sql_store is not None:
+        return sql_store.load_warehouses()
+    with locks.read(WAREHOUSES_FILE.name):
         try:
             return json.loads(WAREHOUSES_FILE.read_text(encoding="utf-8")).get("warehouses", [])
         except Exception:
             return []
 
 def save_warehouses(warehouses):
-    with data_lock:
-        WAREHOUSES_FILE.write_text(json.dumps({"warehouses": warehouses}, indent=2), encoding="utf-8")
+    if sql_store is not None:
+        sql_store.save_warehouses(warehouses)
+        schedule_sync(WAREHOUSES_FILE)
+        return
+    with locks.write(WAREHOUSES_FILE.name):
+        replace_file(WAREHOUSES_FILE, json.dumps({"warehouses": warehouses}, indent=2))
     schedule_sync(WAREHOUSES_FILE)
 
+# Product change events per products file name, for open product pages
+events = Broadcaster(max_queue=SSE_MAX_QUEUE, heartbeat=SSE_HEARTBEAT)
+
+def publish_changes(p: Path, base, revision, changes):
+    """
+    Tell open product pages that ``changes`` [(op, id, product or None)]
+    moved the warehouse from revision ``base`` to ``revision``. Pages still
+    at ``base`` patch themselves; anyone else resyncs.
+    """
+    events.publish(p.name, {"base": base, "revision": revision, "changes": [
+        {"op": op, "id": pid, **({"product": prod} if prod is not None else {})}
+        for op, pid, prod in changes]})
+
+def publish_reset(p: Path, revision):
+    """Bulk change (import, replace): open pages refetch."""
+    events.publish(p.name, {"revision": revision, "reset": True})
+
+# ProductIndex (parsed list + lookups) per products file name; see utils/product_cache.py
+product_cache = ProductCache(max_bytes=PRODUCT_CACHE_MB * 1024 * 1024)
+
+# Journal bookkeeping per products file: last seq, unfolded entries, first unfolded time
+_journal_state = {}
+
+def _journal_for(p: Path):
+    return ProductJournal(p.with_suffix(".journal"))
+
+def _snapshot_path(p: Path):
+    return p.with_suffix(".snap")
+
+def _source_path(p: Path):
+    """
+    The file products_<wh> is loaded from: the .snap in compact mode, unless
+    the JSON file is newer (pulled, or written before compact mode was on).
+    """
+    if PRODUCT_FORMAT != "compact":
+        return p
+    snap = _snapshot_path(p)
+    sstamp = product_cache.stamp(snap)
+    if sstamp is None:
+        return p
+    jstamp = product_cache.stamp(p)
+    return p if jstamp is not None and jstamp[0] > sstamp[0] else snap
+
+def _products_stamp(p: Path):
+    """Return (stamp, weight) covering the snapshot and, in journal mode, its journal."""
+    stamp = product_cache.stamp(_source_path(p))
+    if stamp is None:
+        return None, 0
+    if not PRODUCT_JOURNAL:
+        return stamp, stamp[1]
+    jstamp = product_cache.stamp(_journal_for(p).path) or (0, 0, 0)
+    return stamp + jstamp, stamp[1] + jstamp[1]
+
+# products file name -> (stamp, revision) as last loaded/written by this process
+_revision_seen = {}
+
+def _next_revision(prev):
+    """
+    Revisions are millisecond clock readings pushed past the previous one, so
+    they keep increasing across restarts and rebuilt indexes.
+    """
+    return max(prev + 1, int(time.time() * 1000))
+
+def load_index(warehouse):
+    """
+    Return the warehouse's cached ProductIndex (JSON backend). Writers
+    change it in place under the write lock, so read it inside
+    ``reading()`` rather than through this, and change data only through
+    save_products/change_product/apply_product_batch.
+
+    A file from before product IDs (or one pulled from such a remote) has
+    its products given ids and versions on first load, and is rewritten
+    and pushed right away so the ids stay the same for every process.
+    """
+    p = _products_path(warehouse)
+    if not _source_path(p).exists():
+        with locks.write(p.name):
+            if not _source_path(p).exists():
+                replace_file(p, json.dumps({"products": []}, indent=2))
+    with locks.read(p.name):
+        stamp, weight = _products_stamp(p)
+        cached = product_cache.get(p.name, stamp)
+        if cached is not None:
+            return cached
+        idx, assigned = _read_index(p, stamp, weight)
+        if not assigned:
+            return idx
+    with locks.write(p.name):
+        current = _products_stamp(p)[0] == stamp
+        if current:
+            idx.reset_to(_next_revision(idx.revision))
+            _write_snapshot(p, idx)
+    if not current:
+        return load_index(warehouse)  # rewritten meanwhile (maybe with ids): start over
+    schedule_sync(p)
+    return idx
+
+def _read_index(p: Path, stamp, weight):
+    """
+    Parse products_<wh> (replaying its journal) into a ProductIndex; the
+    caller holds its read or write lock and has just taken ``stamp``.
+    Return (index, ids assigned). An index that needed no ids is recorded
+    as current and cached; one that did must be rewritten before use.
+    """
+    src = _source_path(p)
+    t0 = time.perf_counter()
+    try:
+        if src.suffix == ".snap":
+            data = src.read_bytes()
+            t1 = time.perf_counter()
+            doc = product_snapshot.decode(data)
+        else:
+            text = src.read_text(encoding="utf-8")
+            t1 = time.perf_counter()
+            doc = json.loads(text)
+    except Exception:
+        return ProductIndex([]), 0
+    prods = doc.get("products", [])
+    replayed = []
+    if PRODUCT_JOURNAL:
+        seq, applied = _journal_for(p).replay(prods, doc.get("journal_seq", 0), replayed.append)
+        _journal_state[p.name] = {"seq": seq, "entries": applied,
+                                  "since": time.time() if applied else None}
+    assigned = ensure_ids(prods)
+    idx = ProductIndex(prods)
+    FILE_SECONDS.observe(t1 - t0, p.name, "read")
+    FILE_SECONDS.observe(time.perf_counter() - t1, p.name, "parse")
+    FILE_BYTES.set(weight, p.name)
+    idx.load_meta(doc)
+    for rec in replayed:
+        idx.bump(rec.get("rev", 0), rec.get("id") if rec.get("op") == "delete" else None)
+    seen = _revision_seen.get(p.name)
+    if seen and seen[0] != stamp and seen[1] >= idx.revision:
+        # replaced behind our back (e.g. a pull) without a newer revision
+        idx.reset_to(_next_revision(seen[1]))
+    if not assigned:
+        _revision_seen[p.name] = (stamp, idx.revision)
+        product_cache.put(p.name, stamp, idx, idx.approx_bytes())
+    return idx, assigned
+
+def _current_index(p: Path, base: ProductIndex):
+    """
+    The ProductIndex that is current for a caller holding ``p``'s read or
+    write lock: the cached one, else ``base`` (from load_index before
+    locking) if the file has not changed since it was loaded, which is all
+    a warehouse too big to cache can go by. None if neither is.
+    """
+    stamp = _products_stamp(p)[0]
+    idx = product_cache.peek(p.name, stamp)
+    if idx is None and _revision_seen.get(p.name) == (stamp, base.revision):
+        idx = base
+    return idx
+
+def _index_for_write(p: Path, base: ProductIndex):
+    """
+    _current_index for a writer, reading the file again under the lock if
+    need be: never an index some other write has moved past.
+    """
+    idx = _current_index(p, base)
+    if idx is not None:
+        return idx
+    stamp, weight = _products_stamp(p)
+    idx, assigned = _read_index(p, stamp, weight)
+    if assigned:
+        # replaced by a file from before product IDs meanwhile: keep the ids it got
+        idx.reset_to(_next_revision(idx.revision))
+        _write_snapshot(p, idx)
+        schedule_sync(p)
+    return idx
+
+@contextmanager
+def reading(warehouse):
+    """
+    Hold the warehouse's read lock and yield its current ProductIndex.
+    Writers change the index in place, so positions and products must be
+    read inside the block; what leaves it (product dicts, lists built from
+    them) stays valid, since products are replaced on change, not edited.
+    """
+    p = _products_path(warehouse)
+    while True:
+        base = load_index(warehouse)
+        with locks.read(p.name):
+            idx = _current_index(p, base)
+            if idx is not None:
+                yield idx
+                return
+        # written between loading and locking and not cached: load again
+
+def _forget_index(p: Path):
+    """Drop an index a failed in-place change may have left half-changed; the next use reloads."""
+    product_cache.invalidate(p.name)
+    _revision_seen.pop(p.name, None)
+
 def load_products(warehouse):
+    """Return a (shallow) copy of the warehouse's product list."""
+    if sql_store is not None:
+        return sql_store.load_products(_products_key(warehouse))
+    with reading(warehouse) as idx:
+        return list(idx.products)
+
+def _write_snapshot(p: Path, idx: ProductIndex):
+    """
+    Rewrite products_<wh>.json (products_<wh>.snap in compact mode) from
+    ``idx`` (caller holds the write lock). In journal mode this starts the
+    warehouse's journal bookkeeping if it has none yet (first written by a
+    bulk save or import), so later single edits are journaled.
+    """
+    doc = {"products": idx.products}
+    doc.update(idx.meta())
+    st = _journal_state.get(p.name)
+    if PRODUCT_JOURNAL and st is None:
+        # past whatever an older journal holds, in case clearing it below fails
+        st = _journal_state[p.name] = {"seq": _journal_for(p).last_seq(), "entries": 0, "since": None}
+    if PRODUCT_JOURNAL:
+        doc["journal_seq"] = st["seq"]
+    if PRODUCT_FORMAT == "compact":
+        snap = _snapshot_path(p)
+        with FILE_SECONDS.time(p.name, "serialize"):
+            data = product_snapshot.encode(doc)
+        with FILE_SECONDS.time(p.name, "write"):
+            replace_file(snap, data)
+    else:
+        with FILE_SECONDS.time(p.name, "serialize"):
+            text = json.dumps(doc, indent=2)
+        with FILE_SECONDS.time(p.name, "write"):
+            replace_file(p, text)
+    if PRODUCT_JOURNAL:
+        _journal_for(p).clear()
+        st.update(entries=0, since=None)
+    stamp, weight = _products_stamp(p)
+    FILE_BYTES.set(weight, p.name)
+    _revision_seen[p.name] = (stamp, idx.revision)
+    product_cache.put(p.name, stamp, idx, idx.approx_bytes())
+
+def save_products(warehouse, products, index=None):
+    """
+    Replace the warehouse's product list. Pass the ProductIndex the caller
+    kept in step with ``products`` as ``index`` to skip re-indexing. This
+    is a bulk change: the revision advances and delta clients must refetch.
+    """
     p = _products_path(warehouse)
-    if not p.exists():
-        with data_lock:
-            p.write_text(json.dumps({"products": []}, indent=2), encoding="utf-8")
-    with data_lock:
+    if sql_store is not None:
+        sql_store.save_products(_products_key(warehouse), products)
+        _sql_exports.add(p.name)
+        schedule_sync(p)
+        publish_reset(p, sql_store.revision(_products_key(warehouse)))
+        return
+    if ensure_ids(products):
+        index = None  # built before the ids it is missing
+    idx = index if index is not None and index.products is products else ProductIndex(products)
+    with locks.write(p.name):
+        _replace_index(p, idx)
+    schedule_sync(p)
+    publish_reset(p, idx.revision)
+
+def _replace_index(p: Path, idx: ProductIndex):
+    """Write ``idx`` as a bulk change to the list (caller holds the write lock)."""
+    seen = _revision_seen.get(p.name)
+    if seen is not None:
+        idx.revision = max(idx.revision, seen[1])
+    idx.reset_to(_next_revision(idx.revision))
+    _write_snapshot(p, idx)
+
+def _change_record(rev, op, index, product, pid):
+    """Journal record for one change (``seq`` is assigned by _commit_changes)."""
+    rec = {"rev": rev, "op": op, "id": pid}
+    if op != "add":
+        rec["index"] = index
+    if op != "delete":
+        rec["product"] = product
+    return rec
+
+def _commit_changes(p: Path, idx: ProductIndex, records):
+    """
+    Persist changes already applied to ``idx`` (caller holds the write lock):
+    append ``records`` to the journal, or rewrite the snapshot when not
+    journaling or once the journal passes its limits. Return True if the
+    snapshot was written.
+    """
+    st = _journal_state.get(p.name)
+    if not PRODUCT_JOURNAL or st is None:
+        _write_snapshot(p, idx)
+        return True
+    journal = _journal_for(p)
+    for rec in records:
+        st["seq"] += 1
+        rec["seq"] = st["seq"]
+    journal.extend(records)
+    st["entries"] += len(records)
+    st["since"] = st["since"] or time.time()
+    stamp = _products_stamp(p)[0]
+    _revision_seen[p.name] = (stamp, idx.revision)
+    product_cache.put(p.name, stamp, idx, idx.approx_bytes())
+    if st["entries"] >= JOURNAL_MAX_ENTRIES or journal.size() >= JOURNAL_MAX_BYTES:
+        _write_snapshot(p, idx)
+        return True
+    return False
+
+def change_product(warehouse, op):
+    """
+    Run one add/update/delete ``op``, shaped like a /products/batch op, and
+    persist it; return the op's result (failures carry a ``status``).
+    The cached ProductIndex is changed in place under the write lock (readers
+    go through ``reading()``), so an edit costs the same at any size. The
+    warehouse moves to a new revision (stamped on the product as ``rev``;
+    deletions leave a tombstone). Without PRODUCT_JOURNAL the snapshot is
+    rewritten; with it, only a small record is appended and the snapshot is
+    rewritten on compaction.
+    """
+    if sql_store is not None:
+        return _change_product_sql(warehouse, op)
+    p = _products_path(warehouse)
+    base = load_index(warehouse)
+    with locks.write(p.name):
+        idx = _index_for_write(p, base)
         try:
-            return json.loads(p.read_text(encoding="utf-8")).get("products", [])
-        except Exception:
-            return []
+            res, change = _run_batch_op(idx, op)
+            if change is None:
+                return res
+            kind, i, prod, pid = change
+            revision = idx.revision
+            rev = _next_revision(revision)
+            if prod is not None:
+                prod["rev"] = rev
+            idx.bump(rev, pid if kind == "delete" else None)
+            wrote = _commit_changes(p, idx, [_change_record(rev, kind, i, prod, pid)])
+        except BaseException:
+            _forget_index(p)
+            raise
+    if wrote:
+        schedule_sync(p)
+    publish_changes(p, revision, rev, [(kind, pid, prod)])
+    if prod is not None:
+        res["product"] = prod
+    return res
 
-def save_products(warehouse, products):
+def _change_product_sql(warehouse, op):
+    """change_product for the SQLite backend: only the product concerned is read."""
+    key = _products_key(warehouse)
     p = _products_path(warehouse)
-    with data_lock:
-        p.write_text(json.dumps({"products": products}, indent=2), encoding="utf-8")
+    with locks.write(p.name):
+        base = sql_store.revision(key)
+        if op.get("op") == "add":
+            body = op.get("product") or {}
+            if not _valid_body(body):
+                body = {}  # _run_batch_op refuses it
+            if (body.get("internal_name") and body.get("customer_name") and
+                    sql_store.key_position(key, body["internal_name"], body["customer_name"]) is not None):
+                return {"error": "product already exists", "status": 409}
+            same_id = sql_store.get_product(key, body["id"])[1] if is_id(body.get("id")) else None
+            if same_id is not None:
+                return {"error": "product already exists", "status": 409, "product": same_id}
+            pos, one = None, ProductIndex([])
+        else:
+            pos, prod = sql_store.get_product(key, op.get("id"))
+            one = ProductIndex([prod] if prod is not None else [])
+        res, change = _run_batch_op(one, op)
+        if change is None:
+            return res
+        kind, _, prod, pid = change
+        sql_store.apply_change(key, kind, pos, prod)
+        rev = sql_store.revision(key)
+    _sql_exports.add(p.name)
     schedule_sync(p)
+    publish_changes(p, base, rev, [(kind, pid, prod)])
+    if prod is not None:
+        res["product"] = prod
+        if prod.get("barcode"):
+            others = [x for x in sql_store.barcode_ids(key, prod["barcode"]) if x != pid]
+            if others:
+                res["duplicates"] = others
+    return res
+
+def new_product(body):
+    """
+    A normalized product from an add request body, with a fresh id unless
+    the body brings one (a page that added it offline already refers to it).
+    """
+    return {
+        "id": body["id"] if is_id(body.get("id")) else new_id(),
+        "version": 1,
+        "internal_name": body["internal_name"].strip(),
+        "customer_name": body["customer_name"].strip(),
+        "internal_code": body.get("internal_code","").strip(),
+        "customer_code": body.get("customer_code","").strip(),
+        "bin": body.get("bin","").strip(),
+        "qty": int(body.get("qty") or 0),
+        "min": int(body.get("min") or 0),
+        "max": int(body.get("max") or 0),
+        "barcode": (body.get("barcode") or "").strip(),
+        "updated_at": int(time.time()),
+    }
+
+PRODUCT_TEXT_FIELDS = ("internal_name", "customer_name", "internal_code", "customer_code", "bin", "barcode")
+
+def _valid_body(body):
+    """True if ``body`` is a dict whose text fields, where present, are strings (or null)."""
+    return isinstance(body, dict) and all(
+        isinstance(body.get(k), (str, type(None))) for k in PRODUCT_TEXT_FIELDS)
+
+def update_product_fields(p, body):
+    """Apply the fields present in an update request body to ``p`` and bump its version."""
+    for k in PRODUCT_TEXT_FIELDS:
+        if k in body:
+            p[k] = (body.get(k) or "").strip()
+    for k in ["qty", "min", "max"]:
+        if k in body and body[k] is not None:
+            try:
+                p[k] = int(body[k])
+            except Exception:
+                pass
+    p["updated_at"] = int(time.time())
+    p["version"] = p.get("version", 0) + 1
+
+def _batch_position(idx, op):
+    """
+    Position an update/delete op refers to: the product with the op's ``id``.
+    Ops without one (queued by pages from before product IDs) give ``index``
+    and optionally ``key`` ([internal_name, customer_name]), by which the
+    product is found if ``index`` no longer points at it.
+    """
+    if "id" in op:
+        return idx.position_of(op["id"])
+    i = op.get("index")
+    valid = isinstance(i, int) and 0 <= i < len(idx.products)
+    key = op.get("key")
+    if not key:
+        return i if valid else None
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(k, (str, type(None))) for k in key)):
+        return None
+    if valid and idx.name_key_at(i) == [(k or "").strip().lower() for k in key]:
+        return i
+    return idx.find_key(*key)
+
+def _run_batch_op(idx, op):
+    """
+    Apply one batch op to ``idx.products``; return (result, change or None),
+    a change being (op, position, product or None, id). An update/delete
+    with ``version`` only applies if the product is still at that version;
+    otherwise it fails with 409 and the current product.
+    """
+    prods = idx.products
+    kind = op.get("op")
+    if kind == "add":
+        body = op.get("product") or {}
+        if not _valid_body(body):
+            return {"error": "invalid product", "status": 400}, None
+        if not (body.get("internal_name") and body.get("customer_name")):
+            return {"error": "internal_name and customer_name are required", "status": 400}, None
+        if idx.find_key(body["internal_name"], body["customer_name"]) is not None:
+            return {"error": "product already exists", "status": 409}, None
+        if idx.position_of(body.get("id")) is not None:
+            return {"error": "product already exists", "status": 409, "product": idx.get(body["id"])}, None
+        try:
+            p = new_product(body)
+        except (TypeError, ValueError, AttributeError):
+            return {"error": "invalid product", "status": 400}, None
+        prods.append(p)
+        idx.add()
+        i, change = len(prods) - 1, ("add", len(prods) - 1, p, p["id"])
+    elif kind in ("update", "delete"):
+        if kind == "update" and not _valid_body(op.get("fields") or {}):
+            return {"error": "invalid fields", "status": 400}, None
+        i = _batch_position(idx, op)
+        if i is None:
+            return {"error": "not found", "status": 404}, None
+        if op.get("version") is not None and prods[i].get("version") != op["version"]:
+            return {"error": "version conflict", "status": 409, "product": prods[i]}, None
+        if kind == "update":
+            old = prods[i]
+            p = dict(old)  # copy: the old dict may still be shared with readers
+            update_product_fields(p, op.get("fields") or {})
+            prods[i] = p
+            idx.reindex(i, old)
+            change = ("update", i, p, p["id"])
+        else:
+            pid = idx.id_at(i)
+            idx.delete(i, prods.pop(i))
+            return {"ok": True, "id": pid}, ("delete", i, None, pid)
+    else:
+        return {"error": "unknown op", "status": 400}, None
+    res = {"ok": True, "id": p["id"], "version": p["version"]}
+    if p.get("barcode"):
+        others = [idx.id_at(j) for j in idx.find_barcode(p["barcode"]) if j != i]
+        if others:
+            res["duplicates"] = others
+    return res, change
+
+def _run_batch(idx, ops, atomic):
+    """Run ``ops`` in order; stop at the first failure when ``atomic``."""
+    results, changes = [], []
+    for op in ops:
+        res, change = _run_batch_op(idx, op if isinstance(op, dict) else {})
+        results.append(res)
+        if change is None and atomic:
+            return results, None
+        if change is not None:
+            changes.append(change)
+    return results, changes
+
+def apply_product_batch(warehouse, ops, atomic=False):
+    """
+    Apply many add/update/delete ops with one load, one save and one
+    schedule_sync. Ops run in order against the list as left by the previous
+    op, exactly as if sent one by one, in place like change_product; an
+    atomic batch runs on a copy instead, so a failing op can drop it.
+    Return (results, applied); ``applied`` is None when an atomic batch was
+    rolled back.
+    """
+    p = _products_path(warehouse)
+    if sql_store is not None:
+        with locks.write(p.name):
+            base = sql_store.revision(_products_key(warehouse))
+            idx = ProductIndex(sql_store.load_products(_products_key(warehouse)))
+            results, changes = _run_batch(idx, ops, atomic)
+            if changes:
+                sql_store.apply_changes(_products_key(warehouse),
+                                        [(op, i, prod) for op, i, prod, _ in changes])
+                _sql_exports.add(p.name)
+                rev = sql_store.revision(_products_key(warehouse))
+        if changes:
+            schedule_sync(p)
+            publish_changes(p, base, rev, [(op, pid, prod) for op, _, prod, pid in changes])
+        return results, None if changes is None else len(changes)
+    wrote = False
+    loaded = load_index(warehouse)
+    with locks.write(p.name):
+        idx = _index_for_write(p, loaded)
+        if atomic:
+            idx = idx.copy()
+        try:
+            results, changes = _run_batch(idx, ops, atomic)
+            if changes:
+                base = idx.revision
+                rev = _next_revision(idx.revision)
+                records = []
+                for op, i, prod, pid in changes:
+                    if prod is not None:
+                        prod["rev"] = rev
+                    idx.bump(rev, pid if op == "delete" else None)
+                    records.append(_change_record(rev, op, i, prod, pid))
+                wrote = _commit_changes(p, idx, records)
+        except BaseException:
+            _forget_index(p)
+            raise
+    if wrote:
+        schedule_sync(p)
+    if changes:
+        publish_changes(p, base, rev, [(op, pid, prod) for op, _, prod, pid in changes])
+    return results, None if changes is None else len(changes)
+
+def compact_journals(max_age=0):
+    """Fold journals with entries older than ``max_age`` seconds into their snapshots."""
+    now = time.time()
+    for name, st in list(_journal_state.items()):
+        if st["entries"] and now - st["since"] >= max_age:
+            wh = name[len("products_"):-len(".json")]
+            p = _products_path(wh)
+            base = load_index(wh)
+            with locks.write(p.name):
+                # fold what is current under the lock, not what was loaded
+                _write_snapshot(p, _index_for_write(p, base))
+            schedule_sync(p)
+
+def warehouse_revision(warehouse):
+    if sql_store is not None:
+        return sql_store.revision(_products_key(warehouse))
+    return load_index(warehouse).revision
 
 # ---------- GitHub Sync (optional, best-effort/offline-friendly) ----------
+def _observe_github(r):
+    """GithubSync response hook: latency and status per coarse endpoint."""
+    path = r.request.path_url.split("?")[0]
+    if "/git/" in path:
+        endpoint = "git/" + path.split("/git/", 1)[1].split("/")[0]
+    elif "/contents" in path:
+        endpoint = "contents"
+    else:
+        endpoint = "raw" if "api.github.com" not in r.url else "repo"
+    GITHUB_SECONDS.observe(r.elapsed.total_seconds(), r.request.method, endpoint)
+    GITHUB_REQUESTS.inc(r.request.method, endpoint, str(r.status_code))
+
 github = GithubSync(
-    repo_owner=REPO_OWNER, repo_name=REPO_NAME, path_prefix=REPO_PATH_PREFIX
+    repo_owner=REPO_OWNER, repo_name=REPO_NAME, path_prefix=REPO_PATH_PREFIX,
+    locks=locks, pull_workers=PULL_WORKERS, pull_interval=PULL_MIN_INTERVAL,
+    on_response=_observe_github,
 )
 
 _pending = set()
 _lock = threading.Lock()
+# compact mode: products files waiting out JSON_EXPORT_INTERVAL -> first change time
+_exports_due = {}
+_pending_cv = threading.Condition(_lock)
+_pending_since = _pending_last = 0.0  # when the oldest / newest pending change was queued
 
-def schedule_sync(path: Path):
-    """Queue a file to be pushed to GitHub in the background (non-blocking)."""
+sync_queue = SyncQueue(SYNC_QUEUE_PATH, shared=MULTI_PROCESS)
+_pusher_lock = None  # MULTI_PROCESS: descriptor holding the pusher election lock
+
+def _enqueue(path: Path):
+    global _pending_since, _pending_last
     with _lock:
+        now = time.time()
+        if not _pending:
+            _pending_since = now
+        _pending_last = now
         _pending.add(str(path.resolve()))
+        _pending_cv.notify()
 
-def background_pusher():
-    while True:
-        time.sleep(3)
-        batch = []
+def schedule_sync(path: Path):
+    """
+    Queue a file to be pushed to GitHub in the background (non-blocking).
+    The file is marked dirty on disk first, so the push survives a restart.
+    A queued path that no longer exists when the batch goes out is deleted
+    from the repo. In compact mode products files are held back for
+    JSON_EXPORT_INTERVAL seconds (see release_exports). In MULTI_PROCESS
+    mode the marker is all there is: the elected pusher picks it up.
+    """
+    sync_queue.mark(path.name)
+    if MULTI_PROCESS:
+        return
+    if PRODUCT_FORMAT == "compact" and sql_store is None and path.name.startswith("products_"):
         with _lock:
+            _exports_due.setdefault(str(path.resolve()), time.time())
+        return
+    _enqueue(path)
+
+def release_exports(max_age=0):
+    """Queue products files held back for at least ``max_age`` seconds."""
+    now = time.time()
+    with _lock:
+        due = [f for f, since in _exports_due.items() if now - since >= max_age]
+        for f in due:
+            del _exports_due[f]
+    for f in due:
+        _enqueue(Path(f))
+
+def _next_sync_batch(idle_timeout):
+    """
+    Wait until the queue has been quiet for SYNC_DEBOUNCE seconds, or its
+    oldest entry is SYNC_MAX_LATENCY old, and take everything queued.
+    Returns [] if nothing was queued within ``idle_timeout`` seconds.
+    """
+    deadline = time.time() + idle_timeout
+    with _pending_cv:
+        while True:
+            now = time.time()
             if _pending:
-                batch = list(_pending)
-                _pending.clear()
-        for fullpath in batch:
+                due = min(_pending_last + SYNC_DEBOUNCE, _pending_since + SYNC_MAX_LATENCY)
+                if now >= due:
+                    batch = list(_pending)
+                    _pending.clear()
+                    return batch
+                _pending_cv.wait(due - now)
+            elif now >= deadline:
+                return []
+            else:
+                _pending_cv.wait(deadline - now)
+
+def _has_unpushed_changes(name):
+    """True if data/<name> holds local edits GitHub has not been sent yet."""
+    if sync_queue.is_dirty(name) or name in _sql_exports:
+        return True
+    st = _journal_state.get(name)
+    return bool(st and st["entries"])
+
+def _export_json(path: Path):
+    """
+    Compact mode: rewrite products_<wh>.json from its .snap if the snapshot
+    is newer. The export takes the snapshot's mtime, so loads keep using the
+    snapshot and the cached index stays valid.
+    """
+    snap = _snapshot_path(path)
+    with locks.read(path.name):
+        sstamp = product_cache.stamp(snap)
+        jstamp = product_cache.stamp(path)
+        if sstamp is None or (jstamp is not None and jstamp[0] >= sstamp[0]):
+            return
+        doc = product_snapshot.decode(snap.read_bytes())
+        replace_file(path, json.dumps(doc, indent=2), mtime_ns=sstamp[0])
+
+def _materialize(path: Path):
+    """
+    Write the JSON file GitHub expects: out of the database in sqlite mode,
+    out of the .snap snapshot in compact mode.
+    """
+    if sql_store is None:
+        if PRODUCT_FORMAT == "compact" and path.name.startswith("products_"):
+            _export_json(path)
+        return
+    if path == WAREHOUSES_FILE:
+        sql_store.export_warehouses_json(path)
+    elif path.name in _sql_exports:
+        _sql_exports.discard(path.name)
+        sql_store.export_products_json(path.stem[len("products_"):], path)
+    elif MULTI_PROCESS and path.name.startswith("products_"):
+        # another worker may have made the change; export unless the warehouse is gone
+        key = path.stem[len("products_"):]
+        if any(_products_key(w["name"]) == key for w in sql_store.load_warehouses()):
+            sql_store.export_products_json(key, path)
+
+def _data_files():
+    """Files in DATA_DIR that are mirrored to GitHub."""
+    return [p for p in DATA_DIR.glob("*")
+            if p.is_file() and p.suffix not in (".journal", ".snap") and not p.name.startswith(".")]
+
+def _recover_sync_queue():
+    """Re-queue whatever a previous run left unpushed, and nothing else."""
+    if PRODUCT_JOURNAL:
+        # fold journals left behind by the last run into their snapshots
+        for j in DATA_DIR.glob("products_*.journal"):
+            load_index(j.stem[len("products_"):])
+        compact_journals()
+    keys = set(sql_store.product_keys()) if sql_store is not None else set()
+    for name in sync_queue.recover(_data_files()):
+        if name.startswith("products_") and name[len("products_"):-len(".json")] in keys:
+            _sql_exports.add(name)  # re-export: the JSON file may predate the database
+        _enqueue(DATA_DIR / name)
+
+def push_batch(paths):
+    """Materialize and push ``paths`` as one commit, clearing their dirty markers on success."""
+    gens = sync_queue.generations([p.name for p in paths])
+    with _lock:
+        for p in paths:
+            _exports_due.pop(str(p.resolve()), None)  # going out now
+    for p in paths:
+        _materialize(p)
+    # one commit for the whole batch (deleted files become tree deletions)
+    github.push_files(paths)
+    sync_queue.done(gens, {p.name: github.remote_sha(p) for p in paths})
+
+def _poll_shared_queue():
+    """MULTI_PROCESS pusher: queue files other workers marked dirty."""
+    now = time.time()
+    with _lock:
+        queued = set(_pending)
+    for name, since in sync_queue.dirty_since().items():
+        path = DATA_DIR / name
+        if str(path.resolve()) in queued:
+            continue
+        if (PRODUCT_FORMAT == "compact" and sql_store is None and name.startswith("products_")
+                and now - since < JSON_EXPORT_INTERVAL):
+            continue
+        _enqueue(path)
+
+def background_pusher():
+    global _pusher_lock
+    if MULTI_PROCESS:
+        # one worker pushes: whoever holds the lock, until its process exits
+        while _pusher_lock is None:
+            _pusher_lock = try_flock(SHARED_DIR / "pusher.lock")
+            if _pusher_lock is None:
+                time.sleep(5)
+    try:
+        _recover_sync_queue()
+    except Exception as e:
+        print("[SYNC] sync queue recovery failed:", e)
+    while True:
+        if MULTI_PROCESS:
+            _poll_shared_queue()
+        batch = _next_sync_batch(idle_timeout=3)
+        if PRODUCT_JOURNAL:
             try:
-                github.push_file(Path(fullpath))
+                compact_journals(JOURNAL_MAX_AGE)
             except Exception as e:
-                # Silently continue; app remains usable offline
-                print("[SYNC] push failed:", e)
+                print("[SYNC] journal compaction failed:", e)
+        release_exports(JSON_EXPORT_INTERVAL)
+        if not batch or not github.enabled():
+            continue  # offline: the files stay marked dirty for the next run
+        paths = [Path(f) for f in batch]
+        try:
+            push_batch(paths)
+        except Exception as e:
+            # Silently continue; app remains usable offline
+            print("[SYNC] push failed:", e)
+            sync_queue.failed(e)
+            time.sleep(min(SYNC_RETRY_MAX, 2 ** sync_queue.failures))
+            for p in paths:
+                _enqueue(p)
+
+if sql_store is not None:
+    # products given ids when the database was opened: their JSON files are re-exported
+    for key in sql_store.assigned_ids:
+        sync_queue.mark(f"products_{key}.json")
 
 threading.Thread(target=background_pusher, daemon=True).start()
 
@@ -107,21 +968,185 @@ def require_login():
         return False
     return True
 
-def stock_bucket(prod):
-    """Return 'under_min', 'over_max', or 'optimal'."""
-    try:
-        qty = int(prod.get("qty", 0))
-        mn = int(prod.get("min", 0))
-        mx = int(prod.get("max", 0))
-    except Exception:
-        return "optimal"
-    if qty < mn:
-        return "under_min"
-    if qty > mx:
-        return "over_max"
-    return "optimal"
+@app.before_request
+def _before_request():
+    g.t0 = time.perf_counter()
+    if request.args.get("profile") == "1" and session.get("user") in ADMIN_USERS:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def _after_request(resp):
+    rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+    REQUEST_SECONDS.observe(time.perf_counter() - g.t0, request.method, rule)
+    REQUESTS.inc(request.method, rule, str(resp.status_code))
+    prof = g.pop("profiler", None)
+    if prof is None:
+        return resp
+    prof.disable()
+    out = io.StringIO()
+    pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    return make_response(out.getvalue(), 200, {
+        "Content-Type": "text/plain; charset=utf-8",
+        "X-Profiled-Status": str(resp.status_code),
+    })
+
+@metrics.collector
+def _state_metrics():
+    """Values kept elsewhere, read at scrape time."""
+    wait = Counter("inventory_lock_wait_seconds_total", "Time spent waiting for file locks", ("file", "mode"))
+    wait_max = Gauge("inventory_lock_wait_seconds_max", "Longest wait for a file lock", ("file", "mode"))
+    acquired = Counter("inventory_lock_acquisitions_total", "File lock acquisitions", ("file", "mode"))
+    for key, modes in locks.stats().items():
+        for mode, st in modes.items():
+            wait.inc(key, mode, amount=st["wait_total"])
+            wait_max.set(st["wait_max"], key, mode)
+            acquired.inc(key, mode, amount=st["count"])
+    sq = sync_queue.stats()
+    depth = Gauge("inventory_sync_queue_depth", "Files marked dirty, not yet pushed")
+    depth.set(sq["depth"])
+    oldest = Gauge("inventory_sync_oldest_dirty_seconds", "Age of the oldest unpushed change")
+    oldest.set(sq["oldest_dirty_age"] or 0)
+    last_ok = Gauge("inventory_sync_last_success_timestamp", "Unix time of the last successful push")
+    last_ok.set(sq["last_success"] or 0)
+    failures = Counter("inventory_sync_failures_total", "Failed GitHub pushes")
+    failures.inc(amount=sq["total_failures"])
+    cs = product_cache.stats()
+    cache = Counter("inventory_product_cache_total", "Product cache lookups and evictions", ("result",))
+    for k in ("hits", "misses", "evictions"):
+        cache.inc(k, amount=cs[k])
+    cache_bytes = Gauge("inventory_product_cache_bytes", "Estimated memory held by cached product indexes")
+    cache_bytes.set(cs["bytes"])
+    es = events.stats()
+    streams = Gauge("inventory_event_streams", "Open product event streams")
+    streams.set(es["subscribers"])
+    dropped = Counter("inventory_event_streams_dropped_total", "Event streams dropped for falling behind")
+    dropped.inc(amount=es["dropped"])
+    return [wait, wait_max, acquired, depth, oldest, last_ok, failures, cache, cache_bytes,
+            streams, dropped]
+
+SORT_FIELDS = {"internal_name", "customer_name", "bin"}
+SEARCH_FIELDS = ["internal_name", "customer_name", "bin", "internal_code", "customer_code", "barcode"]
+
+def query_view(idx, stock=None, sort=None, q=""):
+    """
+    Return positions in ``idx`` (held through ``reading()``) of products in
+    ``stock`` bucket whose searchable fields contain ``q`` (lowercased), in
+    ``sort`` order. Each step is memoized on the ProductIndex, so a search
+    reuses the filtered+sorted list and later pages reuse the search.
+    """
+    prods = idx.products
+    if sort not in SORT_FIELDS:
+        sort = None
+
+    def base():
+        pos = idx.in_stock_bucket(stock) if stock else range(len(prods))
+        if sort:
+            pos = sorted(pos, key=lambda i: (prods[i].get(sort, "") or "").upper())
+        return list(pos)
+
+    positions = idx.view((stock, sort, ""), base)
+    if q:
+        positions = idx.view((stock, sort, q), lambda: [
+            i for i in positions
+            if any(q in str(prods[i].get(f) or "").lower() for f in SEARCH_FIELDS)])
+    return positions
+
+def get_product(warehouse, pid):
+    """The product with id ``pid``, or None."""
+    if sql_store is not None:
+        return sql_store.get_product(_products_key(warehouse), pid)[1]
+    with reading(warehouse) as idx:
+        return idx.get(pid)
+
+def duplicate_barcodes(warehouse):
+    """{barcode: [ids]} for every non-empty barcode on more than one product."""
+    if sql_store is not None:
+        return sql_store.duplicate_barcodes(_products_key(warehouse))
+    with reading(warehouse) as idx:
+        return {code: [idx.id_at(i) for i in pos] for code, pos in idx.duplicate_barcodes().items()}
+
+# products file name -> (stamp or sqlite revision, warehouse_summary() result)
+_summaries = {}
+
+def warehouse_summary(warehouse):
+    """
+    Stock counts, unbarcoded count and total qty for one warehouse, plus its
+    DASHBOARD_REORDER largest under-min shortfalls. Cached until the
+    warehouse changes; the counts themselves are maintained by ProductIndex
+    (or computed in SQL), so a refresh only reads the under-min products.
+    """
+    p = _products_path(warehouse)
+    key = _products_key(warehouse)
+    token = sql_store.revision(key) if sql_store is not None else _products_stamp(p)[0]
+    hit = _summaries.get(p.name)
+    if hit is not None and token is not None and hit[0] == token:
+        return hit[1]
+    if sql_store is not None:
+        summary = sql_store.stock_summary(key)
+        short = [(i, prod, int(prod["qty"]), int(prod["min"]))
+                 for i, prod in sql_store.shortfalls(key, DASHBOARD_REORDER)]
+    else:
+        with reading(warehouse) as idx:
+            summary = idx.summary()
+            short = [(i, idx.products[i], qty, mn) for i, qty, mn in idx.shortfalls(DASHBOARD_REORDER)]
+    summary["warehouse"] = warehouse
+    summary["reorder"] = [{
+        "warehouse": warehouse, "id": prod.get("id"),
+        "internal_name": prod.get("internal_name", ""), "customer_name": prod.get("customer_name", ""),
+        "internal_code": prod.get("internal_code", ""), "bin": prod.get("bin", ""),
+        "qty": qty, "min": mn, "max": prod.get("max", 0), "short": mn - qty,
+    } for _, prod, qty, mn in short]
+    _summaries[p.name] = (token, summary)
+    return summary
+
+def dashboard(limit=100):
+    """Per-warehouse summaries, their totals, and the ``limit`` largest shortfalls overall."""
+    rows = [warehouse_summary(w["name"]) for w in load_warehouses()]
+    fields = ["products", "under_min", "over_max", "optimal", "unbarcoded", "total_qty"]
+    totals = {f: sum(r[f] for r in rows) for f in fields}
+    reorder = heapq.nlargest(limit, (x for r in rows for x in r["reorder"]), key=lambda x: x["short"])
+    return {
+        "warehouses": [{k: v for k, v in r.items() if k != "reorder"} for r in rows],
+        "totals": totals,
+        "reorder": reorder,
+    }
 
 # ---------- Routes ----------
+def _pull_data():
+    # downloads happen unlocked; each file is swapped in under its own write lock
+    pulled = github.pull_all(DATA_DIR, skip=_has_unpushed_changes)
+    for f in pulled:
+        sync_queue.synced_as(f.name, github.remote_sha(f))
+    if sql_store is not None:
+        for f in pulled:
+            try:
+                if sql_store.import_json_file(f):
+                    # the remote file predates product IDs: send the ids back
+                    _sql_exports.add(f.name)
+                    schedule_sync(f)
+            except Exception as e:
+                print("[SYNC] import of pulled file failed:", f.name, e)
+
+def pull_data():
+    """
+    Login pull. In MULTI_PROCESS mode workers take turns, and a pull any
+    worker finished within PULL_MIN_INTERVAL seconds counts for all.
+    """
+    if not MULTI_PROCESS:
+        return _pull_data()
+    last = SHARED_DIR / "last_pull"
+    with flocked(SHARED_DIR / "pull.lock"):
+        try:
+            if time.time() - last.stat().st_mtime < PULL_MIN_INTERVAL:
+                return
+        except FileNotFoundError:
+            pass
+        try:
+            _pull_data()
+        finally:
+            last.touch()
+
 @app.route("/", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
@@ -133,10 +1158,7 @@ def login():
         allowed = load_users()
         if username in allowed:
             session["user"] = username
-            def pull():
-                with data_lock:
-                    github.pull_all(DATA_DIR)
-            threading.Thread(target=pull, daemon=True).start()
+            threading.Thread(target=pull_data, daemon=True).start()
             return redirect(url_for("warehouses"))
         flash("Unauthorized user.", "error")
         return redirect(url_for("login"))
@@ -153,13 +1175,26 @@ def sync_now():
         return redirect(url_for("login"))
 
     def push_all():
-        with data_lock:
-            files = [p for p in DATA_DIR.glob("*") if p.is_file()]
-        for f in files:
-            try:
-                github.push_file(f)
-            except Exception as e:
-                print("[SYNC] push failed:", e)
+        if PRODUCT_JOURNAL:
+            compact_journals()
+        if sql_store is not None:
+            sql_store.export_warehouses_json(WAREHOUSES_FILE)
+            for key in sql_store.product_keys():
+                sql_store.export_products_json(key, DATA_DIR / f"products_{key}.json")
+            _sql_exports.clear()
+        # only what is marked dirty or differs from the last push
+        dirty = sync_queue.recover(_data_files())
+        if not dirty:
+            return
+        if MULTI_PROCESS:
+            for name in dirty:
+                sync_queue.mark(name)  # the elected pusher takes it from here
+            return
+        try:
+            push_batch([DATA_DIR / name for name in dirty])
+        except Exception as e:
+            print("[SYNC] push failed:", e)
+            sync_queue.failed(e)
 
     threading.Thread(target=push_all, daemon=True).start()
     flash("Sync started.", "ok")
@@ -195,11 +1230,20 @@ def warehouses():
                 whs2 = [w for w in whs if w["name"].lower() != name.lower()]
                 if len(whs2) != len(whs):
                     save_warehouses(whs2)
-                    # also delete products file
+                    # also delete products file, under its lock so no edit
+                    # lands in (or recreates) it half-way through
                     p = _products_path(name)
-                    if p.exists():
-                        p.unlink()
-                        schedule_sync(p)  # push deletion (will become a 404 on GitHub; ok)
+                    with locks.write(p.name):
+                        _journal_for(p).clear()
+                        _journal_state.pop(p.name, None)
+                        _summaries.pop(p.name, None)
+                        if sql_store is not None:
+                            sql_store.delete_products(_products_key(name))
+                            _sql_exports.discard(p.name)
+                        for f in (p, _snapshot_path(p)):
+                            f.unlink(missing_ok=True)
+                        product_cache.invalidate(p.name)
+                    schedule_sync(p)  # pushed as a deletion
                     flash("Warehouse deleted.", "ok")
                 else:
                     flash("Warehouse not found.", "error")
@@ -217,197 +1261,439 @@ def warehouse_home(name):
         return redirect(url_for("warehouses"))
     return render_template("warehouse.html", warehouse=name)
 
+def _dashboard_limit():
+    try:
+        return max(0, int(request.args.get("limit") or 100))
+    except ValueError:
+        return 100
+
+@app.route("/dashboard")
+def dashboard_page():
+    if not require_login():
+        return redirect(url_for("login"))
+    return render_template("dashboard.html", **dashboard(_dashboard_limit()))
+
+@app.get("/api/dashboard")
+def api_dashboard():
+    """Cross-warehouse stock summary; ?limit= caps the combined reorder list."""
+    if not require_login():
+        return jsonify({"error": "auth"}), 401
+    return jsonify(dashboard(_dashboard_limit()))
+
 # ----- Products UI -----
+@app.get("/sw.js")
+def service_worker():
+    """static/sw.js, served from the root so its scope covers every page."""
+    resp = send_from_directory(app.static_folder, "sw.js", mimetype="text/javascript")
+    resp.headers["Cache-Control"] = "no-cache"  # pick up a new worker on the next visit
+    return resp
+
 @app.route("/warehouse/<name>/products")
 def products_page(name):
     if not require_login():
         return redirect(url_for("login"))
     return render_template("products.html", warehouse=name)
 
+def conditional(name, view):
+    """
+    Serve ``view()`` with an ETag built from the warehouse revision and the
+    query string, or an empty 304 if the client's If-None-Match already has it.
+    """
+    etag = f"{warehouse_revision(name)}-{zlib.crc32(request.query_string):08x}"
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = make_response(view())
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"  # always revalidate, then reuse on 304
+    return resp
+
 # ----- Products API (CRUD + query) -----
+def _encode_cursor(version, offset):
+    return f"{version}.{offset}"
+
+def _decode_cursor(cursor):
+    """Return (version, offset) from a cursor, or (None, 0) if it is malformed."""
+    try:
+        version, offset = cursor.split(".", 1)
+        return int(version), max(0, int(offset))
+    except Exception:
+        return None, 0
+
 @app.get("/api/warehouse/<name>/products")
 def api_list_products(name):
+    """
+    List products. Optional query args:
+      stock   'under_min' | 'over_max' | 'optimal'
+      sort    'internal_name' | 'customer_name' | 'bin'
+      q       case-insensitive substring of names, codes, bin or barcode
+      fields  comma-separated keys to return per product (``id`` and
+              ``version`` always come along)
+      limit / offset, or cursor (the previous page's next_cursor); limit
+              must be at least 1 and is capped at LIST_MAX_LIMIT
+    Without limit the whole (filtered) list is returned. ``revision`` is
+    the warehouse revision to pass to /products/changes later.
+    """
     if not require_login():
         return jsonify({"error": "auth"}), 401
-    prods = load_products(name)
-    # Filters
+    return conditional(name, lambda: _list_products(name))
+
+def _list_products(name):
     stock = request.args.get("stock")  # 'under_min' | 'over_max' | 'optimal' | None
-    if stock:
-        prods = [p for p in prods if stock_bucket(p) == stock]
-    # Sorting
     sort = request.args.get("sort")  # 'internal_name' | 'customer_name' | 'bin'
-    if sort in {"internal_name", "customer_name", "bin"}:
-        prods = sorted(prods, key=lambda x: (x.get(sort, "") or "").upper())
-    return jsonify({"products": prods})
+    q = (request.args.get("q") or "").strip().lower()
+    fields = [f for f in (request.args.get("fields") or "").split(",") if f]
+    if fields:
+        fields = ["id", "version"] + [f for f in fields if f not in ("id", "version")]
+    try:
+        limit = int(request.args["limit"]) if request.args.get("limit") else None
+        offset = max(0, int(request.args.get("offset") or 0))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    if limit is not None:
+        if limit < 1:
+            return jsonify({"error": "limit must be at least 1"}), 400
+        limit = min(limit, LIST_MAX_LIMIT)
+    cursor_version = None
+    if request.args.get("cursor"):
+        cursor_version, offset = _decode_cursor(request.args["cursor"])
+
+    if sql_store is not None:
+        version = sql_store.revision(_products_key(name))
+        total, rows = sql_store.query_page(_products_key(name), stock, sort, q, offset, limit)
+    else:
+        with reading(name) as idx:
+            positions = query_view(idx, stock, sort, q)
+            version = idx.revision
+            total = len(positions)
+            page = positions[offset:] if limit is None else positions[offset:offset + limit]
+            rows = [(i, idx.products[i]) for i in page]
+
+    prods = [p for _, p in rows]
+    if fields:
+        prods = [{k: p.get(k) for k in fields} for p in prods]
+    end = offset + len(rows)
+    return jsonify({
+        "products": prods,
+        "total": total,
+        "revision": version,
+        "offset": offset,
+        "limit": limit,
+        "next_cursor": _encode_cursor(version, end) if limit is not None and end < total else None,
+        # the list changed since the cursor was issued; pages may have shifted
+        "stale": cursor_version is not None and cursor_version != version,
+    })
+
+@app.get("/api/warehouse/<name>/products/changes")
+def api_product_changes(name):
+    """
+    Products changed and ids of products deleted since revision ``since``.
+    ``reset`` means the server cannot answer incrementally (too old, bulk
+    import, SQLite backend): refetch the list.
+    """
+    if not require_login():
+        return jsonify({"error": "auth"}), 401
+    since = request.args.get("since", type=int)
+    if since is None:
+        return jsonify({"error": "since=<revision> required"}), 400
+    if sql_store is not None:
+        return jsonify({"revision": warehouse_revision(name), "reset": True})
+    with reading(name) as idx:
+        rev = idx.revision
+        delta = idx.changes_since(since)
+        if delta is None:
+            return jsonify({"revision": rev, "reset": True})
+        changed, deleted = delta
+        changed = [idx.products[i] for i in changed]
+    return jsonify({
+        "revision": rev,
+        "reset": False,
+        "changed": changed,
+        "deleted": deleted,
+    })
+
+@app.get("/api/warehouse/<name>/events")
+def api_product_events(name):
+    """
+    Server-Sent Events: one ``data`` event per saved change, shaped like
+    publish_changes/publish_reset, after a ``hello`` event carrying the
+    current revision. Refused with a 503 once this process has
+    SSE_MAX_STREAMS open, so streams can't take every request thread.
+    """
+    if not require_login():
+        return jsonify({"error": "auth"}), 401
+    if events.stats()["subscribers"] >= SSE_MAX_STREAMS:
+        return jsonify({"error": "too many live streams, poll /products/changes"}), 503, {"Retry-After": "60"}
+    first = {"revision": warehouse_revision(name)}
+    # in MULTI_PROCESS mode other workers' saves are only seen by polling the revision
+    poll = (lambda: warehouse_revision(name)) if MULTI_PROCESS else None
+    stream = events.stream(_products_path(name).name, first, poll=poll)
+    return app.response_class(stream, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # don't let a proxy buffer the stream
+    })
+
+def _change_response(res):
+    if res.get("ok"):
+        return jsonify(res)
+    res = dict(res)
+    status = res.pop("status")
+    return jsonify(res), status
 
 @app.post("/api/warehouse/<name>/products")
 def api_add_product(name):
+    """Add a product; the response carries it with its new ``id`` and ``version``."""
     if not require_login():
         return jsonify({"error": "auth"}), 401
-    body = request.json or {}
-    required = ["internal_name", "customer_name"]
-    if not all(body.get(k) for k in required):
-        return jsonify({"error": "internal_name and customer_name are required"}), 400
-    prods = load_products(name)
     # basic identity rule: internal_name + customer_name unique combo
-    if any((p.get("internal_name","").strip().lower(), p.get("customer_name","").strip().lower()) ==
-           (body["internal_name"].strip().lower(), body["customer_name"].strip().lower()) for p in prods):
-        return jsonify({"error": "product already exists"}), 409
-    # normalize
-    newp = {
-        "internal_name": body["internal_name"].strip(),
-        "customer_name": body["customer_name"].strip(),
-        "internal_code": body.get("internal_code","").strip(),
-        "customer_code": body.get("customer_code","").strip(),
-        "bin": body.get("bin","").strip(),
-        "qty": int(body.get("qty") or 0),
-        "min": int(body.get("min") or 0),
-        "max": int(body.get("max") or 0),
-        "barcode": (body.get("barcode") or "").strip(),
-        "updated_at": int(time.time()),
-    }
-    prods.append(newp)
-    save_products(name, prods)
-    return jsonify({"ok": True})
+    return _change_response(change_product(name, {"op": "add", "product": request.json or {}}))
 
-@app.put("/api/warehouse/<name>/products/<int:index>")
-def api_update_product(name, index):
+@app.get("/api/warehouse/<name>/products/<pid>")
+def api_get_product(name, pid):
     if not require_login():
         return jsonify({"error": "auth"}), 401
-    prods = load_products(name)
-    if index < 0 or index >= len(prods):
+    p = get_product(name, pid)
+    if p is None:
         return jsonify({"error": "not found"}), 404
+    return jsonify({"product": p})
+
+@app.put("/api/warehouse/<name>/products/<pid>")
+def api_update_product(name, pid):
+    """
+    Update the fields in the body. With ``version`` (the one the client last
+    saw) the update is refused with 409 and the current product if anyone
+    changed it since. The barcode is saved regardless of other products
+    already using it; those are reported as ``duplicates`` (ids).
+    """
+    if not require_login():
+        return jsonify({"error": "auth"}), 401
     body = request.json or {}
-    # selectively update fields
-    for k in ["internal_name", "customer_name", "internal_code", "customer_code",
-              "bin", "barcode"]:
-        if k in body:
-            prods[index][k] = (body.get(k) or "").strip()
-    for k in ["qty", "min", "max"]:
-        if k in body and body[k] is not None:
-            try:
-                prods[index][k] = int(body[k])
-            except Exception:
-                pass
-    prods[index]["updated_at"] = int(time.time())
-    save_products(name, prods)
-    return jsonify({"ok": True})
+    if not isinstance(body, dict):
+        return jsonify({"error": "invalid fields"}), 400
+    return _change_response(change_product(name, {
+        "op": "update", "id": pid, "version": body.get("version"), "fields": body}))
 
-@app.delete("/api/warehouse/<name>/products/<int:index>")
-def api_delete_product(name, index):
+@app.delete("/api/warehouse/<name>/products/<pid>")
+def api_delete_product(name, pid):
+    """Delete a product; ``?version=`` makes it conditional like an update."""
     if not require_login():
         return jsonify({"error": "auth"}), 401
-    prods = load_products(name)
-    if 0 <= index < len(prods):
-        prods.pop(index)
-        save_products(name, prods)
-        return jsonify({"ok": True})
-    return jsonify({"error": "not found"}), 404
+    return _change_response(change_product(name, {
+        "op": "delete", "id": pid, "version": request.args.get("version", type=int)}))
+
+@app.post("/api/warehouse/<name>/products/batch")
+def api_product_batch(name):
+    """
+    Body: {"ops": [{"op": "add", "product": {...}}
+                   | {"op": "update", "id": pid, "version": v, "fields": {...}}
+                   | {"op": "delete", "id": pid, "version": v}],
+           "atomic": false}
+    ``version`` is optional (see api_update_product). An added product may
+    bring its own new ``id`` (pages queue adds while offline); an id already
+    in use fails with 409 and that product. Each op gets a result; with
+    ``atomic`` the first failing op rolls the whole batch back (409).
+    """
+    if not require_login():
+        return jsonify({"error": "auth"}), 401
+    body = request.json or {}
+    ops = body.get("ops") if isinstance(body, dict) else None
+    if not isinstance(ops, list) or not ops:
+        return jsonify({"error": "ops required"}), 400
+    if len(ops) > BATCH_MAX_OPS:
+        return jsonify({"error": f"at most {BATCH_MAX_OPS} ops per batch"}), 400
+    results, applied = apply_product_batch(name, ops, atomic=bool(body.get("atomic")))
+    resp = {"ok": all(r.get("ok") for r in results), "results": results,
+            "applied": applied or 0, "revision": warehouse_revision(name)}
+    if applied is None:
+        resp["rolled_back"] = True
+        return jsonify(resp), 409
+    return jsonify(resp)
 
 @app.get("/api/warehouse/<name>/by_barcode")
 def api_find_by_barcode(name):
     if not require_login():
         return jsonify({"error": "auth"}), 401
     code = (request.args.get("code") or "").strip()
-    prods = load_products(name)
-    for i, p in enumerate(prods):
-        if (p.get("barcode") or "").strip() == code:
-            return jsonify({"index": i, "product": p})
-    return jsonify({"index": None, "product": None})
+    if sql_store is not None:
+        _, p = sql_store.find_by_barcode(_products_key(name), code)
+        dupes = sql_store.barcode_ids(_products_key(name), code)[1:] if p is not None else []
+    else:
+        with reading(name) as idx:
+            hits = idx.find_barcode(code)
+            p = idx.products[hits[0]] if hits else None
+            dupes = [idx.id_at(i) for i in hits[1:]]
+    resp = {"id": p["id"] if p is not None else None, "product": p}
+    if dupes:
+        resp["duplicates"] = dupes
+    return jsonify(resp)
+
+@app.get("/api/warehouse/<name>/duplicates")
+def api_duplicate_barcodes(name):
+    if not require_login():
+        return jsonify({"error": "auth"}), 401
+    return jsonify({"duplicates": duplicate_barcodes(name)})
 
 @app.get("/api/warehouse/<name>/unbarcoded")
 def api_unbarcoded(name):
     if not require_login():
         return jsonify({"error": "auth"}), 401
-    prods = load_products(name)
-    items = [(i, p) for i, p in enumerate(prods) if not (p.get("barcode") or "").strip()]
+    return conditional(name, lambda: _unbarcoded(name))
+
+def _unbarcoded(name):
+    if sql_store is not None:
+        items = list(sql_store.iter_products(_products_key(name), barcoded=False))
+    else:
+        with reading(name) as idx:
+            items = [idx.products[i] for i in idx.find_barcode("")]
     # sort by BIN desc alpha
-    items.sort(key=lambda x: (x[1].get("bin","") or "").upper(), reverse=True)
-    return jsonify({"items": [{"index": i, "product": p} for i, p in items]})
+    items.sort(key=lambda p: (p.get("bin","") or "").upper(), reverse=True)
+    return jsonify({"items": items})
+
+@app.get("/api/cache/stats")
+def api_cache_stats():
+    if not require_login():
+        return jsonify({"error": "auth"}), 401
+    return jsonify(product_cache.stats())
+
+@app.get("/metrics")
+def metrics_endpoint():
+    if METRICS_TOKEN:
+        if request.headers.get("Authorization", "") != f"Bearer {METRICS_TOKEN}":
+            return jsonify({"error": "auth"}), 401
+    elif not require_login():
+        return jsonify({"error": "auth"}), 401
+    return make_response(metrics.render(), 200,
+                         {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+@app.post("/api/scan_timings")
+def api_scan_timings():
+    """
+    Timings of one snapshot decode, from the page's decode worker:
+    {"prepare_ms": t, "passes": [{"pass": "raw", "ms": t, "hit": false}, ...],
+     "pass": the pass that found the code or null, "engine": "native" | "zxing" | null}.
+    Recorded in the inventory_scan_* metrics to tune the pass order; unknown
+    pass names are ignored.
+    """
+    if not require_login():
+        return jsonify({"error": "auth"}), 401
+    body = request.json or {}
+    if not isinstance(body, dict):
+        return jsonify({"error": "invalid timings"}), 400
+    try:
+        if body.get("prepare_ms") is not None:
+            SCAN_PASS_SECONDS.observe(max(0.0, float(body["prepare_ms"])) / 1000, "prepare", "")
+        for t in (body.get("passes") or [])[:len(SCAN_PASSES)]:
+            if t.get("pass") in SCAN_PASSES:
+                SCAN_PASS_SECONDS.observe(max(0.0, float(t["ms"])) / 1000, t["pass"],
+                                          "hit" if t.get("hit") else "miss")
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return jsonify({"error": "invalid timings"}), 400
+    won = body.get("pass") if body.get("pass") in SCAN_PASSES else "none"
+    engine = body.get("engine") if body.get("engine") in ("native", "zxing") else "none"
+    SCAN_SNAPSHOTS.inc(won, engine)
+    return "", 204
+
+@app.get("/api/sync/stats")
+def api_sync_stats():
+    if not require_login():
+        return jsonify({"error": "auth"}), 401
+    stats = sync_queue.stats()
+    with _lock:
+        stats["in_memory"] = len(_pending)
+        stats["exports_due"] = len(_exports_due)
+    stats["github"] = github.stats()
+    return jsonify(stats)
+
+@app.get("/api/locks/stats")
+def api_lock_stats():
+    if not require_login():
+        return jsonify({"error": "auth"}), 401
+    return jsonify(locks.stats())
 
 # ----- Import -----
+# Uploads are spooled to a temp file and merged by a background job (see
+# utils/csv_import.py); the import page polls /api/import/<job_id>.
+import_jobs = ImportJobs(shared_dir=SHARED_DIR / "import_jobs" if MULTI_PROCESS else None)
+
+def _import_index(name):
+    """
+    ProductIndex the import plan is built against (read-only): a private
+    copy, since building the plan takes as long as the upload does.
+    """
+    if sql_store is None:
+        with reading(name) as idx:
+            return idx.copy()
+    return ProductIndex(load_products(name))
+
+def _commit_import(name, plan):
+    """
+    Merge ``plan`` into the warehouse under its write lock, so no edit made
+    while the plan was built is lost, on a private copy of the index (as an
+    atomic batch is), so a plan failing half-way leaves nothing behind.
+    """
+    p = _products_path(name)
+    if sql_store is not None:
+        with locks.write(p.name):
+            prods = load_products(name)
+            plan.apply(prods, ProductIndex(prods), int(time.time()))
+            save_products(name, prods)
+        return
+    base = load_index(name)
+    with locks.write(p.name):
+        idx = _index_for_write(p, base).copy()
+        plan.apply(idx.products, idx, int(time.time()))
+        _replace_index(p, idx)
+    schedule_sync(p)
+    publish_reset(p, idx.revision)
+
+def start_import(name, path: Path, dry_run=False):
+    job = import_jobs.add(ImportJob(name, path, dry_run))
+    threading.Thread(
+        target=run_import, daemon=True,
+        args=(job, lambda: _import_index(name), lambda plan: _commit_import(name, plan)),
+    ).start()
+    return job
+
 @app.route("/warehouse/<name>/import", methods=["GET", "POST"])
 def import_page(name):
     if not require_login():
         return redirect(url_for("login"))
     if request.method == "POST":
+        wants_json = request.accept_mimetypes.best == "application/json"
         f = request.files.get("csvfile")
         if not f:
+            if wants_json:
+                return jsonify({"error": "CSV file required."}), 400
             flash("CSV file required.", "error")
             return redirect(url_for("import_page", name=name))
-        data = f.read()
-        try:
-            text = data.decode("utf-8-sig")
-        except Exception:
-            text = data.decode("latin-1")
-        reader = csv.DictReader(io.StringIO(text))
-        required = {"Internal Product Name", "Customer Product Name"}
-        headers = {h.strip(): h for h in reader.fieldnames or []}
-        if not required.issubset(headers.keys()):
-            flash("CSV must include 'Internal Product Name' and 'Customer Product Name'.", "error")
+        fd, tmp = tempfile.mkstemp(prefix="import-", suffix=".csv")
+        os.close(fd)
+        tmp = Path(tmp)
+        f.save(str(tmp))  # copied in chunks, never held in memory whole
+        raw, _, headers = open_csv(tmp)
+        raw.close()
+        if not REQUIRED_HEADERS.issubset(headers.keys()):
+            tmp.unlink()
+            msg = "CSV must include 'Internal Product Name' and 'Customer Product Name'."
+            if wants_json:
+                return jsonify({"error": msg}), 400
+            flash(msg, "error")
             return redirect(url_for("import_page", name=name))
+        job = start_import(name, tmp, dry_run=request.form.get("dry_run") == "1")
+        if wants_json:
+            return jsonify(job.as_dict()), 202
+        return redirect(url_for("import_page", name=name, job=job.id))
 
-        prods = load_products(name)
-        # index by unique key (internal+customer name)
-        idx = { (p.get("internal_name","").lower(), p.get("customer_name","").lower()): i for i,p in enumerate(prods) }
-
-        def get(row, key):
-            return (row.get(headers.get(key,"")) or "").strip()
-
-        up_count = 0
-        add_count = 0
-        for row in reader:
-            iname = get(row, "Internal Product Name")
-            cname = get(row, "Customer Product Name")
-            if not iname or not cname:
-                continue
-            key = (iname.lower(), cname.lower())
-            payload = {
-                "internal_name": iname,
-                "customer_name": cname,
-                "internal_code": get(row, "Internal Product Code"),
-                "customer_code": get(row, "Customer Product Code"),
-                "bin": get(row, "Bin"),
-                "barcode": get(row, "Barcode"),
-            }
-            for kcsv, k in [("Qty","qty"), ("Min","min"), ("Max","max")]:
-                v = get(row, kcsv)
-                try:
-                    payload[k] = int(v) if v != "" else None
-                except Exception:
-                    payload[k] = None
-
-            if key in idx:
-                i = idx[key]
-                # merge non-empty fields
-                for k in ["internal_code","customer_code","bin","barcode"]:
-                    if payload[k]:
-                        prods[i][k] = payload[k]
-                for k in ["qty","min","max"]:
-                    if payload[k] is not None:
-                        prods[i][k] = payload[k]
-                prods[i]["updated_at"] = int(time.time())
-                up_count += 1
-            else:
-                prods.append({
-                    "internal_name": iname,
-                    "customer_name": cname,
-                    "internal_code": payload["internal_code"],
-                    "customer_code": payload["customer_code"],
-                    "bin": payload["bin"],
-                    "qty": int(payload["qty"] or 0),
-                    "min": int(payload["min"] or 0),
-                    "max": int(payload["max"] or 0),
-                    "barcode": payload["barcode"],
-                    "updated_at": int(time.time()),
-                })
-                add_count += 1
-
-        save_products(name, prods)
-        flash(f"Import complete. Added {add_count}, updated {up_count}.", "ok")
-        return redirect(url_for("products_page", name=name))
-
-    return render_template("import.html", warehouse=name)
+    return render_template("import.html", warehouse=name, job=request.args.get("job", ""))
+
+@app.get("/api/import/<job_id>")
+def api_import_status(job_id):
+    if not require_login():
+        return jsonify({"error": "auth"}), 401
+    job = import_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(job.as_dict())
 
 # ----- Export -----
 @app.route("/warehouse/<name>/export")
@@ -416,12 +1702,16 @@ def export_page(name):
         return redirect(url_for("login"))
     return render_template("export.html", warehouse=name)
 
-def _export_csv_stream(rows, filename="export.csv"):
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Internal Product Name","Customer Product Name",
-                     "Internal Product Code","Customer Product Code",
-                     "Bin","Qty","Min","Max","Barcode"])
+EXPORT_HEADER = ["Internal Product Name","Customer Product Name",
+                 "Internal Product Code","Customer Product Code",
+                 "Bin","Qty","Min","Max","Barcode"]
+EXPORT_CHUNK = 64 * 1024  # bytes of CSV buffered before each yield
+
+def _csv_chunks(rows):
+    """Yield the export CSV as UTF-8 chunks of about EXPORT_CHUNK bytes."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_HEADER)
     for p in rows:
         writer.writerow([
             p.get("internal_name",""), p.get("customer_name",""),
@@ -429,29 +1719,100 @@ def _export_csv_stream(rows, filename="export.csv"):
             p.get("bin",""), p.get("qty",0), p.get("min",0), p.get("max",0),
             p.get("barcode","")
         ])
-    mem = io.BytesIO(output.getvalue().encode("utf-8"))
-    mem.seek(0)
-    return send_file(mem, mimetype="text/csv", as_attachment=True, download_name=filename)
+        if buf.tell() >= EXPORT_CHUNK:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+def _gzip_chunks(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 -> gzip container
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+def _export_csv_stream(rows, filename="export.csv"):
+    """
+    Stream ``rows`` (any iterable of products) as a CSV download without
+    materializing the file. gzip=1 compresses on the fly when the client
+    accepts it.
+    """
+    chunks = _csv_chunks(rows)
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if request.args.get("gzip") == "1" and "gzip" in request.accept_encodings:
+        chunks = _gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return app.response_class(chunks, mimetype="text/csv", headers=headers)
+
+def export_rows(warehouse, stock=None, bin_prefix="", barcoded=None, sort=None):
+    """
+    Iterate products matching every given filter: stock bucket, bin starting
+    with ``bin_prefix`` (case-insensitive), and barcoded True/False.
+    """
+    if sql_store is not None:
+        return sql_store.iter_products(_products_key(warehouse), stock, bin_prefix, barcoded, sort)
+    with reading(warehouse) as idx:
+        positions = query_view(idx, stock, sort)
+        keep = None
+        if bin_prefix:
+            prefix = bin_prefix.strip().upper()
+            keep = set()
+            for b, pos in idx.by_bin.items():
+                if b.startswith(prefix):
+                    keep |= pos
+        if barcoded is not None:
+            unbarcoded = set(idx.find_barcode(""))
+            if barcoded:
+                positions = (i for i in positions if i not in unbarcoded)
+            else:
+                keep = unbarcoded if keep is None else keep & unbarcoded
+        if keep is not None:
+            positions = (i for i in positions if i in keep)
+        # taken under the lock: positions shift once it is released
+        return [idx.products[i] for i in positions]
+
+@app.get("/warehouse/<name>/export.csv")
+def export_csv(name):
+    """
+    Parameterized export: stock=under_min|over_max|optimal, bin=<prefix>,
+    barcoded=1|0, sort=internal_name|customer_name|bin, gzip=1.
+    """
+    stock = request.args.get("stock") or None
+    if stock not in (None, "under_min", "over_max", "optimal"):
+        return jsonify({"error": "unknown stock bucket"}), 400
+    bin_prefix = (request.args.get("bin") or "").strip()
+    barcoded = {"1": True, "0": False}.get(request.args.get("barcoded"))
+    sort = request.args.get("sort")
+    parts = [secure_filename(name), stock or "all"]
+    if bin_prefix:
+        parts.append("bin-" + secure_filename(bin_prefix))
+    if barcoded is not None:
+        parts.append("barcoded" if barcoded else "unbarcoded")
+    return conditional(name, lambda: _export_csv_stream(
+        export_rows(name, stock, bin_prefix, barcoded, sort), "_".join(parts) + ".csv"))
 
 @app.get("/warehouse/<name>/export/all.csv")
 def export_all(name):
-    prods = load_products(name)
-    return _export_csv_stream(prods, f"{secure_filename(name)}_all.csv")
+    return conditional(name, lambda: _export_csv_stream(
+        export_rows(name), f"{secure_filename(name)}_all.csv"))
 
 @app.get("/warehouse/<name>/export/under_min.csv")
 def export_under_min(name):
-    prods = [p for p in load_products(name) if stock_bucket(p) == "under_min"]
-    return _export_csv_stream(prods, f"{secure_filename(name)}_under_min.csv")
+    return conditional(name, lambda: _export_csv_stream(
+        export_rows(name, "under_min"), f"{secure_filename(name)}_under_min.csv"))
 
 @app.get("/warehouse/<name>/export/over_max.csv")
 def export_over_max(name):
-    prods = [p for p in load_products(name) if stock_bucket(p) == "over_max"]
-    return _export_csv_stream(prods, f"{secure_filename(name)}_over_max.csv")
+    return conditional(name, lambda: _export_csv_stream(
+        export_rows(name, "over_max"), f"{secure_filename(name)}_over_max.csv"))
 
 @app.get("/warehouse/<name>/export/optimal.csv")
 def export_optimal(name):
-    prods = [p for p in load_products(name) if stock_bucket(p) == "optimal"]
-    return _export_csv_stream(prods, f"{secure_filename(name)}_optimal.csv")
+    return conditional(name, lambda: _export_csv_stream(
+        export_rows(name, "optimal"), f"{secure_filename(name)}_optimal.csv"))
 
 # Start
 if __name__ == "__main__":
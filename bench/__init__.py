@@ -0,0 +1 @@
+"""Benchmark harness: ``python -m bench.run --help``."""
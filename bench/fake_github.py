@@ -0,0 +1,61 @@
+import threading
+import time
+from pathlib import Path
+
+from utils.github_sync import git_blob_sha
+
+
+class FakeGithubSync:
+    """
+    Stand-in for utils.github_sync.GithubSync that keeps "remote" files in
+    memory. ``latency`` seconds are slept per simulated API round trip so
+    sync work competes with requests the way it would against GitHub.
+    """
+    def __init__(self, *args, latency=0.0, locks=None, **kwargs):
+        self.latency = latency
+        self.locks = locks
+        self.remote = {}  # file name -> blob sha
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "pushed": 0, "skipped": 0, "commits": 0, "conflicts": 0}
+
+    def _round_trip(self, n=1):
+        self.counters["requests"] += n
+        if self.latency:
+            time.sleep(self.latency * n)
+
+    def enabled(self):
+        return True
+
+    def remote_sha(self, local_file: Path):
+        with self._lock:
+            return self.remote.get(local_file.name)
+
+    def push_files(self, local_files, message=None):
+        changed = {}
+        for f in local_files:
+            try:
+                sha = git_blob_sha(f.read_bytes())
+            except FileNotFoundError:
+                sha = None
+            if self.remote.get(f.name) != sha:
+                changed[f.name] = sha
+            else:
+                self.counters["skipped"] += 1
+        if changed:
+            self._round_trip(5)  # ref, commit, tree, commit, ref update
+            with self._lock:
+                for name, sha in changed.items():
+                    if sha:
+                        self.remote[name] = sha
+                    else:
+                        self.remote.pop(name, None)
+            self.counters["commits"] += 1
+            self.counters["pushed"] += len(changed)
+        return list(changed)
+
+    def pull_all(self, local_dir: Path, skip=None):
+        self._round_trip()
+        return []
+
+    def stats(self):
+        return dict(self.counters, cached_shas=len(self.remote))
@@ -0,0 +1,216 @@
+"""
+Load test of the multi-process mode (MULTI_PROCESS=1) over real HTTP.
+
+For each worker count in --workers it copies a generated dataset, starts
+that many bench.serve processes on one shared listening socket, and has
+--clients client processes (each one keep-alive connection, logged in
+through the login form) issue a read-heavy mix of listing, search,
+barcode lookups and edits for --duration seconds. Throughput and latency
+per worker count are printed as JSON (or written to --out):
+
+    python -m bench.load --workers 1,2,4 --skus 10000 --clients 8
+
+Scaling with workers needs as many free cores; the meta block records how
+many the machine has.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+from pathlib import Path
+
+from bench import synth
+from bench.run import REPO, summarize
+
+
+def start_workers(n, work, args):
+    """Start ``n`` bench.serve processes sharing one socket; returns (port, procs)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(128)
+    sock.set_inheritable(True)
+    env = dict(os.environ)
+    env.pop("GITHUB_TOKEN", None)
+    env.update({
+        "MULTI_PROCESS": "1",
+        "DATA_DIR": str(work / "data"),
+        "SHARED_DIR": str(work / "shared"),
+        "SQLITE_PATH": str(work / "inventory.db"),
+        "SYNC_QUEUE_PATH": str(work / "sync_queue.json"),
+        "STORAGE_BACKEND": args.backend,
+        "PRODUCT_FORMAT": args.format,
+        "SECRET_KEY": "bench-load",
+        "PYTHONPATH": str(REPO) + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    cmd = [sys.executable, "-m", "bench.serve", "--fd", str(sock.fileno()),
+           "--github-latency", str(args.github_latency)]
+    procs = [subprocess.Popen(cmd, env=env, cwd=REPO, pass_fds=(sock.fileno(),))
+             for _ in range(n)]
+    port = sock.getsockname()[1]
+    sock.close()  # the workers hold their own copies
+    deadline = time.time() + 60
+    while True:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                break
+        except OSError:
+            pass
+        if time.time() > deadline or any(p.poll() is not None for p in procs):
+            stop_workers(procs)
+            raise RuntimeError("workers did not start")
+        time.sleep(0.2)
+    return port, procs
+
+
+def stop_workers(procs):
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        try:
+            p.wait(10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+def login(conn):
+    """POST the login form; returns the session cookie."""
+    body = urllib.parse.urlencode({"username": "JMH"})
+    conn.request("POST", "/", body=body, headers={"Content-Type": "application/x-www-form-urlencoded"})
+    r = conn.getresponse()
+    r.read()
+    cookie = r.getheader("Set-Cookie") or ""
+    if r.status != 302 or not cookie:
+        raise RuntimeError(f"login failed: {r.status}")
+    return cookie.split(";", 1)[0]
+
+
+def client(port, names, skus, duration, seed):
+    """One client: a keep-alive connection issuing the mix until ``duration`` is up."""
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    headers = {"Cookie": login(conn)}
+    lat, errors = {}, 0
+    stop = time.perf_counter() + duration
+    while time.perf_counter() < stop:
+        api = f"/api/warehouse/{rng.choice(names)}"
+        r = rng.random()
+        body, hdrs = None, headers
+        if r < 0.4:
+            op, method, url = "list", "GET", f"{api}/products?limit=100&offset={rng.randrange(0, skus, 100)}"
+        elif r < 0.6:
+            op, method, url = "search", "GET", f"{api}/products?limit=100&q={rng.choice(synth.WORDS)}"
+        elif r < 0.85:
+            op, method, url = "by_barcode", "GET", f"{api}/by_barcode?code={400000000000 + rng.randrange(skus):012d}"
+        else:
+            op, method, url = "update", "PUT", f"{api}/products/{synth.product_id(rng.randrange(skus))}"
+            body = json.dumps({"qty": rng.randrange(50)})
+            hdrs = dict(headers, **{"Content-Type": "application/json"})
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, url, body=body, headers=hdrs)
+            resp = conn.getresponse()
+            resp.read()
+            failed = resp.status >= 400
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            failed = True
+        lat.setdefault(op, []).append(time.perf_counter() - t0)
+        errors += failed
+    conn.close()
+    return lat, errors
+
+
+def run_workers(n, source, names, args):
+    """One load run against ``n`` workers on a fresh copy of ``source``."""
+    work = Path(tempfile.mkdtemp(prefix=f"inventory-load-{n}-"))
+    try:
+        shutil.copytree(source, work / "data")
+        if args.backend == "sqlite":
+            from utils.sqlite_store import migrate_from_json
+            migrate_from_json(work / "data", work / "inventory.db")
+        port, procs = start_workers(n, work, args)
+        try:
+            with multiprocessing.Pool(args.clients) as pool:
+                t0 = time.perf_counter()
+                out = pool.starmap(client, [(port, names, args.skus, args.duration, args.seed + k)
+                                            for k in range(args.clients)])
+                wall = time.perf_counter() - t0
+        finally:
+            stop_workers(procs)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    lat = {}
+    for mine, _ in out:
+        for op, xs in mine.items():
+            lat.setdefault(op, []).extend(xs)
+    rows = [summarize(f"load_{op}", args.skus, xs, wall, workers=n, clients=args.clients)
+            for op, xs in sorted(lat.items())]
+    rows.append(summarize("load_all", args.skus, [x for xs in lat.values() for x in xs], wall,
+                          workers=n, clients=args.clients, errors=sum(e for _, e in out)))
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--workers", default="1,2,4", help="comma-separated worker process counts")
+    ap.add_argument("--skus", type=int, default=10000, help="SKUs per warehouse")
+    ap.add_argument("--warehouses", type=int, default=2)
+    ap.add_argument("--clients", type=int, default=8, help="concurrent client processes")
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds of load per worker count")
+    ap.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    ap.add_argument("--format", choices=["json", "compact"], default="json",
+                    help="PRODUCT_FORMAT for the JSON backend")
+    ap.add_argument("--github-latency", type=float, default=0.0, help="seconds per fake GitHub call")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path, help="write JSON results here instead of stdout")
+    args = ap.parse_args(argv)
+    counts = [int(s) for s in args.workers.split(",") if s.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="inventory-load-") as tmp:
+        source = Path(tmp) / "data"
+        names = synth.make_dataset(source, args.skus, args.warehouses, seed=args.seed, prefix="LOAD_")
+        results = []
+        for n in counts:
+            rows = run_workers(n, source, names, args)
+            for r in rows:
+                print(f"{r['scenario']:<18} workers={n:<3} n={r['n']:<6} p50={r['p50_ms']}ms "
+                      f"p99={r['p99_ms']}ms {r['ops_per_s']}/s", file=sys.stderr)
+            results += rows
+
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                             capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = ""
+    doc = {
+        "meta": {
+            "timestamp": int(time.time()), "git_rev": rev, "python": platform.python_version(),
+            "platform": platform.platform(), "cpus": os.cpu_count(), "backend": args.backend,
+            "format": args.format, "skus": args.skus, "warehouses": args.warehouses,
+            "clients": args.clients, "duration": args.duration,
+        },
+        "results": results,
+    }
+    text = json.dumps(doc, indent=2)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Benchmark the app end to end through Flask's test client.
+
+For each size in --sizes it generates --warehouses synthetic warehouses,
+then times load_products (cold and warm), the product listing (first page,
+search, filter), barcode lookup, single and batch edits, a CSV import and
+the CSV export, and finally a mixed read/write load from --clients
+concurrent clients. GitHub is replaced by bench.fake_github.
+
+Results are printed as JSON (or written to --out) so runs can be compared:
+
+    python -m bench.run --sizes 1000,100000 --warehouses 2 --out bench.json
+    python -m bench.run --sizes 10000 --backend sqlite --clients 8
+    python -m bench.run --sizes 100000 --format compact
+
+--max-edit-ms fails the run (exit status 1) when a single edit, alone or
+as part of a batch, has a p50 above it. Edits should cost the same at any
+warehouse size, so a run over a large one with --journal guards that:
+
+    python -m bench.run --sizes 100000 --journal --clients 0 --max-edit-ms 25
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from bench import synth
+from bench.fake_github import FakeGithubSync
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(name, skus, latencies, wall=None, **extra):
+    """One result row: percentiles in ms plus throughput over ``wall`` seconds."""
+    lat = sorted(latencies)
+    n = len(lat)
+
+    def pct(q):
+        return round(lat[min(n - 1, int(q * n))] * 1000, 3) if n else None
+    wall = wall if wall is not None else sum(lat)
+    row = {
+        "scenario": name, "skus": skus, "n": n,
+        "p50_ms": pct(0.50), "p90_ms": pct(0.90), "p99_ms": pct(0.99),
+        "max_ms": round(lat[-1] * 1000, 3) if n else None,
+        "mean_ms": round(sum(lat) / n * 1000, 3) if n else None,
+        "ops_per_s": round(n / wall, 1) if wall else None,
+    }
+    row.update(extra)
+    return row
+
+
+def edit_ms(row):
+    """p50 of one edit in an edit scenario's row (per op for batches), or None."""
+    if row["scenario"] == "update_one":
+        return row["p50_ms"]
+    if row["scenario"] == "batch_update":
+        return round(row["p50_ms"] / row["ops_per_request"], 3)
+    return None
+
+
+def timed(fn, reps):
+    out = []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def client_for(app):
+    c = app.test_client()
+    with c.session_transaction() as s:
+        s["user"] = "JMH"
+    return c
+
+
+def check(resp, *ok):
+    if resp.status_code not in (ok or (200,)):
+        raise RuntimeError(f"{resp.request.path} -> {resp.status_code}: {resp.get_data(as_text=True)[:200]}")
+    return resp
+
+
+def run_size(A, skus, names, args, rng):
+    """All single-client scenarios for one dataset size."""
+    c = client_for(A.app)
+    wh = names[0]
+    api = f"/api/warehouse/{wh}"
+    reps = args.reps
+    rows = []
+
+    def cold():
+        A.product_cache.invalidate()
+        A.load_products(wh)
+    rows.append(summarize("load_products_cold", skus, timed(cold, max(1, reps // 10))))
+    rows.append(summarize("load_products_warm", skus, timed(lambda: A.load_products(wh), reps)))
+
+    rows.append(summarize("list_first_page", skus, timed(
+        lambda: check(c.get(f"{api}/products?limit=100")), reps)))
+    rows.append(summarize("list_search", skus, timed(
+        lambda: check(c.get(f"{api}/products?limit=100&q={rng.choice(synth.WORDS)}%20{rng.randrange(10)}")),
+        reps)))
+    rows.append(summarize("list_filter_sort", skus, timed(
+        lambda: check(c.get(f"{api}/products?limit=100&stock={rng.choice(['under_min', 'over_max', 'optimal'])}"
+                            f"&sort={rng.choice(['internal_name', 'customer_name', 'bin'])}")), reps)))
+    rows.append(summarize("by_barcode", skus, timed(
+        lambda: check(c.get(f"{api}/by_barcode?code={400000000000 + rng.randrange(skus):012d}")), reps)))
+
+    rows.append(summarize("update_one", skus, timed(
+        lambda: check(c.put(f"{api}/products/{synth.product_id(rng.randrange(skus))}",
+                            json={"qty": rng.randrange(50)})),
+        max(1, reps // 5))))
+    batch = args.batch_ops
+    rows.append(summarize("batch_update", skus, timed(
+        lambda: check(c.post(f"{api}/products/batch", json={"ops": [
+            {"op": "update", "id": synth.product_id(rng.randrange(skus)), "fields": {"qty": rng.randrange(50)}}
+            for _ in range(batch)]})), max(1, reps // 10)), ops_per_request=batch))
+
+    def export():
+        r = check(c.get(f"/warehouse/{wh}/export/all.csv"))
+        return sum(len(chunk) for chunk in r.response)
+    size = export()
+    rows.append(summarize("export_all_csv", skus, timed(export, max(1, reps // 10)), bytes=size))
+
+    import_rows = min(args.import_rows or skus, skus)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = synth.write_import_csv(Path(tmp) / "import.csv", import_rows, existing=skus)
+        lat = []
+        for dry in (True, False):
+            with open(path, "rb") as f:
+                t0 = time.perf_counter()
+                r = check(c.post(f"/warehouse/{wh}/import", data={"csvfile": (f, "import.csv"),
+                                                                 **({"dry_run": "1"} if dry else {})},
+                                 headers={"Accept": "application/json"},
+                                 content_type="multipart/form-data"), 202)
+            job = r.get_json()["id"]
+            while True:
+                st = c.get(f"/api/import/{job}").get_json()
+                if st["state"] in ("done", "error"):
+                    break
+                time.sleep(0.01)
+            if st["state"] == "error":
+                raise RuntimeError(f"import failed: {st['error']}")
+            lat.append(time.perf_counter() - t0)
+            rows.append(summarize("import_dry_run" if dry else "import", skus, lat[-1:],
+                                  rows=import_rows, rows_per_s=round(import_rows / lat[-1], 1)))
+    return rows
+
+
+def run_concurrent(A, skus, names, args, seed):
+    """--clients threads issuing a read-heavy mix for --duration seconds."""
+    lat = {}
+    errors = [0]
+    lock = threading.Lock()
+    stop = time.perf_counter() + args.duration
+
+    def worker(k):
+        rng = random.Random(seed + k)
+        c = client_for(A.app)
+        mine = {}
+        while time.perf_counter() < stop:
+            wh = rng.choice(names)
+            api = f"/api/warehouse/{wh}"
+            r = rng.random()
+            if r < 0.4:
+                op, call = "list", lambda: c.get(f"{api}/products?limit=100&offset={rng.randrange(0, skus, 100)}")
+            elif r < 0.6:
+                op, call = "search", lambda: c.get(f"{api}/products?limit=100&q={rng.choice(synth.WORDS)}")
+            elif r < 0.85:
+                op, call = "by_barcode", lambda: c.get(f"{api}/by_barcode?code={400000000000 + rng.randrange(skus):012d}")
+            else:
+                op, call = "update", lambda: c.put(f"{api}/products/{synth.product_id(rng.randrange(skus))}",
+                                                   json={"qty": rng.randrange(50)})
+            t0 = time.perf_counter()
+            resp = call()
+            mine.setdefault(op, []).append(time.perf_counter() - t0)
+            if resp.status_code >= 400:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            for op, xs in mine.items():
+                lat.setdefault(op, []).extend(xs)
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(args.clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    rows = [summarize(f"concurrent_{op}", skus, xs, wall, clients=args.clients)
+            for op, xs in sorted(lat.items())]
+    rows.append(summarize("concurrent_all", skus, [x for xs in lat.values() for x in xs], wall,
+                          clients=args.clients, errors=errors[0]))
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", default="1000,10000", help="comma-separated SKU counts per warehouse")
+    ap.add_argument("--warehouses", type=int, default=2, help="warehouses generated per size")
+    ap.add_argument("--reps", type=int, default=50, help="repetitions of each fast scenario")
+    ap.add_argument("--batch-ops", type=int, default=100)
+    ap.add_argument("--import-rows", type=int, default=0, help="rows per CSV import (default: SKUs)")
+    ap.add_argument("--clients", type=int, default=4, help="concurrent clients (0 to skip)")
+    ap.add_argument("--duration", type=float, default=5.0, help="seconds of concurrent load per size")
+    ap.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    ap.add_argument("--journal", action="store_true", help="run with PRODUCT_JOURNAL=1")
+    ap.add_argument("--format", choices=["json", "compact"], default="json",
+                    help="PRODUCT_FORMAT for the JSON backend")
+    ap.add_argument("--github-latency", type=float, default=0.0, help="seconds per fake GitHub call")
+    ap.add_argument("--max-edit-ms", type=float, help="fail if an edit's p50 is above this")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workdir", type=Path, help="keep generated data here (default: temp dir)")
+    ap.add_argument("--out", type=Path, help="write JSON results here instead of stdout")
+    args = ap.parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    work = args.workdir or Path(tempfile.mkdtemp(prefix="inventory-bench-"))
+    data_dir = work / "data"
+    datasets = {}
+    gen_s = {}
+    for size in sizes:
+        t0 = time.perf_counter()
+        datasets[size] = synth.make_dataset(data_dir, size, args.warehouses,
+                                            seed=args.seed, prefix=f"BENCH{size}_")
+        gen_s[size] = round(time.perf_counter() - t0, 3)
+
+    # the app reads its configuration at import time
+    os.environ.update({
+        "DATA_DIR": str(data_dir),
+        "SQLITE_PATH": str(work / "inventory.db"),
+        "SYNC_QUEUE_PATH": str(work / "sync_queue.json"),
+        "STORAGE_BACKEND": args.backend,
+        "PRODUCT_JOURNAL": "1" if args.journal else "0",
+        "PRODUCT_FORMAT": args.format,
+    })
+    os.environ.pop("GITHUB_TOKEN", None)
+    if args.backend == "sqlite":
+        from utils.sqlite_store import migrate_from_json
+        migrate_from_json(data_dir, work / "inventory.db")
+    import utils.github_sync
+    utils.github_sync.GithubSync = lambda *a, **k: FakeGithubSync(*a, latency=args.github_latency, **k)
+    import app as A
+
+    rng = random.Random(args.seed)
+    results = []
+    for size in sizes:
+        rows = run_size(A, size, datasets[size], args, rng)
+        if args.clients:
+            rows += run_concurrent(A, size, datasets[size], args, args.seed)
+        for r in rows:
+            r["peak_rss_mb"] = peak_rss_mb()
+            print(f"{r['scenario']:<24} {size:>8} n={r['n']:<5} p50={r['p50_ms']}ms "
+                  f"p99={r['p99_ms']}ms {r['ops_per_s']}/s", file=sys.stderr)
+        results += rows
+
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                             capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = ""
+    doc = {
+        "meta": {
+            "timestamp": int(time.time()), "git_rev": rev, "python": platform.python_version(),
+            "platform": platform.platform(), "backend": args.backend, "journal": args.journal,
+            "format": args.format,
+            "warehouses": args.warehouses, "clients": args.clients, "generate_s": gen_s,
+        },
+        "results": results,
+        "peak_rss_mb": peak_rss_mb(),
+        "sync": A.github.stats(),
+    }
+    text = json.dumps(doc, indent=2)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    if args.max_edit_ms is not None:
+        slow = [r for r in results if (edit_ms(r) or 0) > args.max_edit_ms]
+        for r in slow:
+            print(f"too slow: {r['scenario']} at {r['skus']} SKUs takes {edit_ms(r)}ms per edit "
+                  f"(limit {args.max_edit_ms}ms)", file=sys.stderr)
+        if slow:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Serve the app on an inherited listening socket, with GitHub replaced by
+bench.fake_github. bench.load starts several of these on one socket, the
+way a pre-fork server (gunicorn -w N) shares its listener between workers.
+
+    python -m bench.serve --fd 3
+"""
+import argparse
+
+from bench.fake_github import FakeGithubSync
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--fd", type=int, required=True, help="listening socket inherited from the parent")
+    ap.add_argument("--github-latency", type=float, default=0.0, help="seconds per fake GitHub call")
+    args = ap.parse_args(argv)
+
+    # the app reads its configuration (from the environment) at import time
+    import utils.github_sync
+    utils.github_sync.GithubSync = lambda *a, **k: FakeGithubSync(*a, latency=args.github_latency, **k)
+    import app as A
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    make_server("127.0.0.1", 0, A.app, threaded=True, fd=args.fd,
+                request_handler=QuietHandler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Synthetic warehouse data: products_<wh>.json files and CSV imports of any
+size, generated deterministically from a seed and written streaming so a
+million-SKU file never has to exist in memory.
+
+    python -m bench.synth <data_dir> --skus 100000 --warehouses 4
+"""
+import argparse
+import csv
+import json
+import random
+import time
+from pathlib import Path
+
+BINS = [f"{a}{r:02d}" for a in "ABCDEFGH" for r in range(1, 41)]
+WORDS = ["Bolt", "Nut", "Washer", "Bracket", "Hinge", "Valve", "Gasket", "Spring",
+         "Bearing", "Clamp", "Fitting", "Seal", "Pin", "Rivet", "Screw", "Spacer"]
+IMPORT_HEADER = ["Internal Product Name", "Customer Product Name", "Internal Product Code",
+                 "Customer Product Code", "Bin", "Qty", "Min", "Max", "Barcode"]
+
+
+def product_id(i):
+    """The ``id`` of product #i, so benchmarks can address products without listing them."""
+    return f"{i:016x}"
+
+
+def make_product(i, rng):
+    """Product #i; about 1 in 10 has no barcode and 1 in 200 shares one."""
+    word = WORDS[i % len(WORDS)]
+    lo = rng.randint(0, 20)
+    r = rng.random()
+    if r < 0.1:
+        barcode = ""
+    elif r < 0.105:
+        barcode = f"{rng.randint(0, 999):012d}"  # deliberate duplicates
+    else:
+        barcode = f"{400000000000 + i:012d}"
+    return {
+        "id": product_id(i),
+        "version": 1,
+        "internal_name": f"{word} {i:07d}",
+        "customer_name": f"Cust {word} {i:07d}",
+        "internal_code": f"IC-{i:07d}",
+        "customer_code": f"CC-{i:07d}",
+        "bin": rng.choice(BINS),
+        "qty": rng.randint(0, 60),
+        "min": lo,
+        "max": lo + rng.randint(5, 40),
+        "barcode": barcode,
+        "updated_at": int(time.time()) - rng.randint(0, 86400 * 90),
+    }
+
+
+def write_products(path: Path, n, seed=0):
+    """Write a products_<wh>.json with ``n`` products, in the app's layout."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"products": [')
+        for i in range(n):
+            if i:
+                f.write(",")
+            f.write(json.dumps(make_product(i, rng)))
+        f.write("]}")
+    return path
+
+
+def write_import_csv(path: Path, n, seed=1, existing=0, update_ratio=0.5):
+    """
+    Write an import CSV of ``n`` rows: roughly ``update_ratio`` of them hit
+    the first ``existing`` products (same names as write_products), the rest
+    are new SKUs.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(IMPORT_HEADER)
+        for j in range(n):
+            if existing and rng.random() < update_ratio:
+                i = rng.randrange(existing)
+            else:
+                i = existing + j
+            p = make_product(i, rng)
+            w.writerow([p["internal_name"], p["customer_name"], p["internal_code"],
+                        p["customer_code"], p["bin"], p["qty"], p["min"], p["max"], p["barcode"]])
+    return path
+
+
+def make_dataset(data_dir: Path, skus, warehouses, seed=0, prefix="BENCH"):
+    """
+    Write ``warehouses`` product files of ``skus`` products each and add them
+    to data_dir/warehouses.json. Returns the warehouse names.
+    """
+    data_dir.mkdir(parents=True, exist_ok=True)
+    names = [f"{prefix}{k}" for k in range(warehouses)]
+    wfile = data_dir / "warehouses.json"
+    try:
+        whs = json.loads(wfile.read_text(encoding="utf-8")).get("warehouses", [])
+    except (OSError, ValueError):
+        whs = []
+    known = {w["name"] for w in whs}
+    now = int(time.time())
+    whs += [{"name": n, "created_at": now} for n in names if n not in known]
+    wfile.write_text(json.dumps({"warehouses": whs}, indent=2), encoding="utf-8")
+    users = data_dir / "users.txt"
+    if not users.exists():
+        users.write_text("JMH\n", encoding="utf-8")
+    for k, name in enumerate(names):
+        write_products(data_dir / f"products_{name}.json", skus, seed + k)
+    return names
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("data_dir", type=Path)
+    ap.add_argument("--skus", type=int, default=10000)
+    ap.add_argument("--warehouses", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--csv", type=Path, help="also write an import CSV here")
+    args = ap.parse_args(argv)
+    make_dataset(args.data_dir, args.skus, args.warehouses, args.seed)
+    if args.csv:
+        write_import_csv(args.csv, args.skus, existing=args.skus)
+
+
+if __name__ == "__main__":
+    main()
@@ -83,6 +83,7 @@ function avgErr(res){
   return s/errs.length;
 }
 function hardStop(targetSel){
+  cancelSnapshot();
   try{ Quagga.offDetected(); Quagga.offProcessed(); Quagga.stop(); }catch(_){}
   if (_watchdogTimer){ clearTimeout(_watchdogTimer); _watchdogTimer = null; }
   if (_liveLoopTimer){ clearTimeout(_liveLoopTimer); _liveLoopTimer = null; }
@@ -569,82 +570,85 @@ function stopMass(hide){
   if (hide) qs("#massModal")?.classList.add("hidden");
 }
 
-// ---- Snapshot decoder (multi-pass) ------------------------------------------
+// ---- Snapshot decoder (multi-pass, in a worker) -------------------------------
+// static/decode-worker.js tries the passes in SNAPSHOT_PASSES order on one
+// frame, handed over as a transferable (an ImageBitmap, or its RGBA buffer
+// without OffscreenCanvas) so nothing is copied and the page stays
+// responsive. Where the worker cannot decode, the raw frame is tried here.
+// Per-pass timings go to /api/scan_timings (inventory_scan_* in /metrics).
+const SNAPSHOT_PASSES = ["raw", "threshold", "invert", "sharpen"];
+let _decodeWorker = null;  // false once it failed to start
+let _decodeSeq = 0;
+const _decodeWaiting = new Map();  // request id -> resolve
+function decodeWorker(){
+  if (_decodeWorker === null){
+    try{
+      _decodeWorker = new Worker("/static/decode-worker.js");
+      _decodeWorker.onmessage = (e)=>{
+        const resolve = _decodeWaiting.get(e.data.id);
+        if (resolve){ _decodeWaiting.delete(e.data.id); resolve(e.data); }
+      };
+      _decodeWorker.onerror = (e)=>{
+        console.warn("decode worker failed", e.message);
+        _decodeWorker = false;
+        for (const [id, resolve] of _decodeWaiting) resolve({id, error: "worker failed"});
+        _decodeWaiting.clear();
+      };
+    }catch(_){ _decodeWorker = false; }
+  }
+  return _decodeWorker || null;
+}
+function cancelSnapshot(){
+  if (_decodeWorker) _decodeWorker.postMessage({cancel: true});
+}
+async function decodeInWorker(worker, v, sym){
+  const id = ++_decodeSeq, width = v.videoWidth, height = v.videoHeight;
+  let msg;
+  if (typeof OffscreenCanvas === "function" && typeof createImageBitmap === "function"){
+    msg = {id, sym, width, height, passes: SNAPSHOT_PASSES, bitmap: await createImageBitmap(v)};
+  } else {
+    const ctx = frameCanvas(v).getContext("2d");
+    msg = {id, sym, width, height, passes: SNAPSHOT_PASSES, rgba: ctx.getImageData(0, 0, width, height).data.buffer};
+  }
+  return new Promise(resolve=>{
+    _decodeWaiting.set(id, resolve);
+    worker.postMessage(msg, [msg.bitmap || msg.rgba]);
+  });
+}
+function frameCanvas(v){
+  const canvas = document.createElement("canvas");
+  canvas.width = v.videoWidth; canvas.height = v.videoHeight;
+  canvas.getContext("2d", { willReadFrequently: true }).drawImage(v, 0, 0, canvas.width, canvas.height);
+  return canvas;
+}
 async function snapshotDecode(e, targetSel){
   if (e) e.preventDefault();
   const v = qs(`${targetSel} video`);
   if (!v || !v.videoWidth) { alert("Camera not ready yet."); return; }
 
-  const canvas = document.createElement("canvas");
-  canvas.width = v.videoWidth; canvas.height = v.videoHeight;
-  const ctx = canvas.getContext("2d", { willReadFrequently: true });
-  ctx.drawImage(v, 0, 0, canvas.width, canvas.height);
-
-  const sym = (qs("#symbology")?.value) || (qs("#inlineSymbology")?.value) || (qs("#massSymbology")?.value) || "code128";
-  const passes = [
-    img => img,                               // raw
-    img => threshold(img, 160),               // thresholded
-    img => invert(img),                       // inverted
-    img => unsharp(img, 0.6, 1)               // slight sharpen
-  ];
-
-  for (const pass of passes){
-    const processed = pass(canvas);
-    const code = await decodeCanvas(processed, sym);
-    if (code){ routeSnapshotCode(code); return; }
-  }
+  const symSel = (targetSel==="#scanner")? "#symbology" : (targetSel==="#inline-view")? "#inlineSymbology" : "#massSymbology";
+  const sym = qs(symSel)?.value || "code128";
+  const worker = decodeWorker();
+  const res = worker ? await decodeInWorker(worker, v, sym).catch(err=>({error: String(err)}))
+                     : {error: "no worker"};
+  if (res.cancelled) return;  // scanner closed, or a newer snapshot took over
+  let code = res.code;
+  if (res.error) code = await decodeCanvas(frameCanvas(v), sym);
+  else reportScanTimings(res);
+  if (code){ routeSnapshotCode(code); return; }
   alert("No barcode detected in snapshot. Try zoom/flash, or move closer.");
 }
-function threshold(c, t){
-  const ctx = c.getContext("2d");
-  const img = ctx.getImageData(0,0,c.width,c.height);
-  const d = img.data;
-  for(let i=0;i<d.length;i+=4){
-    const g = 0.299*d[i]+0.587*d[i+1]+0.114*d[i+2];
-    const v = g < t ? 0 : 255;
-    d[i]=d[i+1]=d[i+2]=v;
-  }
-  ctx.putImageData(img,0,0); return c;
-}
-function invert(c){
-  const ctx = c.getContext("2d");
-  const img = ctx.getImageData(0,0,c.width,c.height);
-  const d = img.data;
-  for(let i=0;i<d.length;i+=4){
-    d[i]=255-d[i]; d[i+1]=255-d[i+1]; d[i+2]=255-d[i+2];
-  }
-  ctx.putImageData(img,0,0); return c;
-}
-function unsharp(c, amount=0.6, radius=1){
-  const ctx = c.getContext("2d");
-  const img = ctx.getImageData(0,0,c.width,c.height);
-  const d = img.data, out = new Uint8ClampedArray(d.length);
-  const w=c.width,h=c.height, idx=(x,y)=>((y*w+x)<<2);
-  for(let y=1;y<h-1;y++){
-    for(let x=1;x<w-1;x++){
-      let r=0,g=0,b=0;
-      for(let yy=-1;yy<=1;yy++){
-        for(let xx=-1;xx<=1;xx++){
-          const i = idx(x+xx,y+yy);
-          r+=d[i]; g+=d[i+1]; b+=d[i+2];
-        }
-      }
-      const i2 = idx(x,y);
-      const br=r/9, bg=g/9, bb=b/9;
-      out[i2]   = clamp(d[i2]   + (d[i2]   - br)*amount);
-      out[i2+1] = clamp(d[i2+1] + (d[i2+1] - bg)*amount);
-      out[i2+2] = clamp(d[i2+2] + (d[i2+2] - bb)*amount);
-      out[i2+3] = d[i2+3];
-    }
-  }
-  for(let i=0;i<d.length;i++) d[i]=out[i]||d[i];
-  ctx.putImageData(img,0,0); return c;
+function reportScanTimings(res){
+  apiPost("/api/scan_timings", {
+    prepare_ms: res.prepare_ms, passes: res.timings, pass: res.pass, engine: res.engine
+  }).catch(()=>{});
 }
-function clamp(v){ return v<0?0:(v>255?255:v); }
+// One detector/reader per symbology, reused across snapshots.
+const _snapDetectors = {}, _snapReaders = {};
 async function decodeCanvas(canvas, sym){
   if (supportsNative()){
     try{
-      const det = new window.BarcodeDetector({ formats: buildFormats(sym) });
+      const det = _snapDetectors[sym] || (_snapDetectors[sym] = new window.BarcodeDetector({ formats: buildFormats(sym) }));
       const res = await det.detect(canvas);
       if (res && res[0] && res[0].rawValue) return String(res[0].rawValue).trim();
     }catch(_){}
@@ -652,7 +656,7 @@ async function decodeCanvas(canvas, sym){
   if (window.ZXing){
     try{
       const Z = window.ZXing;
-      const reader = new Z.BrowserMultiFormatReader(buildZXHints(sym));
+      const reader = _snapReaders[sym] || (_snapReaders[sym] = new Z.BrowserMultiFormatReader(buildZXHints(sym)));
       const res = await reader.decodeFromCanvas(canvas);
       if (res && res.getText) return String(res.getText()).trim();
     }catch(_){}
@@ -678,6 +682,127 @@ function routeSnapshotCode(code){
   }
 }
 
+// ===== Offline support =========================================================
+// static/sw.js caches the page shell; the products page keeps a copy of its
+// warehouse in IndexedDB (below) so lookups and edits work without a network.
+if ("serviceWorker" in navigator && isSecure()){
+  navigator.serviceWorker.register("/sw.js").catch(err=>console.warn("service worker not registered", err));
+}
+
+// Database "invent": per warehouse, every product (store "products", keyed
+// [wh, id] and indexed by [wh, barcode]), the revision that copy is at
+// ("meta"), and changes made offline in the order they were made ("outbox").
+const IDB_NAME = "invent", IDB_VERSION = 1;
+let _idb = null;
+function openDb(){
+  if (_idb) return _idb;
+  _idb = new Promise((resolve, reject)=>{
+    if (!("indexedDB" in window)) return reject(new Error("IndexedDB unavailable"));
+    const req = indexedDB.open(IDB_NAME, IDB_VERSION);
+    req.onupgradeneeded = ()=>{
+      const db = req.result;
+      db.createObjectStore("products", {keyPath: ["wh", "id"]}).createIndex("barcode", ["wh", "barcode"]);
+      db.createObjectStore("meta", {keyPath: "wh"});
+      db.createObjectStore("outbox", {autoIncrement: true}).createIndex("wh", "wh");
+    };
+    req.onsuccess = ()=>resolve(req.result);
+    req.onerror = ()=>reject(req.error);
+  });
+  return _idb;
+}
+function idbRequest(req){
+  return new Promise((resolve, reject)=>{ req.onsuccess = ()=>resolve(req.result); req.onerror = ()=>reject(req.error); });
+}
+function idbDone(tx){
+  return new Promise((resolve, reject)=>{ tx.oncomplete = ()=>resolve(); tx.onerror = tx.onabort = ()=>reject(tx.error); });
+}
+async function idbStore(name, mode="readonly"){
+  return (await openDb()).transaction(name, mode).objectStore(name);
+}
+
+// Products are stored as {wh, id, barcode, p}.
+function whRange(wh){ return IDBKeyRange.bound([wh, ""], [wh, "\uffff"]); }
+async function replicaRevision(wh){
+  const m = await idbRequest((await idbStore("meta")).get(wh));
+  return m ? m.revision : null;
+}
+async function replicaAll(wh){
+  return (await idbRequest((await idbStore("products")).getAll(whRange(wh)))).map(r=>r.p);
+}
+async function replicaGet(wh, id){
+  const r = await idbRequest((await idbStore("products")).get([wh, id]));
+  return r ? r.p : null;
+}
+async function replicaByBarcode(wh, code){
+  return (await idbRequest((await idbStore("products")).index("barcode").getAll([wh, code]))).map(r=>r.p);
+}
+// One transaction: optionally drop the whole warehouse, store `put`, remove
+// the ids in `del`, and record `revision` if given.
+async function replicaApply(wh, {clear=false, put=[], del=[], revision=null}={}){
+  const tx = (await openDb()).transaction(["products", "meta"], "readwrite");
+  const store = tx.objectStore("products");
+  if (clear) store.delete(whRange(wh));
+  for (const p of put) store.put({wh, id: p.id, barcode: (p.barcode || "").trim(), p});
+  for (const id of del) store.delete([wh, id]);
+  if (revision != null) tx.objectStore("meta").put({wh, revision});
+  return idbDone(tx);
+}
+
+// Outbox entries are {wh, op}, op being a /products/batch op. Without
+// IndexedDB (some private modes) they are kept in memory for the page's life.
+const _memOutbox = []; let _memKey = 0;
+async function outboxAdd(wh, op){
+  try{
+    const tx = (await openDb()).transaction("outbox", "readwrite");
+    tx.objectStore("outbox").add({wh, op});
+    await idbDone(tx);
+  }catch(err){
+    _memOutbox.push({key: --_memKey, wh, op});
+  }
+}
+// The first `n` entries for `wh`, oldest first, as {key, op}.
+async function outboxPeek(wh, n){
+  const out = [];
+  try{
+    const req = (await idbStore("outbox")).index("wh").openCursor(IDBKeyRange.only(wh));
+    await new Promise((resolve, reject)=>{
+      req.onsuccess = ()=>{
+        const cur = req.result;
+        if (!cur || out.length >= n) return resolve();
+        out.push({key: cur.primaryKey, op: cur.value.op});
+        cur.continue();
+      };
+      req.onerror = ()=>reject(req.error);
+    });
+  }catch(_){}
+  return out.concat(_memOutbox.filter(r=>r.wh === wh)).slice(0, n);
+}
+async function outboxRemove(keys){
+  const stored = keys.filter(k=>k > 0);
+  for (const k of keys.filter(k=>k < 0)){
+    const at = _memOutbox.findIndex(r=>r.key === k);
+    if (at >= 0) _memOutbox.splice(at, 1);
+  }
+  if (!stored.length) return;
+  const tx = (await openDb()).transaction("outbox", "readwrite");
+  for (const k of stored) tx.objectStore("outbox").delete(k);
+  return idbDone(tx);
+}
+async function outboxCount(wh){
+  let n = 0;
+  try{ n = await idbRequest((await idbStore("outbox")).index("wh").count(IDBKeyRange.only(wh))); }catch(_){}
+  return n + _memOutbox.filter(r=>r.wh === wh).length;
+}
+// A new product id chosen on the device (16 hex digits, like the server's).
+function localProductId(){
+  const b = crypto.getRandomValues(new Uint8Array(8));
+  return [...b].map(x=>x.toString(16).padStart(2, "0")).join("");
+}
+// True when a request failed for want of a connection rather than a server answer.
+function isOfflineError(err){
+  return !navigator.onLine || (err && err.request && !err.response);
+}
+
 // ===== Products page logic ====================================================
 if (window.INVENT_WAREHOUSE){
   const wh = window.INVENT_WAREHOUSE;
@@ -685,16 +810,86 @@ if (window.INVENT_WAREHOUSE){
   const stock = qs("#stock");
   const sortSel = qs("#sort");
   const search = qs("#search");
-  let data = [];
-  let filtered = [];
-  let currentIndex = null;
+  const loadMoreBtn = qs("#loadMore");
+  const emptyEl = qs("#emptyResults");
+  const PAGE_SIZE = 100;
+  const LIST_FIELDS = "internal_name,customer_name,internal_code,customer_code,bin,qty,min,max,barcode";
+  let data = [];         // products loaded so far for the current filter/sort/search
+  let nextCursor = null;
+  let revision = null;   // warehouse revision the list on screen reflects
+  let current = null;    // product open in the modal (null when adding)
+  let searchTimer = null;
+  let offlineList = false;  // showing the local copy: the server could not be reached
 
-  async function fetchProducts(){
+  // Filtering, search, sorting and paging all happen server-side; `more`
+  // appends the next page instead of starting over.
+  async function fetchProducts(more=false){
     const params = new URLSearchParams();
     if (stock.value) params.set("stock", stock.value);
     if (sortSel.value) params.set("sort", sortSel.value);
-    const {data: resp} = await apiGet(`/api/warehouse/${encodeURIComponent(wh)}/products?`+params.toString());
-    data = resp.products || [];
+    const s = (search.value||"").trim();
+    if (s) params.set("q", s);
+    params.set("fields", LIST_FIELDS);
+    params.set("limit", PAGE_SIZE);
+    if (more && nextCursor) params.set("cursor", nextCursor);
+    let resp;
+    try{
+      ({data: resp} = await apiGet(`/api/warehouse/${encodeURIComponent(wh)}/products?`+params.toString()));
+    }catch(err){
+      if (isOfflineError(err)) return showLocal();
+      throw err;
+    }
+    if (more && resp.stale) return fetchProducts(false); // list changed under us; start over
+    if (offlineList){ offlineList = false; updatePending(); }
+    data = more ? data.concat(resp.products || []) : (resp.products || []);
+    nextCursor = resp.next_cursor || null;
+    revision = resp.revision;
+    render();
+  }
+
+  // Offline: filter, sort and search the local copy the way the server does
+  // (unsorted, products come in id order rather than list order).
+  const SEARCH_FIELDS = ["internal_name", "customer_name", "bin", "internal_code", "customer_code", "barcode"];
+  function cmp(x, y){ return x < y ? -1 : x > y ? 1 : 0; }
+  function stockBucket(p){
+    const qty = +p.qty||0, mn=+p.min||0, mx=+p.max||0;
+    return qty < mn ? "under_min" : qty > mx ? "over_max" : "optimal";
+  }
+  async function showLocal(){
+    let prods = [];
+    try{ prods = await replicaAll(wh); }catch(_){}
+    const s = (search.value||"").trim().toLowerCase(), key = sortSel.value;
+    if (stock.value) prods = prods.filter(p=>stockBucket(p) === stock.value);
+    if (key) prods.sort((a, b)=>cmp((a[key]||"").toUpperCase(), (b[key]||"").toUpperCase()));
+    if (s) prods = prods.filter(p=>SEARCH_FIELDS.some(f=>String(p[f] ?? "").toLowerCase().includes(s)));
+    data = prods; nextCursor = null; revision = null; offlineList = true;
+    render(); updatePending();
+  }
+
+  // After an edit, ask only for what changed since `revision` and patch the
+  // cards in place (products are matched by id). Anything that could reorder
+  // or refilter the list (filters/sort/search, products not on screen)
+  // falls back to a fresh fetch.
+  async function syncChanges(){
+    if (revision == null) return fetchProducts();
+    let resp;
+    try{
+      ({data: resp} = await apiGet(`/api/warehouse/${encodeURIComponent(wh)}/products/changes?since=${revision}`));
+    }catch(err){
+      if (isOfflineError(err)) return;
+      throw err;
+    }
+    if (resp.reset) return fetchProducts();
+    const filtered = stock.value || sortSel.value || (search.value||"").trim();
+    const gone = new Set(resp.deleted || []);
+    const patched = data.filter(p => !gone.has(p.id));
+    for (const p of resp.changed || []){
+      const at = patched.findIndex(x => x.id === p.id);
+      if (at >= 0 && !filtered){ patched[at] = p; continue; }
+      if (at < 0 && !filtered && !nextCursor){ patched.push(p); continue; }
+      return fetchProducts();
+    }
+    data = patched; revision = resp.revision;
     render();
   }
   function statusBadge(p){
@@ -703,14 +898,8 @@ if (window.INVENT_WAREHOUSE){
     if (qty > mx) return `<span class="badge high">Over Max</span>`;
     return `<span class="badge ok">Optimal</span>`;
   }
-  function render(){
-    const s = (search.value||"").trim().toLowerCase();
-    filtered = data.filter(p => {
-      if (!s) return true;
-      return [p.internal_name,p.customer_name,p.bin,p.internal_code,p.customer_code,p.barcode]
-        .some(v => (v||"").toLowerCase().includes(s));
-    });
-    listEl.innerHTML = filtered.map((p,i)=>`
+  function cardHtml(p, i){
+    return `
       <div class="inv-card" onclick="openProduct(${i})">
         <div class="inv-head">
           <i class="ti ti-package"></i>
@@ -724,26 +913,235 @@ if (window.INVENT_WAREHOUSE){
         <div class="kv">Qty: <b>${p.qty||0}</b> · Min: <b>${p.min||0}</b> · Max: <b>${p.max||0}</b></div>
         <div class="kv">Barcode: <b>${p.barcode||"—"}</b></div>
       </div>
-    `).join("");
+    `;
+  }
+  function render(){
+    listEl.innerHTML = data.map(cardHtml).join("");
+    if (emptyEl) emptyEl.style.display = data.length ? "none" : "";
+    if (loadMoreBtn) loadMoreBtn.style.display = nextCursor ? "" : "none";
+  }
+  stock.addEventListener("change", ()=>fetchProducts());
+  sortSel.addEventListener("change", ()=>fetchProducts());
+  search.addEventListener("input", ()=>{
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(()=>fetchProducts(), 250);
+  });
+  window.loadMoreProducts = function(){ if (nextCursor) fetchProducts(true); };
+  // Pull the next page in when the "Load more" button scrolls into view
+  if (loadMoreBtn && "IntersectionObserver" in window){
+    new IntersectionObserver(entries=>{
+      if (entries.some(en=>en.isIntersecting)) window.loadMoreProducts();
+    }).observe(loadMoreBtn);
   }
-  stock.addEventListener("change", fetchProducts);
-  sortSel.addEventListener("change", fetchProducts);
-  search.addEventListener("input", render);
   fetchProducts();
 
+  // ---- Live updates -----------------------------------------------------------
+  // The server streams every saved change as {base, revision, changes}. If
+  // the list on screen is at `base` the changes are patched in card by card;
+  // a gap (missed events, reconnect), a bulk reset, or a change the current
+  // filter/sort/search might move falls back to syncChanges()/fetchProducts().
+  function applyLive(ev){
+    if (revision == null || ev.revision <= revision) return; // already showing it
+    if (ev.reset) return fetchProducts();
+    if (ev.base !== revision) return syncChanges();
+    const filtered = stock.value || sortSel.value || (search.value||"").trim();
+    if (filtered) return syncChanges();
+    for (const ch of ev.changes || []){
+      const at = data.findIndex(p => p.id === ch.id);
+      if (ch.op === "update"){
+        if (at < 0) continue; // not loaded yet; the next page will have it
+        data[at] = ch.product;
+        const el = listEl.children[at];
+        if (el) el.outerHTML = cardHtml(ch.product, at); else render();
+      } else if (ch.op === "add"){
+        if (nextCursor || at >= 0) continue; // on a page not fetched yet, or already shown
+        data.push(ch.product);
+        listEl.insertAdjacentHTML("beforeend", cardHtml(ch.product, data.length - 1));
+      } else if (ch.op === "delete"){
+        if (at >= 0){ data.splice(at, 1); render(); }
+      }
+    }
+    revision = ev.revision;
+    if (emptyEl) emptyEl.style.display = data.length ? "none" : "";
+  }
+  // Without a live stream (no EventSource, or the server refused one because
+  // it is at its stream limit) poll /products/changes instead.
+  const POLL_MS = 15000;
+  let liveOpen = false, pollTimer = null;
+  function startPolling(){
+    liveOpen = false;
+    if (pollTimer) return;
+    pollTimer = setInterval(()=>{ if (!document.hidden){ syncChanges(); refreshReplica(); } }, POLL_MS);
+  }
+  if ("EventSource" in window){
+    const live = new EventSource(`/api/warehouse/${encodeURIComponent(wh)}/events`);
+    let connected = false;
+    live.onmessage = (e)=>{
+      try{
+        const ev = JSON.parse(e.data);
+        applyLive(ev); liveToReplica(ev);
+      }catch(err){ console.warn("live update failed", err); }
+    };
+    // after a reconnect (e.g. we were dropped for falling behind) catch up
+    live.addEventListener("hello", ()=>{ if (connected){ syncChanges(); refreshReplica(); } connected = true; liveOpen = true; });
+    // a 503 (or any non-stream answer) closes the EventSource for good
+    live.onerror = ()=>{ if (live.readyState === EventSource.CLOSED) startPolling(); };
+    window.addEventListener("pagehide", ()=>live.close());
+  } else {
+    startPolling();
+  }
+
+  // ---- Offline copy and outbox ----------------------------------------------
+  // The IndexedDB copy of the warehouse follows the server through
+  // /products/changes and the live events; barcode lookups, the offline list
+  // and mass barcode read it. A change that cannot reach the server goes to
+  // the outbox and shows locally at once; the outbox is sent through
+  // /products/batch, OUTBOX_BATCH ops at a time, once the server answers
+  // again. Queued updates/deletes carry the version they were made on, so
+  // the server refuses (409) any that someone else's change overtook: those
+  // are reported, and the copy takes the server's product.
+  const OUTBOX_BATCH = 25, RETRY_MS = 6000;
+  let replicaRev = null;  // revision the local copy is at
+  let replicaSyncing = null, flushing = null, flushAgain = false, flushTimer = null;
+
+  function refreshReplica(){
+    if (replicaSyncing) return replicaSyncing;
+    const api = `/api/warehouse/${encodeURIComponent(wh)}/products`;
+    replicaSyncing = (async ()=>{
+      // queued changes exist only in the copy; refreshing now would undo them on screen
+      if (await outboxCount(wh)) return;
+      if (replicaRev == null) replicaRev = await replicaRevision(wh);
+      if (replicaRev != null){
+        const {data: resp} = await apiGet(`${api}/changes?since=${replicaRev}`);
+        if (!resp.reset){
+          await replicaApply(wh, {put: resp.changed || [], del: resp.deleted || [], revision: resp.revision});
+          replicaRev = resp.revision;
+          return;
+        }
+      }
+      const {data: resp} = await apiGet(api);
+      await replicaApply(wh, {clear: true, put: resp.products || [], revision: resp.revision});
+      replicaRev = resp.revision;
+    })().catch(err=>{ if (!isOfflineError(err)) console.warn("offline copy not refreshed", err); })
+      .finally(()=>{ replicaSyncing = null; });
+    return replicaSyncing;
+  }
+  function liveToReplica(ev){
+    if (replicaRev == null || ev.revision <= replicaRev) return;
+    if (ev.reset || ev.base !== replicaRev) return refreshReplica();
+    const put = [], del = [];
+    for (const ch of ev.changes || []){
+      if (ch.op === "delete") del.push(ch.id); else put.push(ch.product);
+    }
+    replicaRev = ev.revision;
+    replicaApply(wh, {put, del, revision: ev.revision}).catch(err=>console.warn("offline copy not updated", err));
+  }
+
+  // Scans resolve against the local copy with no round trip; a miss (the
+  // copy may be behind) asks the server, if there is one to ask.
+  async function lookupBarcode(code){
+    try{
+      const [hit] = await replicaByBarcode(wh, code);
+      if (hit) return hit;
+    }catch(_){}
+    try{
+      const {data: resp} = await apiGet(`/api/warehouse/${encodeURIComponent(wh)}/by_barcode?code=${encodeURIComponent(code)}`);
+      return resp.product;
+    }catch(err){
+      if (isOfflineError(err)) return null;
+      throw err;
+    }
+  }
+
+  async function queueChange(op){
+    await outboxAdd(wh, op);
+    await applyLocal(op);
+    updatePending();
+  }
+  // Show a queued op in the copy and on the page as the server will apply it.
+  async function applyLocal(op){
+    let p = null;
+    if (op.op === "add"){
+      p = Object.assign({version: 1}, op.product);
+    } else if (op.op === "update"){
+      const base = (await replicaGet(wh, op.id).catch(()=>null)) || data.find(x=>x.id === op.id) || {id: op.id};
+      p = Object.assign({}, base, op.fields, {version: op.version + 1});
+    }
+    await replicaApply(wh, p ? {put: [p]} : {del: [op.id]}).catch(err=>console.warn("offline copy not updated", err));
+    const at = data.findIndex(x=>x.id === (p ? p.id : op.id));
+    if (!p){ if (at >= 0) data.splice(at, 1); }
+    else if (at >= 0) data[at] = p;
+    else if (op.op === "add" && !nextCursor) data.push(p);
+    render();
+  }
+
+  function scheduleFlush(ms){
+    clearTimeout(flushTimer);
+    flushTimer = setTimeout(flushOutbox, ms);
+  }
+  async function flushOutbox(){
+    clearTimeout(flushTimer); flushTimer = null;
+    if (flushing){ flushAgain = true; return flushing; }
+    flushing = (async ()=>{
+      let sent = 0, refused = 0;
+      try{
+        for (let batch; (batch = await outboxPeek(wh, OUTBOX_BATCH)).length; ){
+          const {data: resp} = await apiPost(`/api/warehouse/${encodeURIComponent(wh)}/products/batch`,
+                                             {ops: batch.map(r=>r.op)});
+          // a refused op comes back with the server's product, or none (the
+          // product is gone, or the add was rejected): undo it in the copy
+          const put = [], del = [];
+          (resp.results || []).forEach((r, k)=>{
+            if (r.ok) return;
+            refused++;
+            if (r.product) put.push(r.product);
+            else del.push(batch[k].op.id || batch[k].op.product.id);
+          });
+          await outboxRemove(batch.map(r=>r.key));
+          if (put.length || del.length) await replicaApply(wh, {put, del}).catch(()=>{});
+          sent += batch.length;
+        }
+      }catch(err){
+        // no connection or a server error: keep the ops and try again later
+        if (!err.response || err.response.status >= 500) scheduleFlush(RETRY_MS);
+      }
+      if (sent){
+        if (refused) alert(`${refused} queued change(s) could not be saved (product changed or removed meanwhile).`);
+        refreshReplica(); syncChanges();
+      }
+      updatePending();
+    })();
+    await flushing; flushing = null;
+    if (flushAgain){ flushAgain = false; return flushOutbox(); }
+  }
+
+  async function updatePending(){
+    const n = await outboxCount(wh);
+    const el = qs("#offlineStatus");
+    if (el){
+      const state = offlineList ? "Offline: showing this device's copy." : !navigator.onLine ? "Offline." : "";
+      el.textContent = [state, n ? `${n} change${n === 1 ? "" : "s"} waiting to be sent.` : ""].join(" ").trim();
+    }
+    const mass = qs("#massPending");
+    if (mass) mass.textContent = n ? `${n} queued` : "";
+  }
+  window.addEventListener("online", ()=>{
+    flushOutbox().then(()=>{ refreshReplica(); if (offlineList) fetchProducts(); });
+  });
+  window.addEventListener("offline", updatePending);
+  flushOutbox().then(refreshReplica);
+
   // ---- Add / open product ---------------------------------------------------
   window.openAddProduct = function(){
-    currentIndex = null;
+    current = null;
     openModal({
       internal_name:"", customer_name:"", internal_code:"", customer_code:"",
       bin:"", qty:0, min:0, max:0, barcode:""
     });
   }
   window.openProduct = function(i){
-    const p = filtered[i];
-    const idx = data.findIndex(x => x === p);
-    currentIndex = idx;
-    openModal(p);
+    current = data[i];
+    openModal(data[i]);
   }
   function openModal(p){
     qs("#modal").classList.remove("hidden");
@@ -788,29 +1186,66 @@ if (window.INVENT_WAREHOUSE){
     }
   });
 
+  // Without a connection, saves and deletes go to the outbox instead.
   window.saveProduct = async function(e){
     e.preventDefault();
     const fd = new FormData(qs("#form-edit"));
     const obj = Object.fromEntries(fd.entries());
     ["qty","min","max"].forEach(k=>obj[k]=obj[k]===""?0:parseInt(obj[k],10));
-    if (currentIndex == null){
-      const {data:resp} = await apiPost(`/api/warehouse/${encodeURIComponent(wh)}/products`, obj);
-      if (resp.ok){ closeModal(); fetchProducts(); }
-      else alert(resp.error||"Failed");
-    } else {
-      const {data:resp} = await apiPut(`/api/warehouse/${encodeURIComponent(wh)}/products/${currentIndex}`, obj);
-      if (resp.ok){ closeModal(); fetchProducts(); }
-      else alert(resp.error||"Failed");
+    // a new product gets its id here, so queued edits to it can refer to it
+    const op = current == null
+      ? {op: "add", product: Object.assign(obj, {id: localProductId()})}
+      : {op: "update", id: current.id, version: current.version, fields: obj};
+    try{
+      if (!navigator.onLine) return queued(op);
+      if (current == null){
+        await apiPost(`/api/warehouse/${encodeURIComponent(wh)}/products`, obj);
+      } else {
+        // refused (409) if someone saved it meanwhile
+        await apiPut(`/api/warehouse/${encodeURIComponent(wh)}/products/${encodeURIComponent(current.id)}`,
+                     Object.assign({version: current.version}, obj));
+      }
+      saved();
+    }catch(err){
+      if (isOfflineError(err)) return queued(op);
+      changeFailed(err);
     }
   }
   window.deleteProduct = async function(e){
     e.preventDefault();
-    if (currentIndex==null) { closeModal(); return; }
+    if (current==null) { closeModal(); return; }
     if (!confirm("Delete this product?")) return;
     if (!confirm("Really delete? This cannot be undone.")) return;
-    const {data:resp} = await apiDel(`/api/warehouse/${encodeURIComponent(wh)}/products/${currentIndex}`);
-    if (resp.ok){ closeModal(); fetchProducts(); }
-    else alert(resp.error||"Failed");
+    const op = {op: "delete", id: current.id, version: current.version};
+    try{
+      if (!navigator.onLine) return queued(op);
+      await apiDel(`/api/warehouse/${encodeURIComponent(wh)}/products/${encodeURIComponent(current.id)}?version=${current.version}`);
+      saved();
+    }catch(err){
+      if (isOfflineError(err)) return queued(op);
+      changeFailed(err);
+    }
+  }
+  function saved(){
+    closeModal(); syncChanges();
+    if (!liveOpen) refreshReplica();  // otherwise the live event updates the copy
+  }
+  async function queued(op){
+    await queueChange(op);
+    closeModal();
+  }
+  // A 409 with a product means it changed since it was opened: show the
+  // saved version so the edit can be redone on top of it.
+  function changeFailed(err){
+    const r = err.response || {};
+    if (r.status === 409 && r.data && r.data.product){
+      alert("Someone else changed this product. Showing the saved version; please redo your change.");
+      current = r.data.product;
+      openModal(current);
+      syncChanges();
+    } else {
+      alert((r.data && r.data.error) || "Failed");
+    }
   }
 
   // ---- Scanner (modal) ------------------------------------------------------
@@ -821,12 +1256,12 @@ if (window.INVENT_WAREHOUSE){
     const eng = (qs("#engine")?.value) || "zxing";
     await startScanner("#scanner", async (code)=>{
       stopScanner(true);
-      const {data:resp} = await apiGet(`/api/warehouse/${encodeURIComponent(wh)}/by_barcode?code=${encodeURIComponent(code)}`);
-      if (resp.index == null){
+      const p = await lookupBarcode(code);
+      if (p == null){
         alert(`No product with barcode ${code}. Open a product and use 'Scan Barcode' to assign.`);
       }else{
-        currentIndex = resp.index;
-        openModal(resp.product);
+        current = p;
+        openModal(p);
       }
     }, sym, eng);
   };
@@ -847,11 +1282,10 @@ if (window.INVENT_WAREHOUSE){
   };
 
   function manualLookupWithValue(code){
-    apiGet(`/api/warehouse/${encodeURIComponent(wh)}/by_barcode?code=${encodeURIComponent(code)}`)
-      .then(({data:resp})=>{
-        if (resp.index == null) alert("No product with that barcode.");
-        else { currentIndex = resp.index; openModal(resp.product); }
-      });
+    lookupBarcode(code).then(p=>{
+      if (p == null) alert("No product with that barcode.");
+      else { current = p; openModal(p); }
+    });
   }
   window.manualLookup = function(){
     const code = qs("#manualCode").value.trim();
@@ -882,10 +1316,14 @@ if (window.INVENT_WAREHOUSE){
   window.stopInlineScanner = stopInlineScanner;
 
   // ---- Mass barcode ---------------------------------------------------------
+  // Scans go to the outbox and are sent with it: every MASS_BATCH scans,
+  // after MASS_FLUSH_MS without a scan, and on close. Offline, the list of
+  // products to label comes from the local copy.
+  const MASS_BATCH = 25, MASS_FLUSH_MS = 2000;
   let massList = []; let massPos = 0;
+  const stopMassScanner = stopMass;  // window.stopMass is wrapped below to flush the outbox
   window.openMassBarcode = async function(){
-    const {data:resp} = await apiGet(`/api/warehouse/${encodeURIComponent(wh)}/unbarcoded`);
-    massList = resp.items || []; massPos = 0;
+    massList = await unbarcoded(); massPos = 0;
     if (massList.length === 0){ alert("All products already have barcodes."); return; }
     qs("#massModal").classList.remove("hidden");
     updateMassHead();
@@ -893,18 +1331,35 @@ if (window.INVENT_WAREHOUSE){
     const eng = (qs("#massEngine")?.value) || "zxing";
     await startScanner("#massView", (code)=>assignMass(code), sym, eng);
   }
+  async function unbarcoded(){
+    try{
+      const {data:resp} = await apiGet(`/api/warehouse/${encodeURIComponent(wh)}/unbarcoded`);
+      return resp.items || [];
+    }catch(err){
+      if (!isOfflineError(err)) throw err;
+      const items = await replicaByBarcode(wh, "").catch(()=>[]);
+      return items.sort((a, b)=>cmp((b.bin||"").toUpperCase(), (a.bin||"").toUpperCase()));  // bin, descending
+    }
+  }
   function updateMassHead(){
     const cur = massList[massPos];
-    qs("#massName").textContent = cur?.product?.internal_name || "—";
-    qs("#massBin").textContent  = cur?.product?.bin || "—";
+    qs("#massName").textContent = cur?.internal_name || "—";
+    qs("#massBin").textContent  = cur?.bin || "—";
+    updatePending();
   }
   async function assignMass(code){
     const cur = massList[massPos];
-    await apiPut(`/api/warehouse/${encodeURIComponent(wh)}/products/${cur.index}`, {barcode: code});
+    if (!cur) return;
     massPos++;
+    await queueChange({op: "update", id: cur.id, version: cur.version, fields: {barcode: code}});
+    if (await outboxCount(wh) >= MASS_BATCH) flushOutbox();
+    else scheduleFlush(MASS_FLUSH_MS);
     if (massPos >= massList.length){
-      stopMass(true); alert("Mass barcode assignment complete.");
-      fetchProducts(); return;
+      stopMassScanner(true);
+      await flushOutbox();
+      alert(await outboxCount(wh) ? "Mass barcode assignment complete; some scans are still queued and will be sent once back online."
+                                  : "Mass barcode assignment complete.");
+      return;
     }
     updateMassHead();
   }
@@ -916,7 +1371,10 @@ if (window.INVENT_WAREHOUSE){
 
   // expose globals for buttons
   window.toggleTorch = toggleTorch;
-  window.stopMass = stopMass;
+  window.stopMass = (hide)=>{
+    stopMassScanner(hide);
+    flushOutbox();
+  };
   window.stopScanner = stopScanner;
   window.snapshotDecode = snapshotDecode;
   window.afFocus = (e, sel)=>doAutofocus(e, sel);
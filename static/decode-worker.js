@@ -0,0 +1,198 @@
+// Snapshot decoding off the main thread (see snapshotDecode in app.js).
+//
+// The page transfers one frame: an ImageBitmap, or its RGBA bytes where
+// OffscreenCanvas is missing. It is reduced to 8-bit luminance once, and
+// every pass starts from that: raw, threshold, invert, and sharpen (an
+// unsharp mask over a separable box blur). Passes run in the order asked
+// and stop at the first decode. A newer request, or {cancel: true}, drops
+// the current one between passes. The BarcodeDetector and ZXing reader are
+// built once per symbology and reused. The reply carries each pass's time
+// for /api/scan_timings.
+const ZXING_URLS = [
+  "https://cdn.jsdelivr.net/npm/@zxing/library@0.20.0/umd/index.min.js",
+  "https://unpkg.com/@zxing/library@0.20.0/umd/index.min.js",
+  "/static/vendor/zxing.min.js",
+];
+// same lists as buildFormats() in app.js
+const FORMATS = {
+  code128: ["code_128","ean_13","upc_a","upc_e","ean_8"],
+  upcean:  ["upc_a","upc_e","ean_13","ean_8"],
+  auto:    ["code_128","upc_a","upc_e","ean_13","ean_8"],
+};
+const PASSES = {
+  raw:       (lum)=>lum,
+  threshold: (lum)=>threshold(lum, 160),
+  invert:    (lum)=>invert(lum),
+  sharpen:   (lum, w, h)=>unsharp(lum, w, h, 0.6, 1),
+};
+
+let latest = 0;         // id of the request being worked on; 0 once cancelled
+let canvas = null;      // OffscreenCanvas the frames are read through
+const detectors = {};   // sym -> BarcodeDetector (or null where unsupported)
+const readers = {};     // sym -> ZXing MultiFormatReader
+let zxingTried = false;
+
+function loadZXing(){
+  if (!zxingTried){
+    zxingTried = true;
+    for (const url of ZXING_URLS){
+      try{ importScripts(url); }catch(_){ continue; }
+      if (self.ZXing && self.ZXing.MultiFormatReader) break;
+    }
+  }
+  return self.ZXing && self.ZXing.MultiFormatReader ? self.ZXing : null;
+}
+function nativeDetector(sym){
+  if (!(sym in detectors)){
+    detectors[sym] = null;
+    try{
+      if (typeof self.BarcodeDetector === "function")
+        detectors[sym] = new self.BarcodeDetector({formats: FORMATS[sym] || FORMATS.auto});
+    }catch(_){}
+  }
+  return detectors[sym];
+}
+function zxingReader(sym){
+  if (!(sym in readers)){
+    readers[sym] = null;
+    const Z = loadZXing();
+    if (Z){
+      const map = {
+        code_128: Z.BarcodeFormat.CODE_128, ean_13: Z.BarcodeFormat.EAN_13, ean_8: Z.BarcodeFormat.EAN_8,
+        upc_a: Z.BarcodeFormat.UPC_A, upc_e: Z.BarcodeFormat.UPC_E,
+      };
+      const hints = new Map();
+      hints.set(Z.DecodeHintType.POSSIBLE_FORMATS, (FORMATS[sym] || FORMATS.auto).map(f=>map[f]));
+      hints.set(Z.DecodeHintType.TRY_HARDER, true);
+      const reader = new Z.MultiFormatReader();
+      reader.setHints(hints);
+      readers[sym] = reader;
+    }
+  }
+  return readers[sym];
+}
+
+// ---- Frame -> luminance -----------------------------------------------------
+function rgbaOf(msg){
+  if (!msg.bitmap) return new Uint8ClampedArray(msg.rgba);
+  const {width: w, height: h} = msg;
+  if (!canvas) canvas = new OffscreenCanvas(w, h);
+  if (canvas.width !== w || canvas.height !== h){ canvas.width = w; canvas.height = h; }
+  const ctx = canvas.getContext("2d", {willReadFrequently: true});
+  ctx.drawImage(msg.bitmap, 0, 0);
+  msg.bitmap.close();
+  return ctx.getImageData(0, 0, w, h).data;
+}
+function luminance(rgba){
+  const lum = new Uint8ClampedArray(rgba.length >> 2);
+  for (let i = 0, j = 0; j < lum.length; i += 4, j++){
+    lum[j] = (rgba[i]*77 + rgba[i+1]*150 + rgba[i+2]*29) >> 8;  // 0.299 R + 0.587 G + 0.114 B
+  }
+  return lum;
+}
+
+// ---- Passes -----------------------------------------------------------------
+function threshold(lum, t){
+  const out = new Uint8ClampedArray(lum.length);
+  for (let i = 0; i < lum.length; i++) out[i] = lum[i] < t ? 0 : 255;
+  return out;
+}
+function invert(lum){
+  const out = new Uint8ClampedArray(lum.length);
+  for (let i = 0; i < lum.length; i++) out[i] = 255 - lum[i];
+  return out;
+}
+// Mean over a (2r+1)x(2r+1) window, as a horizontal then a vertical running
+// sum: O(1) per pixel whatever the radius, in integer arithmetic. Edges
+// repeat the border pixel.
+function boxBlur(src, w, h, r){
+  const n = 2*r + 1, scale = Math.round(65536 / (n*n));
+  const tmp = new Uint16Array(src.length);  // horizontal window sums
+  for (let y = 0; y < h; y++){
+    const row = y*w, last = row + w - 1;
+    let sum = 0;
+    for (let k = -r; k <= r; k++) sum += src[Math.min(last, Math.max(row, row + k))];
+    for (let i = row; i <= last; i++){
+      tmp[i] = sum;
+      const add = i + r + 1, sub = i - r;
+      sum += src[add > last ? last : add] - src[sub < row ? row : sub];
+    }
+  }
+  // vertical: one running sum per column, walked row by row
+  const out = new Uint8ClampedArray(src.length), sums = new Int32Array(w);
+  for (let k = -r; k <= r; k++){
+    const row = Math.min(h - 1, Math.max(0, k))*w;
+    for (let x = 0; x < w; x++) sums[x] += tmp[row + x];
+  }
+  for (let y = 0; y < h; y++){
+    const row = y*w, add = Math.min(h - 1, y + r + 1)*w, sub = Math.max(0, y - r)*w;
+    for (let x = 0; x < w; x++){
+      out[row + x] = (sums[x]*scale) >> 16;
+      sums[x] += tmp[add + x] - tmp[sub + x];
+    }
+  }
+  return out;
+}
+function unsharp(lum, w, h, amount, radius){
+  const blur = boxBlur(lum, w, h, radius), k = Math.round(amount*256);
+  for (let i = 0; i < blur.length; i++) blur[i] = lum[i] + (((lum[i] - blur[i])*k) >> 8);  // clamped by the array
+  return blur;
+}
+
+// ---- Decoding ---------------------------------------------------------------
+let rgbaScratch = null;  // grey -> RGBA for BarcodeDetector, reused across passes
+function toImageData(lum, w, h){
+  if (!rgbaScratch || rgbaScratch.length !== lum.length*4) rgbaScratch = new Uint8ClampedArray(lum.length*4);
+  for (let i = 0, j = 0; i < lum.length; i++, j += 4){
+    rgbaScratch[j] = rgbaScratch[j+1] = rgbaScratch[j+2] = lum[i];
+    rgbaScratch[j+3] = 255;
+  }
+  return new ImageData(rgbaScratch, w, h);
+}
+// [code, engine] or [null, null]
+async function decode(lum, w, h, sym){
+  const det = nativeDetector(sym);
+  if (det){
+    try{
+      const res = await det.detect(toImageData(lum, w, h));
+      if (res && res[0] && res[0].rawValue) return [String(res[0].rawValue).trim(), "native"];
+    }catch(_){}
+  }
+  const reader = zxingReader(sym);
+  if (reader){
+    const Z = self.ZXing;
+    try{
+      const bitmap = new Z.BinaryBitmap(new Z.HybridBinarizer(new Z.RGBLuminanceSource(lum, w, h)));
+      return [String(reader.decodeWithState(bitmap).getText()).trim(), "zxing"];
+    }catch(_){  // NotFoundException and the like: nothing in this pass
+    }finally{
+      reader.reset();
+    }
+  }
+  return [null, null];
+}
+
+self.onmessage = async (e)=>{
+  const msg = e.data;
+  if (msg.cancel){ latest = 0; return; }
+  const {id, width: w, height: h} = msg;
+  const sym = FORMATS[msg.sym] ? msg.sym : "auto";
+  latest = id;
+  if (!nativeDetector(sym) && !zxingReader(sym)){
+    if (msg.bitmap) msg.bitmap.close();
+    return self.postMessage({id, error: "no decoder"});
+  }
+  const t0 = performance.now();
+  const lum = luminance(rgbaOf(msg));
+  const reply = {id, code: null, pass: null, engine: null, prepare_ms: performance.now() - t0, timings: []};
+  for (const name of msg.passes){
+    if (!PASSES[name]) continue;
+    if (latest !== id) return self.postMessage({id, cancelled: true});
+    const t = performance.now();
+    const [code, engine] = await decode(PASSES[name](lum, w, h), w, h, sym);
+    reply.timings.push({pass: name, ms: performance.now() - t, hit: !!code});
+    if (code){ Object.assign(reply, {code, pass: name, engine}); break; }
+    await new Promise(r=>setTimeout(r));  // let a cancel or a newer request in
+  }
+  self.postMessage(reply);
+};
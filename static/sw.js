@@ -0,0 +1,61 @@
+// Service worker: keeps the page shell (pages, app.js, CSS, scanner and icon
+// libraries) in Cache Storage so a products page opens without the network.
+// Product data is kept by the page itself, in IndexedDB (see app.js); API
+// calls are not intercepted.
+const SHELL = "invent-shell-v1";
+const PRECACHE = ["/static/app.js", "/static/decode-worker.js", "/static/style.css"];
+const CDN_HOSTS = ["cdn.jsdelivr.net", "unpkg.com"];
+const NAV_TIMEOUT_MS = 3000;
+
+self.addEventListener("install", (e)=>{
+  e.waitUntil(caches.open(SHELL).then(c=>c.addAll(PRECACHE)).then(()=>self.skipWaiting()));
+});
+self.addEventListener("activate", (e)=>{
+  e.waitUntil(caches.keys()
+    .then(keys=>Promise.all(keys.filter(k=>k !== SHELL).map(k=>caches.delete(k))))
+    .then(()=>self.clients.claim()));
+});
+
+// Assets: answer from the cache at once and refresh the copy behind the
+// response, so a new app.js takes effect from the next load.
+async function staleWhileRevalidate(e){
+  const cache = await caches.open(SHELL);
+  const hit = await cache.match(e.request);
+  const fresh = fetch(e.request).then(resp=>{
+    if (resp.ok || resp.type === "opaque") cache.put(e.request, resp.clone());
+    return resp;
+  });
+  if (!hit) return fresh;
+  e.waitUntil(fresh.catch(()=>{}));
+  return hit;
+}
+
+// Pages: the network if it answers within NAV_TIMEOUT_MS (a dead spot
+// between racks tends to hang rather than fail), else the last copy seen.
+async function networkFirst(e){
+  const net = fetch(e.request).then(resp=>{
+    const html = (resp.headers.get("Content-Type") || "").startsWith("text/html");
+    if (resp.ok && html && !resp.redirected){
+      const copy = resp.clone();
+      e.waitUntil(caches.open(SHELL).then(c=>c.put(e.request, copy)));
+    }
+    return resp;
+  });
+  const timeout = new Promise(resolve=>setTimeout(resolve, NAV_TIMEOUT_MS, null));
+  try{
+    const resp = await Promise.race([net, timeout]);
+    if (resp) return resp;
+  }catch(_){}
+  return (await caches.match(e.request)) || net;
+}
+
+self.addEventListener("fetch", (e)=>{
+  if (e.request.method !== "GET") return;
+  const url = new URL(e.request.url);
+  if (e.request.mode === "navigate"){
+    if (url.origin === location.origin) e.respondWith(networkFirst(e));
+  } else if ((url.origin === location.origin && url.pathname.startsWith("/static/")) ||
+             CDN_HOSTS.includes(url.hostname)){
+    e.respondWith(staleWhileRevalidate(e));
+  }
+});
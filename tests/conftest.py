@@ -0,0 +1,19 @@
+"""
+app.py reads its settings when imported: point it at a scratch data
+directory, and make sure no GitHub credentials are picked up, before any
+test imports it.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+_scratch = Path(tempfile.mkdtemp(prefix="inventory-tests-"))
+for var in ("GITHUB_TOKEN", "TOK_A", "TOK_B", "TOK_C", "KEY_PHRASE"):
+    os.environ.pop(var, None)
+os.environ["DATA_DIR"] = str(_scratch / "data")
+os.environ["SYNC_QUEUE_PATH"] = str(_scratch / "sync_queue.json")
+os.environ["SQLITE_PATH"] = str(_scratch / "inventory.db")
+os.environ["SHARED_DIR"] = str(_scratch / "shared")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
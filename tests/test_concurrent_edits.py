@@ -0,0 +1,149 @@
+"""
+Edits racing each other must all survive, including for warehouses that
+are not in the product cache (evicted, or PRODUCT_CACHE_MB=0),
+where writers cannot tell a stale index by identity; and readers racing
+them (on the cached index, which edits change in place) must only ever
+see whole edits.
+"""
+import sys
+import threading
+import uuid
+
+import pytest
+
+import app
+
+THREADS = 8
+EDITS = 10  # per thread, each on its own product
+FILLER = 500  # untouched products, so each load takes long enough to race
+
+
+@pytest.fixture(params=[(fmt, journal, cache) for cache in (False, True)
+                        for fmt in ("json", "compact") for journal in (False, True)],
+                ids=lambda c: "-".join([c[0]] + ["journal"] * c[1] + ["cached" if c[2] else "uncached"]))
+def warehouse(request, monkeypatch):
+    fmt, journal, cache = request.param
+    monkeypatch.setattr(app, "PRODUCT_FORMAT", fmt)
+    monkeypatch.setattr(app, "PRODUCT_JOURNAL", journal)
+    if not cache:
+        monkeypatch.setattr(app.product_cache, "max_bytes", 0)
+    app.product_cache.invalidate()
+    name = "T" + uuid.uuid4().hex[:8]
+    app.save_products(name, [
+        {"internal_name": f"item {i}", "customer_name": "c", "qty": 0, "min": 0, "max": 10, "barcode": ""}
+        for i in range(THREADS * EDITS)] + [
+        {"internal_name": f"filler {i}", "customer_name": "c", "qty": 0, "barcode": ""}
+        for i in range(FILLER)])
+    return name
+
+
+def _race(work):
+    start = threading.Barrier(THREADS)
+    errors = []
+
+    def run(t):
+        try:
+            start.wait()
+            work(t)
+        except Exception as e:  # surfaced below; a thread can't fail the test itself
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in range(THREADS)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert not errors
+
+
+def _qtys(name):
+    app.product_cache.invalidate()
+    return {p["internal_name"]: p["qty"] for p in app.load_index(name).products
+            if not p["internal_name"].startswith("filler")}
+
+
+def test_concurrent_single_edits_are_all_kept(warehouse):
+    ids = [p["id"] for p in app.load_index(warehouse).products]
+
+    def work(t):
+        for e in range(EDITS):
+            i = t * EDITS + e
+            res = app.change_product(warehouse, {"op": "update", "id": ids[i], "fields": {"qty": i + 1}})
+            assert res.get("ok"), res
+
+    _race(work)
+    assert _qtys(warehouse) == {f"item {i}": i + 1 for i in range(THREADS * EDITS)}
+
+
+def test_concurrent_batches_are_all_kept(warehouse):
+    ids = [p["id"] for p in app.load_index(warehouse).products]
+
+    def work(t):
+        for e in range(0, EDITS, 2):
+            i = t * EDITS + e
+            results, applied = app.apply_product_batch(warehouse, [
+                {"op": "update", "id": ids[i], "fields": {"qty": i + 1}},
+                {"op": "update", "id": ids[i + 1], "fields": {"qty": i + 2}},
+            ])
+            assert applied == 2, results
+
+    _race(work)
+    assert _qtys(warehouse) == {f"item {i}": i + 1 for i in range(THREADS * EDITS)}
+
+
+def test_concurrent_adds_are_all_kept(warehouse):
+    def work(t):
+        for e in range(EDITS):
+            res = app.change_product(warehouse, {"op": "add", "product": {
+                "internal_name": f"new {t}-{e}", "customer_name": "c", "qty": 1}})
+            assert res.get("ok"), res
+
+    _race(work)
+    names = set(_qtys(warehouse))
+    assert {f"new {t}-{e}" for t in range(THREADS) for e in range(EDITS)} <= names
+    assert len(names) == THREADS * EDITS * 2  # and nothing else went missing
+
+
+def test_readers_only_see_whole_edits(warehouse):
+    ids = [p["id"] for p in app.load_index(warehouse).products]
+    total = len(ids)
+    finished, lock = [], threading.Lock()
+    done = threading.Event()
+    reads = [0]
+
+    def read():
+        while not done.is_set():
+            rows = app.export_rows(warehouse, sort="bin")
+            assert len(rows) == total and len({p["id"] for p in rows}) == total
+            listed = app.load_products(warehouse)
+            assert len(listed) == total
+            p = listed[len(listed) // 2]
+            got = app.get_product(warehouse, p["id"])
+            assert got is None or got["id"] == p["id"]  # None: deleted meanwhile
+            reads[0] += 1
+
+    def work(t):
+        if t == 0:
+            read()
+            return
+        # a batch is one edit: readers never see the product count change
+        for e in range(EDITS):
+            i = t * EDITS + e
+            results, applied = app.apply_product_batch(warehouse, [
+                {"op": "delete", "id": ids[i]},
+                {"op": "add", "product": {"internal_name": f"new {t}-{e}", "customer_name": "c"}},
+            ])
+            assert applied == 2, results
+        with lock:
+            finished.append(t)
+            if len(finished) == THREADS - 1:
+                done.set()
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads as often as possible
+    try:
+        _race(work)
+    finally:
+        sys.setswitchinterval(interval)
+    assert reads[0]
+    assert len(_qtys(warehouse)) == THREADS * EDITS
@@ -0,0 +1,22 @@
+"""replace_file swaps files whole and leaves no temp files behind."""
+import pytest
+
+from utils.fileio import replace_file
+
+
+def test_replace_text_and_bytes(tmp_path):
+    path = tmp_path / "a.json"
+    replace_file(path, "one")
+    replace_file(path, b"two", mtime_ns=10 ** 18)
+    assert path.read_bytes() == b"two"
+    assert path.stat().st_mtime_ns == 10 ** 18
+    assert [p.name for p in tmp_path.iterdir()] == ["a.json"]
+
+
+def test_failed_replace_removes_temp(tmp_path):
+    path = tmp_path / "dir"
+    path.mkdir()
+    (path / "x").write_text("x")
+    with pytest.raises(OSError):
+        replace_file(path, "data")  # can't rename a file over a non-empty directory
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["dir"]
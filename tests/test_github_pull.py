@@ -0,0 +1,67 @@
+"""Login pulls never overwrite a local edit, even one saved during the download."""
+import json
+
+import pytest
+
+from utils.github_sync import GithubSync, git_blob_sha
+from utils.locks import LockManager
+
+REMOTE = json.dumps({"products": [{"internal_name": "remote"}]}).encode()
+LOCAL = json.dumps({"products": [{"internal_name": "local"}]}).encode()
+EDITED = json.dumps({"products": [{"internal_name": "edited during pull"}]}).encode()
+
+
+class _Resp:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class _FakeSession:
+    """The listing, then one download, during which ``during_download`` runs."""
+    def __init__(self, during_download):
+        self.during_download = during_download
+
+    def get(self, url, headers=None, timeout=None):
+        if url.endswith("/raw"):
+            self.during_download()
+            return _Resp(200, REMOTE)
+        return _Resp(200, json.dumps([{
+            "type": "file", "name": "products_W.json", "path": "data/products_W.json",
+            "sha": git_blob_sha(REMOTE), "download_url": "https://example.invalid/raw",
+        }]).encode(), {"ETag": '"1"'})
+
+
+@pytest.fixture
+def gh(monkeypatch):
+    g = GithubSync("o", "r", "data", locks=LockManager())
+    monkeypatch.setattr(g, "_gh_headers", lambda: {"Authorization": "token t"})
+    return g
+
+
+def test_pull_replaces_an_unedited_file(gh, tmp_path):
+    (tmp_path / "products_W.json").write_bytes(LOCAL)
+    gh.session = _FakeSession(lambda: None)
+    assert gh.pull_all(tmp_path, skip=lambda name: False) == [tmp_path / "products_W.json"]
+    assert (tmp_path / "products_W.json").read_bytes() == REMOTE
+
+
+@pytest.mark.parametrize("marks_dirty", [True, False], ids=["marked-dirty", "bytes-only"])
+def test_pull_keeps_an_edit_saved_during_the_download(gh, tmp_path, marks_dirty):
+    dest = tmp_path / "products_W.json"
+    dest.write_bytes(LOCAL)
+    dirty = set()
+
+    def edit():
+        dest.write_bytes(EDITED)
+        if marks_dirty:
+            dirty.add(dest.name)
+
+    gh.session = _FakeSession(edit)
+    assert gh.pull_all(tmp_path, skip=lambda name: name in dirty) == []
+    assert dest.read_bytes() == EDITED
+    assert [f.name for f in tmp_path.iterdir()] == [dest.name]  # the download was discarded
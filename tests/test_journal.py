@@ -0,0 +1,53 @@
+"""Journal mode: single edits append to the journal whatever wrote the warehouse first."""
+import uuid
+
+import pytest
+
+import app
+
+
+@pytest.fixture(params=["json", "compact"])
+def journaled(request, monkeypatch):
+    monkeypatch.setattr(app, "PRODUCT_JOURNAL", True)
+    monkeypatch.setattr(app, "PRODUCT_FORMAT", request.param)
+    return "J" + uuid.uuid4().hex[:8]
+
+
+def _reload(name):
+    """Forget everything this process knows about ``name`` and load it from disk."""
+    p = app._products_path(name)
+    app.product_cache.invalidate(p.name)
+    app._revision_seen.pop(p.name, None)
+    app._journal_state.pop(p.name, None)
+    return app.load_index(name)
+
+
+def test_edit_after_bulk_save_is_journaled(journaled):
+    name = journaled
+    app.save_products(name, [{"internal_name": "a", "customer_name": "c", "qty": 1}])
+    p = app._products_path(name)
+    snap = app._source_path(p)
+    before = snap.stat().st_mtime_ns
+    pid = app.load_products(name)[0]["id"]
+
+    res = app.change_product(name, {"op": "update", "id": pid, "fields": {"qty": 2}})
+    assert res["ok"]
+    assert snap.stat().st_mtime_ns == before  # not rewritten
+    assert [r["op"] for r in app._journal_for(p).records()] == ["update"]
+    assert _reload(name).get(pid)["qty"] == 2
+
+
+def test_stale_journal_is_not_replayed_onto_a_bulk_save(journaled, monkeypatch):
+    name = journaled
+    p = app._products_path(name)
+    app.save_products(name, [{"internal_name": "a", "customer_name": "c", "qty": 1}])
+    pid = app.load_products(name)[0]["id"]
+    app.change_product(name, {"op": "update", "id": pid, "fields": {"qty": 2}})
+    stale = list(app._journal_for(p).records())
+    # a new process bulk-saves, and dies before the old journal is cleared
+    app._journal_state.pop(p.name, None)
+    with monkeypatch.context() as m:
+        m.setattr(app.ProductJournal, "clear", lambda self: None)
+        app.save_products(name, [{"internal_name": "b", "customer_name": "c", "qty": 5}])
+    assert list(app._journal_for(p).records()) == stale
+    assert [x["internal_name"] for x in _reload(name).products] == ["b"]
@@ -0,0 +1,48 @@
+"""/products/batch: one bad op fails alone, never the whole request."""
+import uuid
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    c = app.app.test_client()
+    with c.session_transaction() as sess:
+        sess["user"] = "JMH"
+    return c
+
+
+@pytest.fixture
+def warehouse():
+    name = "B" + uuid.uuid4().hex[:8]
+    # as written by older versions and imports: no barcode (or other optional) keys
+    app.save_products(name, [{"internal_name": "bare", "customer_name": "c", "qty": 1}])
+    return name
+
+
+def test_update_of_product_without_barcode_key(client, warehouse):
+    pid = app.load_products(warehouse)[0]["id"]
+    r = client.post(f"/api/warehouse/{warehouse}/products/batch", json={"ops": [
+        {"op": "update", "id": pid, "fields": {"qty": 5}},
+        {"op": "update", "id": "0" * 16, "fields": {"qty": 5}},
+    ]})
+    assert r.status_code == 200
+    results = r.get_json()["results"]
+    assert results[0]["ok"] and results[1]["status"] == 404
+    assert app.get_product(warehouse, pid)["qty"] == 5
+
+
+@pytest.mark.parametrize("body", ["[]", '[{"op": "add"}]', '"ops"', "3", "null"])
+def test_body_that_is_not_an_object(client, warehouse, body):
+    api = f"/api/warehouse/{warehouse}"
+
+    def send(method, url):
+        return client.open(url, method=method, data=body, content_type="application/json").status_code
+
+    assert send("POST", f"{api}/products/batch") == 400
+    assert send("POST", f"{api}/products") == 400
+    pid = app.load_products(warehouse)[0]["id"]
+    assert send("PUT", f"{api}/products/{pid}") in (200, 400)  # null: an update without fields
+    assert send("POST", "/api/scan_timings") in (204, 400)  # null: nothing to record
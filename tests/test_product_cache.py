@@ -0,0 +1,44 @@
+"""ProductCache bounds: entries are weighed by estimated memory, and one too big for the bound is kept alone."""
+import uuid
+
+import app
+from utils.product_cache import ProductCache
+from utils.product_index import PRODUCT_BYTES, ProductIndex
+
+
+def test_lru_eviction():
+    cache = ProductCache(max_bytes=100)
+    cache.put("a", 1, "A", 40)
+    cache.put("b", 1, "B", 40)
+    cache.get("a", 1)
+    cache.put("c", 1, "C", 40)
+    assert cache.peek("a", 1) == "A" and cache.peek("b", 1) is None and cache.peek("c", 1) == "C"
+    assert cache.stats()["bytes"] == 80
+
+
+def test_oversized_entry_is_kept_alone(capsys):
+    cache = ProductCache(max_bytes=100)
+    cache.put("a", 1, "A", 40)
+    cache.put("big", 1, "BIG", 500)
+    assert cache.peek("big", 1) == "BIG" and cache.peek("a", 1) is None
+    assert "[CACHE] big" in capsys.readouterr().out
+    cache.put("big", 2, "BIG", 500)
+    assert capsys.readouterr().out == ""  # reported once
+
+
+def test_zero_bound_disables():
+    cache = ProductCache(max_bytes=0)
+    cache.put("a", 1, "A", 1)
+    assert cache.stats()["entries"] == 0
+
+
+def test_weight_is_memory_not_file_size():
+    name = "C" + uuid.uuid4().hex[:8]
+    app.save_products(name, [{"internal_name": f"p{i}", "customer_name": "c", "qty": i} for i in range(50)])
+    p = app._products_path(name)
+    app.product_cache.invalidate(p.name)
+    idx = app.load_index(name)
+    assert isinstance(idx, ProductIndex)
+    before = app.product_cache.stats()["bytes"]
+    app.product_cache.invalidate(p.name)
+    assert before - app.product_cache.stats()["bytes"] == 50 * PRODUCT_BYTES > app._source_path(p).stat().st_size
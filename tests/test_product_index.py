@@ -0,0 +1,36 @@
+"""ProductIndex keeps its stock counts in step with adds, updates and deletes."""
+import random
+
+from utils.product_index import ProductIndex, ensure_ids
+
+
+def _product(i, rng):
+    return {"internal_name": f"p{i}", "customer_name": "c", "barcode": str(i),
+            "qty": rng.randint(0, 20), "min": rng.randint(0, 10), "max": rng.randint(10, 30)}
+
+
+def test_counts_match_a_rebuild():
+    rng = random.Random(1)
+    prods = [_product(i, rng) for i in range(200)]
+    ensure_ids(prods)
+    idx = ProductIndex(prods)
+    for n in range(500):
+        r = rng.random()
+        if r < 0.3:
+            prods.append(_product(1000 + n, rng))
+            ensure_ids(prods)
+            idx.add()
+        elif r < 0.5 and prods:
+            i = rng.randrange(len(prods))
+            idx.delete(i, prods.pop(i))
+        elif prods:
+            i = rng.randrange(len(prods))
+            old = prods[i]
+            prods[i] = dict(old, qty=rng.choice([rng.randint(0, 40), "7", None]))
+            idx.reindex(i, old)
+    fresh = ProductIndex(list(prods))
+    assert idx.summary() == fresh.summary()
+    assert idx.stock == fresh.stock
+    assert idx.shortfalls(20) == fresh.shortfalls(20)
+    short = idx.shortfalls(5)
+    assert [mn - qty for _, qty, mn in short] == sorted((mn - qty for _, qty, mn in short), reverse=True)
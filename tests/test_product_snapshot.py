@@ -0,0 +1,39 @@
+"""Snapshot round trips give back exactly the products encoded, key order included."""
+import json
+
+from utils import product_snapshot
+
+V1 = (b'INVSNAP1\xd7\x00\x00\x00{"count":2,"doc":{"revision":3},"columns":[{"name":"id","type":"str","masked":false},'
+      b'{"name":"qty","type":"int","masked":true},{"name":"bin","type":"str","masked":false},'
+      b'{"name":"note","type":"json","masked":true}]}\x03\x00\x00\x00a\x00b\x00\x00\x00\x00\x01\x00\x00\x00\x01\x00'
+      b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x05\x00\x00\x00A1\x00B2\x00\x00\x00\x00\x01'
+      b'\x00\x00\x00\x00\x01\x08\x00\x00\x00null\x00[1]\x00\x00\x00\x00\x01\x00\x00\x00')
+
+
+def _same(a, b):
+    """Equal, and every product's keys in the same order (== ignores order)."""
+    return json.dumps(a) == json.dumps(b)
+
+
+def test_round_trip_keeps_key_order():
+    doc = {"products": [
+        {"id": "a", "qty": 1, "bin": "A1"},
+        {"bin": "B2", "id": "b", "qty": 2},
+        {"id": "c", "note": {"x": [1]}, "qty": "3"},
+        {},
+        {"id": "d\0e", "qty": 2 ** 70},
+    ], "revision": 7}
+    assert _same(product_snapshot.decode(product_snapshot.encode(doc)), doc)
+
+
+def test_round_trip_single_shape_and_empty():
+    doc = {"products": [{"id": str(i), "qty": i} for i in range(5)]}
+    assert _same(product_snapshot.decode(product_snapshot.encode(doc)), doc)
+    empty = {"products": []}
+    assert _same(product_snapshot.decode(product_snapshot.encode(empty)), empty)
+
+
+def test_first_version_files_still_decode():
+    doc = product_snapshot.decode(V1)
+    assert _same(doc, {"products": [{"id": "a", "qty": 1, "bin": "A1"},
+                                    {"id": "b", "bin": "B2", "note": [1]}], "revision": 3})
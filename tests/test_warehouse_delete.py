@@ -0,0 +1,42 @@
+"""Deleting a warehouse waits for edits in flight and leaves nothing cached behind."""
+import threading
+import time
+import uuid
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    c = app.app.test_client()
+    with c.session_transaction() as sess:
+        sess["user"] = "JMH"
+    return c
+
+
+def test_delete_waits_for_write_lock(client):
+    name = "D" + uuid.uuid4().hex[:8]
+    client.post("/warehouses", data={"action": "add", "name": name})
+    app.save_products(name, [{"internal_name": "a", "customer_name": "c", "qty": 1}])
+    p = app._products_path(name)
+    app.load_index(name)
+    stamp = app._products_stamp(p)[0]
+    assert app.product_cache.peek(p.name, stamp) is not None
+
+    done = threading.Event()
+
+    def delete():
+        client.post("/warehouses", data={"action": "delete", "name": name, "confirm1": "on", "confirm2": "on"})
+        done.set()
+
+    with app.locks.write(p.name):
+        t = threading.Thread(target=delete)
+        t.start()
+        time.sleep(0.3)
+        assert not done.is_set() and app._source_path(p).exists()
+    t.join(10)
+    assert done.is_set() and not app._source_path(p).exists()
+    assert app.product_cache.peek(p.name, stamp) is None
+    assert p.name not in app._journal_state
@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+class Subscriber:
+    """One open event stream: a bounded outbox and a flag to wake its reader."""
+    def __init__(self, topic, max_queue):
+        self.topic = topic
+        self.max_queue = max_queue
+        self.outbox = deque()
+        self.wake = threading.Event()
+        self.dropped = False
+
+    def take(self, timeout):
+        """Wait up to ``timeout`` seconds; return the queued events (possibly none)."""
+        if not self.outbox:
+            self.wake.wait(timeout)
+        self.wake.clear()
+        out = []
+        while self.outbox:
+            out.append(self.outbox.popleft())
+        return out
+
+
+class Broadcaster:
+    """
+    Fan-out of change events per topic (warehouse) to Server-Sent Events
+    streams. ``publish`` never blocks: each subscriber has an outbox of at
+    most ``max_queue`` events, and one that falls that far behind is dropped
+    (its stream ends; EventSource reconnects and the page resyncs). Idle
+    subscribers cost a waiting thread and nothing else, and are sent a
+    comment every ``heartbeat`` seconds so proxies keep the connection open.
+    """
+    def __init__(self, max_queue=256, heartbeat=25):
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self._subs = {}  # topic -> set of Subscriber
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, topic):
+        sub = Subscriber(topic, self.max_queue)
+        with self._lock:
+            self._subs.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.topic]
+
+    def publish(self, topic, event):
+        """Queue ``event`` (a JSON-able dict) for every subscriber of ``topic``."""
+        data = (event.get("revision"), json.dumps(event, separators=(",", ":")))
+        with self._lock:
+            subs = list(self._subs.get(topic, ()))
+            self.published += 1
+        for sub in subs:
+            if len(sub.outbox) >= sub.max_queue:
+                sub.dropped = True
+                self.dropped += 1
+                self.unsubscribe(sub)
+            else:
+                sub.outbox.append(data)
+            sub.wake.set()
+
+    def stream(self, topic, first=None, poll=None, poll_interval=2.0):
+        """
+        Generator of SSE frames for a new subscriber to ``topic``, until it is
+        dropped or the client goes away (the server closes the generator).
+        ``first`` is sent as an initial ``hello`` event. ``poll()``, if
+        given, returns the topic's current revision; when it moves past the
+        last one sent without an event (a change made by another process) a
+        ``{"revision": r, "base": null}`` event tells the page to resync.
+        """
+        sub = self.subscribe(topic)
+        revision = (first or {}).get("revision")
+        try:
+            yield "retry: 3000\n\n"
+            if first is not None:
+                yield f"event: hello\ndata: {json.dumps(first, separators=(',', ':'))}\n\n"
+            last = time.time()
+            while not sub.dropped:
+                events = sub.take(min(self.heartbeat, poll_interval) if poll else self.heartbeat)
+                if events:
+                    revision = max([r for r, _ in events if r is not None] + [revision or 0])
+                    yield "".join(f"data: {e}\n\n" for _, e in events)
+                    last = time.time()
+                    continue
+                if poll is not None:
+                    current = poll()
+                    if revision is not None and current > revision:
+                        revision = current
+                        yield f"data: {json.dumps({'revision': current, 'base': None, 'changes': []})}\n\n"
+                        last = time.time()
+                        continue
+                    revision = current if revision is None else revision
+                if time.time() - last >= self.heartbeat:
+                    yield ": ping\n\n"
+                    last = time.time()
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "topics": len(self._subs),
+                "subscribers": sum(len(s) for s in self._subs.values()),
+                "published": self.published,
+                "dropped": self.dropped,
+            }
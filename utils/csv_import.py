@@ -0,0 +1,319 @@
+import codecs
+import csv
+import io
+import json
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from .fileio import replace_file
+from .product_index import new_id
+
+REQUIRED_HEADERS = {"Internal Product Name", "Customer Product Name"}
+TEXT_COLUMNS = [("Internal Product Code", "internal_code"), ("Customer Product Code", "customer_code"),
+                ("Bin", "bin"), ("Barcode", "barcode")]
+INT_COLUMNS = [("Qty", "qty"), ("Min", "min"), ("Max", "max")]
+CHUNK_ROWS = 2000     # rows merged between progress updates
+MAX_DIFF = 500        # field-level diff entries kept for a dry run
+MAX_JOBS = 50         # finished jobs remembered for polling
+
+
+def detect_encoding(path: Path, block: int = 1 << 16):
+    """'utf-8-sig' if the whole file decodes as UTF-8, else 'latin-1' (checked in blocks)."""
+    dec = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(block)
+                if not chunk:
+                    dec.decode(b"", final=True)
+                    return "utf-8-sig"
+                dec.decode(chunk)
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def open_csv(path: Path):
+    """
+    Return (raw_file, reader, headers) for streaming ``path``; ``headers``
+    maps stripped header -> header as written. raw_file.tell() is progress.
+    """
+    raw = open(path, "rb")
+    text = io.TextIOWrapper(raw, encoding=detect_encoding(path), newline="")
+    reader = csv.DictReader(text)
+    headers = {h.strip(): h for h in reader.fieldnames or []}
+    return raw, reader, headers
+
+
+def _row_payload(row, headers):
+    def get(key):
+        return (row.get(headers.get(key, "")) or "").strip()
+    payload = {"internal_name": get("Internal Product Name"),
+               "customer_name": get("Customer Product Name")}
+    for col, k in TEXT_COLUMNS:
+        payload[k] = get(col)
+    for col, k in INT_COLUMNS:
+        v = get(col)
+        try:
+            payload[k] = int(v) if v != "" else None
+        except Exception:
+            payload[k] = None
+    return payload
+
+
+def _merge_fields(current, payload):
+    """Fields of ``payload`` that would change ``current`` under the import rules."""
+    changes = {}
+    for _, k in TEXT_COLUMNS:
+        if payload[k] and payload[k] != current.get(k, ""):
+            changes[k] = payload[k]
+    for _, k in INT_COLUMNS:
+        if payload[k] is not None and payload[k] != current.get(k):
+            changes[k] = payload[k]
+    return changes
+
+
+def _new_product(payload, now):
+    return {
+        "id": new_id(),
+        "version": 1,
+        "internal_name": payload["internal_name"],
+        "customer_name": payload["customer_name"],
+        "internal_code": payload["internal_code"],
+        "customer_code": payload["customer_code"],
+        "bin": payload["bin"],
+        "qty": int(payload["qty"] or 0),
+        "min": int(payload["min"] or 0),
+        "max": int(payload["max"] or 0),
+        "barcode": payload["barcode"],
+        "updated_at": now,
+    }
+
+
+def _updated(product, fields, now):
+    """A copy of ``product`` with ``fields`` applied and its version bumped."""
+    p = dict(product)
+    p.update(fields)
+    p["updated_at"] = now
+    p["version"] = p.get("version", 0) + 1
+    return p
+
+
+class ImportPlan:
+    """
+    What an import would do, keyed by lowercased (internal, customer) name:
+    field updates for existing products and whole new products. Built row by
+    row against a read-only ProductIndex; nothing is mutated until ``apply``.
+    """
+    def __init__(self, index):
+        self.index = index
+        self.updates = {}   # key -> {field: new value}
+        self.adds = {}      # key -> new product (insertion-ordered)
+        self.rows = self.skipped = 0
+        self.touched = set()  # existing keys seen in the file
+
+    def merge(self, payload, now):
+        self.rows += 1
+        iname, cname = payload["internal_name"], payload["customer_name"]
+        if not iname or not cname:
+            self.skipped += 1
+            return
+        key = (iname.lower(), cname.lower())
+        if key in self.adds:
+            p = self.adds[key]
+            p.update(_merge_fields(p, payload))
+            return
+        i = self.index.find_key(iname, cname)
+        if i is None:
+            self.adds[key] = _new_product(payload, now)
+            return
+        self.touched.add(key)
+        current = dict(self.index.products[i])
+        current.update(self.updates.get(key, {}))
+        changes = _merge_fields(current, payload)
+        if changes:
+            self.updates.setdefault(key, {}).update(changes)
+
+    def summary(self):
+        return {"rows": self.rows, "skipped": self.skipped, "added": len(self.adds),
+                "updated": len(self.updates), "unchanged": len(self.touched - set(self.updates))}
+
+    def diff(self, limit=MAX_DIFF):
+        """Field-level diff: [{action, key, changes|product}], capped at ``limit``."""
+        out = []
+        for key, fields in self.updates.items():
+            if len(out) >= limit:
+                return out
+            i = self.index.find_key(*key)
+            old = self.index.products[i] if i is not None else {}
+            out.append({"action": "update", "key": list(key),
+                        "changes": {k: [old.get(k), v] for k, v in fields.items()}})
+        for key, p in self.adds.items():
+            if len(out) >= limit:
+                return out
+            out.append({"action": "add", "key": list(key), "product": p})
+        return out
+
+    def apply(self, prods, idx, now):
+        """
+        Apply the plan to ``prods`` (a private list whose ProductIndex is ``idx``),
+        keeping ``idx`` in step. Changed products are replaced by updated
+        copies, never edited in place: the dicts are shared with readers of
+        the cached index. Keys are looked up again, so products added, moved
+        or deleted since planning are handled.
+        """
+        for key, fields in self.updates.items():
+            i = idx.find_key(*key)
+            if i is None:
+                continue  # deleted meanwhile; don't resurrect it
+            old = prods[i]
+            prods[i] = _updated(old, fields, now)
+            idx.reindex(i, old)
+        for key, p in self.adds.items():
+            i = idx.find_key(*key)
+            if i is not None:
+                old = prods[i]
+                prods[i] = _updated(old, {k: v for k, v in p.items()
+                                          if k not in ("id", "version", "internal_name", "customer_name")
+                                          and v not in ("", None)}, now)
+                idx.reindex(i, old)
+            else:
+                prods.append(p)
+                idx.add()
+
+
+class ImportJob:
+    """Status of one background import; ``as_dict`` is what the poll API returns."""
+    def __init__(self, warehouse, path: Path, dry_run: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.warehouse = warehouse
+        self.path = path
+        self.dry_run = dry_run
+        self.state = "queued"   # queued | running | done | error
+        self.error = None
+        self.bytes_total = path.stat().st_size if path.exists() else 0
+        self.bytes_read = 0
+        self.result = {}
+        self.diff = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.on_change = None   # called after each progress/state update
+
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def as_dict(self):
+        d = {
+            "id": self.id, "warehouse": self.warehouse, "dry_run": self.dry_run,
+            "state": self.state, "error": self.error,
+            "bytes_read": self.bytes_read, "bytes_total": self.bytes_total,
+            "progress": round(self.bytes_read / self.bytes_total, 3) if self.bytes_total else 1.0,
+            "created_at": int(self.created_at),
+            "finished_at": int(self.finished_at) if self.finished_at else None,
+        }
+        d.update(self.result)
+        if self.diff is not None:
+            d["diff"] = self.diff
+        return d
+
+
+class _StoredJob:
+    """A job another process is running, as last written to the shared directory."""
+    def __init__(self, d):
+        self._d = d
+
+    def as_dict(self):
+        return self._d
+
+
+class ImportJobs:
+    """
+    Registry of recent jobs (bounded), safe to poll from request threads.
+    With ``shared_dir`` each job's status is also written there as
+    ``<id>.json`` on every update, so any process can answer the poll.
+    """
+    def __init__(self, shared_dir: Path = None):
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.shared_dir = shared_dir
+        if shared_dir is not None:
+            shared_dir.mkdir(parents=True, exist_ok=True)
+
+    def _save(self, job):
+        replace_file(self.shared_dir / f"{job.id}.json", json.dumps(job.as_dict()))
+
+    def add(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            if len(self._jobs) > MAX_JOBS:
+                done = sorted((j for j in self._jobs.values() if j.finished_at),
+                              key=lambda j: j.finished_at)
+                for j in done[:len(self._jobs) - MAX_JOBS]:
+                    del self._jobs[j.id]
+        if self.shared_dir is not None:
+            job.on_change = self._save
+            self._save(job)
+            try:
+                stored = sorted(self.shared_dir.glob("*.json"), key=lambda f: f.stat().st_mtime)
+                for f in stored[:-MAX_JOBS]:
+                    f.unlink(missing_ok=True)
+            except OSError:
+                pass  # another process pruned at the same time
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or self.shared_dir is None or not job_id.isalnum():
+            return job
+        try:
+            return _StoredJob(json.loads((self.shared_dir / f"{job_id}.json").read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            return None
+
+
+def run_import(job, load_index, commit):
+    """
+    Stream ``job.path`` in CHUNK_ROWS-row chunks into an ImportPlan against
+    ``load_index()`` (read-only), updating progress as it goes. Dry runs stop
+    at the plan and its diff; otherwise ``commit(plan)`` applies it.
+    """
+    job.state = "running"
+    job.changed()
+    raw = None
+    try:
+        raw, reader, headers = open_csv(job.path)
+        if not REQUIRED_HEADERS.issubset(headers.keys()):
+            raise ValueError("CSV must include 'Internal Product Name' and 'Customer Product Name'.")
+        plan = ImportPlan(load_index())
+        now = int(time.time())
+        n = 0
+        for row in reader:
+            plan.merge(_row_payload(row, headers), now)
+            n += 1
+            if n % CHUNK_ROWS == 0:
+                job.bytes_read = raw.tell()
+                job.result = plan.summary()
+                job.changed()
+                time.sleep(0)  # let request threads in between chunks
+        job.bytes_read = job.bytes_total
+        job.result = plan.summary()
+        if job.dry_run:
+            job.diff = plan.diff()
+        else:
+            commit(plan)
+        job.state = "done"
+    except Exception as e:
+        job.state = "error"
+        job.error = str(e)
+    finally:
+        if raw is not None:
+            raw.close()
+        try:
+            job.path.unlink()
+        except OSError:
+            pass
+        job.finished_at = time.time()
+        job.changed()
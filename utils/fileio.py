@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+# os.replace onto a file another process has open fails on Windows; retry a
+# few times (with growing pauses) before giving up
+REPLACE_ATTEMPTS = 5
+
+
+def replace_file(path: Path, data, mtime_ns=None):
+    """
+    Write ``data`` (str or bytes) to a temp file beside ``path``, fsync it and
+    rename it over ``path``, so readers (in any process) see the old or the
+    new file, never a partial one, and a crash never leaves an empty file
+    behind. ``mtime_ns`` sets the new file's mtime.
+    """
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        if isinstance(data, str):
+            f = open(tmp, "w", encoding="utf-8")
+        else:
+            f = open(tmp, "wb")
+        with f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if mtime_ns is not None:
+            os.utime(tmp, ns=(mtime_ns, mtime_ns))
+        for attempt in range(REPLACE_ATTEMPTS):
+            try:
+                os.replace(tmp, path)
+                break
+            except PermissionError:
+                if attempt == REPLACE_ATTEMPTS - 1:
+                    raise
+                time.sleep(0.05 * (attempt + 1))
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    _fsync_dir(path.parent)
+
+
+def _fsync_dir(path: Path):
+    """Persist a rename in ``path``; a no-op where directories can't be opened (Windows)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
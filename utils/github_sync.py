@@ -1,19 +1,85 @@
 import os
 import base64
+import hashlib
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from .token_fragments import assemble_token
 
+
+def git_blob_sha(data: bytes):
+    """The SHA git (and the GitHub API) reports for a file with these bytes."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _local_sha(path: Path):
+    """git_blob_sha of the file at ``path``, or None if there is none."""
+    try:
+        return git_blob_sha(path.read_bytes())
+    except FileNotFoundError:
+        return None
+
+
 class GithubSync:
     """
     Best-effort GitHub file pusher. If no token present or network fails,
     it simply no-ops (app keeps working offline with local JSON files).
+
+    ``locks`` (optional) is a LockManager; files are read for a push under
+    their read lock and swapped in after a pull under their write lock.
+
+    Requests go through one pooled keep-alive ``requests.Session`` that
+    retries idempotent calls with backoff. The blob SHA of every remote file
+    we have seen is cached, so a push needs no GET for the SHA and is skipped
+    outright when the local bytes hash to the same blob.
     """
-    def __init__(self, repo_owner: str, repo_name: str, path_prefix: str = ""):
+    API = "https://api.github.com"
+
+    def __init__(self, repo_owner: str, repo_name: str, path_prefix: str = "", locks=None,
+                 branch: str = None, pull_workers: int = 4, pull_interval: float = 30,
+                 on_response=None):
         self.repo_owner = repo_owner
         self.repo_name = repo_name
         self.path_prefix = (path_prefix or "").strip("/")
+        self.locks = locks
+        self.branch = branch  # None: the repo's default branch, looked up once
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset({"GET", "HEAD"}), respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.hooks["response"].append(self._count)
+        self.on_response = on_response  # called with every response (metrics)
+        self._shas = {}          # remote path -> blob sha last seen on GitHub (None: absent)
+        self._headers = None     # (env token, headers) memo
+        self._lock = threading.Lock()
+        self.pull_workers = pull_workers
+        self.pull_interval = pull_interval
+        self._listing_etag = None
+        self._pull_cv = threading.Condition()
+        self._pulling = False
+        self._last_pull = 0.0
+        self.counters = {"requests": 0, "pushed": 0, "skipped": 0, "commits": 0, "conflicts": 0}
+
+    def _count(self, r, *args, **kwargs):
+        self.counters["requests"] += 1
+        if self.on_response is not None:
+            try:
+                self.on_response(r)
+            except Exception:
+                pass
+
+    def _read_lock(self, name):
+        return self.locks.read(name) if self.locks else nullcontext()
+
+    def _write_lock(self, name):
+        return self.locks.write(name) if self.locks else nullcontext()
 
     def _token(self):
         # 1) direct env var (recommended)
@@ -25,14 +91,28 @@ class GithubSync:
         return t
 
     def _gh_headers(self):
+        env = os.environ.get("GITHUB_TOKEN")
+        memo = self._headers
+        if memo is not None and memo[0] == env:
+            return memo[1]
         tok = self._token()
-        if not tok:
-            return None
-        return {
-            "Authorization": f"Bearer {tok}",
-            "Accept": "application/vnd.github+json",
-            "X-GitHub-Api-Version": "2022-11-28"
-        }
+        headers = None
+        if tok:
+            headers = {
+                "Authorization": f"Bearer {tok}",
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28"
+            }
+        self._headers = (env, headers)
+        return headers
+
+    def enabled(self):
+        """True if a token is configured (pushes and pulls are attempted)."""
+        return self._gh_headers() is not None
+
+    def _forget_auth(self, r):
+        if r.status_code == 401:
+            self._headers = None  # re-read the token next time
 
     def _remote_path_for(self, local_file: Path):
         name = local_file.name
@@ -40,61 +120,212 @@ class GithubSync:
             return f"{self.path_prefix}/{name}"
         return name
 
-    def _get_sha(self, remote_path: str):
-        headers = self._gh_headers()
-        if not headers:
-            return None
-        url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/contents/{remote_path}"
-        r = requests.get(url, headers=headers, timeout=15)
-        if r.status_code == 200:
-            return r.json().get("sha")
-        return None
+    def _contents_url(self, remote_path=""):
+        base = f"{self.API}/repos/{self.repo_owner}/{self.repo_name}/contents"
+        return f"{base}/{remote_path}" if remote_path else base
 
-    def push_file(self, local_file: Path):
-        headers = self._gh_headers()
-        if not headers:
-            return  # offline / not configured
-        remote_path = self._remote_path_for(local_file)
-        url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/contents/{remote_path}"
-
-        content_b64 = base64.b64encode(local_file.read_bytes()).decode("utf-8")
-        sha = self._get_sha(remote_path)
-
-        payload = {
-            "message": f"Sync {local_file.name}",
-            "content": content_b64,
-        }
-        if sha:
-            payload["sha"] = sha
-
-        r = requests.put(url, headers=headers, json=payload, timeout=20)
-        # Silently ignore failures; app is still fine offline
-        if r.status_code not in (200, 201):
-            # print for debugging
-            print(f"[SYNC] {remote_path} -> {r.status_code}: {r.text[:200]}")
-
-    def pull_all(self, local_dir: Path):
-        """Download all files from the remote path prefix into ``local_dir``."""
+    def _repo_url(self, path=""):
+        base = f"{self.API}/repos/{self.repo_owner}/{self.repo_name}"
+        return f"{base}/{path}" if path else base
+
+    def _api(self, method, path, headers, **kwargs):
+        r = self.session.request(method, self._repo_url(path), headers=headers, timeout=20, **kwargs)
+        self._forget_auth(r)
+        return r
+
+    def remember_sha(self, remote_path: str, sha):
+        with self._lock:
+            self._shas[remote_path] = sha or None
+
+    def remote_sha(self, local_file: Path):
+        """Blob SHA GitHub last reported for ``local_file`` (None: absent or unknown)."""
+        with self._lock:
+            return self._shas.get(self._remote_path_for(local_file))
+
+    def _list_remote(self, headers):
+        """Cache the blob SHA of every file under the path prefix (one request)."""
+        r = self.session.get(self._contents_url(self.path_prefix), headers=headers, timeout=20)
+        self._forget_auth(r)
+        if r.status_code == 404:
+            return
+        r.raise_for_status()
+        for item in r.json():
+            if item.get("type") == "file":
+                self.remember_sha(item["path"], item.get("sha"))
+
+    def _branch_name(self, headers):
+        if self.branch is None:
+            r = self._api("GET", "", headers)
+            r.raise_for_status()
+            self.branch = r.json().get("default_branch") or "main"
+        return self.branch
+
+    def push_files(self, local_files, message: str = None):
+        """
+        Commit ``local_files`` to GitHub as a single commit through the Git
+        Data API (tree -> commit -> ref update). A file missing locally is
+        deleted from the repo; files GitHub already has byte-for-byte are left
+        out. If the branch moves meanwhile, the commit is rebuilt on the new
+        head. Returns the remote paths changed ([] if there was nothing to do).
+        """
         headers = self._gh_headers()
         if not headers:
-            return  # offline / not configured
+            return []  # offline / not configured
+        remote = {f: self._remote_path_for(f) for f in local_files}
+        with self._lock:
+            unknown = any(rp not in self._shas for rp in remote.values())
+        if unknown:
+            self._list_remote(headers)
+            with self._lock:
+                for rp in remote.values():
+                    self._shas.setdefault(rp, None)
+
+        entries, new_shas = [], {}
+        for f, rp in remote.items():
+            try:
+                with self._read_lock(f.name):
+                    data = f.read_bytes()
+            except FileNotFoundError:
+                if self._shas.get(rp):
+                    entries.append({"path": rp, "mode": "100644", "type": "blob", "sha": None})
+                    new_shas[rp] = None
+                continue
+            blob = git_blob_sha(data)
+            if self._shas.get(rp) == blob:
+                self.counters["skipped"] += 1
+                continue
+            entry = {"path": rp, "mode": "100644", "type": "blob"}
+            try:
+                entry["content"] = data.decode("utf-8")  # created inline with the tree
+            except UnicodeDecodeError:
+                r = self._api("POST", "git/blobs", headers, json={
+                    "content": base64.b64encode(data).decode("utf-8"), "encoding": "base64"})
+                r.raise_for_status()
+                entry["sha"] = r.json()["sha"]
+            entries.append(entry)
+            new_shas[rp] = blob
+        if not entries:
+            return []
 
-        base = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/contents"
-        url = f"{base}/{self.path_prefix}" if self.path_prefix else base
+        if message is None:
+            names = [rp.rsplit("/", 1)[-1] for rp in new_shas]
+            message = "Sync " + (", ".join(names) if len(names) <= 3 else f"{len(names)} files")
+        branch = self._branch_name(headers)
+        for attempt in range(3):
+            r = self._api("GET", f"git/ref/heads/{branch}", headers)
+            r.raise_for_status()
+            head = r.json()["object"]["sha"]
+            r = self._api("GET", f"git/commits/{head}", headers)
+            r.raise_for_status()
+            base_tree = r.json()["tree"]["sha"]
+            r = self._api("POST", "git/trees", headers, json={"base_tree": base_tree, "tree": entries})
+            r.raise_for_status()
+            tree = r.json()["sha"]
+            if tree != base_tree:
+                r = self._api("POST", "git/commits", headers, json={
+                    "message": message, "tree": tree, "parents": [head]})
+                r.raise_for_status()
+                r = self._api("PATCH", f"git/refs/heads/{branch}", headers, json={
+                    "sha": r.json()["sha"], "force": False})
+                if r.status_code == 422 and attempt < 2:
+                    self.counters["conflicts"] += 1
+                    continue  # not a fast-forward: someone else committed first
+                r.raise_for_status()
+                self.counters["commits"] += 1
+            for rp, sha in new_shas.items():
+                self.remember_sha(rp, sha)
+            self.counters["pushed"] += len(new_shas)
+            return list(new_shas)
+        return []
 
+    def pull_all(self, local_dir: Path, skip=None):
+        """
+        Bring ``local_dir`` up to date with the remote path prefix; returns the
+        local paths written.
+
+        Only files whose remote blob SHA differs from the local bytes are
+        downloaded, concurrently (``pull_workers``), each verified and swapped
+        in by atomic rename. ``skip(name)`` marks files with local edits not
+        pushed yet; those are left alone, including ones edited while their
+        download was running (checked again under the file's write lock). The listing is conditional
+        (If-None-Match), and calls within ``pull_interval`` seconds of the last
+        pull, or while one is running, share it instead of starting another.
+        """
+        with self._pull_cv:
+            if self._pulling:
+                while self._pulling:
+                    self._pull_cv.wait()
+                return []  # someone else just pulled for us
+            if time.time() - self._last_pull < self.pull_interval:
+                return []
+            self._pulling = True
         try:
-            r = requests.get(url, headers=headers, timeout=20)
-            if r.status_code != 200:
-                return
-            for item in r.json():
-                if item.get("type") != "file":
-                    continue
-                name = item.get("name")
-                download_url = item.get("download_url")
-                if not name or not download_url:
-                    continue
-                resp = requests.get(download_url, headers=headers, timeout=20)
-                if resp.status_code == 200:
-                    (local_dir / name).write_bytes(resp.content)
+            return self._pull(local_dir, skip)
         except Exception as e:
             print("[SYNC] pull failed:", e)
+            return []
+        finally:
+            with self._pull_cv:
+                self._pulling = False
+                self._last_pull = time.time()
+                self._pull_cv.notify_all()
+
+    def _pull(self, local_dir: Path, skip):
+        headers = self._gh_headers()
+        if not headers:
+            return []  # offline / not configured
+        h = dict(headers)
+        if self._listing_etag:
+            h["If-None-Match"] = self._listing_etag
+        r = self.session.get(self._contents_url(self.path_prefix), headers=h, timeout=20)
+        self._forget_auth(r)
+        if r.status_code == 304:
+            return []  # nothing changed remotely since the last listing
+        if r.status_code != 200:
+            return []
+
+        todo = []
+        for item in r.json():
+            if item.get("type") != "file":
+                continue
+            name = item.get("name")
+            if not name or not item.get("download_url"):
+                continue
+            self.remember_sha(item["path"], item.get("sha"))
+            local = _local_sha(local_dir / name)
+            if local == item.get("sha"):
+                continue
+            if skip and skip(name):
+                print(f"[SYNC] pull: keeping unpushed local {name}")
+                continue
+            todo.append((item, local))
+
+        def fetch(todo_item):
+            item, local = todo_item
+            resp = self.session.get(item["download_url"], headers=headers, timeout=20)
+            if resp.status_code != 200 or git_blob_sha(resp.content) != item.get("sha"):
+                print(f"[SYNC] pull: {item['name']} -> {resp.status_code}")
+                return None
+            # stage next to the target, then swap in atomically under the file's lock
+            dest = local_dir / item["name"]
+            tmp = local_dir / f".{item['name']}.pull"
+            tmp.write_bytes(resp.content)
+            with self._write_lock(item["name"]):
+                # edited locally while downloading: keep the edit, it gets pushed
+                if (skip and skip(item["name"])) or _local_sha(dest) != local:
+                    print(f"[SYNC] pull: keeping local {item['name']} changed during the pull")
+                    tmp.unlink(missing_ok=True)
+                    return None
+                os.replace(tmp, dest)
+            return dest
+
+        written = []
+        if todo:
+            with ThreadPoolExecutor(max_workers=min(self.pull_workers, len(todo))) as pool:
+                written = [d for d in pool.map(fetch, todo) if d is not None]
+        if len(written) == len(todo):
+            self._listing_etag = r.headers.get("ETag")  # only once everything listed is local
+        return written
+
+    def stats(self):
+        return dict(self.counters, cached_shas=len(self._shas))
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: single-process mode only
+    fcntl = None
+
+
+def _open_lock_file(path: Path):
+    return os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+
+@contextmanager
+def flocked(path: Path, shared=False):
+    """
+    Hold an OS-level lock on ``path`` (created if missing) for the block.
+    Each call opens its own descriptor, so it excludes other threads of
+    this process as well as other processes.
+    """
+    fd = _open_lock_file(path)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # releases the lock
+
+
+def try_flock(path: Path):
+    """
+    Take an exclusive lock on ``path`` without waiting. Returns the open
+    descriptor (the lock lasts until it is closed, or the process exits) or
+    None if another process holds it.
+    """
+    fd = _open_lock_file(path)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class RWLock:
+    """
+    Reader-writer lock. Any number of readers may hold it at once; a writer
+    holds it alone. Waiting writers block new readers so a steady stream of
+    reads cannot starve a save.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+class LockManager:
+    """
+    One RWLock per key (a data file name), created on first use, plus wait
+    and hold timings per key and mode for ``stats()``.
+
+    With ``lock_dir`` set, every hold is also an OS lock (shared for read,
+    exclusive for write) on ``lock_dir/<key>.lock``, so several processes
+    working on the same data files exclude each other too.
+    """
+    def __init__(self, lock_dir: Path = None):
+        self._locks = {}
+        self._guard = threading.Lock()
+        self._stats = {}
+        self.lock_dir = lock_dir
+        if lock_dir is not None:
+            if fcntl is None:
+                raise RuntimeError("cross-process file locks need fcntl (POSIX)")
+            Path(lock_dir).mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _os_lock(self, key, shared):
+        if self.lock_dir is None:
+            yield
+        else:
+            with flocked(Path(self.lock_dir) / f"{key}.lock", shared=shared):
+                yield
+
+    def _lock(self, key):
+        with self._guard:
+            lk = self._locks.get(key)
+            if lk is None:
+                lk = self._locks[key] = RWLock()
+            return lk
+
+    @contextmanager
+    def read(self, key):
+        lk = self._lock(key)
+        t0 = time.perf_counter()
+        lk.acquire_read()
+        t1 = t0
+        try:
+            with self._os_lock(key, shared=True):
+                t1 = time.perf_counter()
+                yield
+        finally:
+            lk.release_read()
+            self._record(key, "read", t1 - t0, time.perf_counter() - t1)
+
+    @contextmanager
+    def write(self, key):
+        lk = self._lock(key)
+        t0 = time.perf_counter()
+        lk.acquire_write()
+        t1 = t0
+        try:
+            with self._os_lock(key, shared=False):
+                t1 = time.perf_counter()
+                yield
+        finally:
+            lk.release_write()
+            self._record(key, "write", t1 - t0, time.perf_counter() - t1)
+
+    def _record(self, key, mode, wait, hold):
+        with self._guard:
+            s = self._stats.get((key, mode))
+            if s is None:
+                s = self._stats[(key, mode)] = {
+                    "count": 0, "wait_total": 0.0, "wait_max": 0.0,
+                    "hold_total": 0.0, "hold_max": 0.0,
+                }
+            s["count"] += 1
+            s["wait_total"] += wait
+            s["hold_total"] += hold
+            s["wait_max"] = max(s["wait_max"], wait)
+            s["hold_max"] = max(s["hold_max"], hold)
+
+    def stats(self):
+        """Return {key: {mode: {count, wait_total, wait_max, hold_total, hold_max}}} in seconds."""
+        out = {}
+        with self._guard:
+            for (key, mode), s in self._stats.items():
+                out.setdefault(key, {})[mode] = dict(s)
+        return out
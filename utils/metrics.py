@@ -0,0 +1,137 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# seconds; suits both sub-millisecond cache hits and multi-second file loads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}"
+                                for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            h = self._values.get(label_values)
+            if h is None:
+                h = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            h[0][bisect.bisect_left(self.buckets, value)] += 1
+            h[1] += value
+            h[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *label_values)
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        lines = self.header()
+        for k, (counts, total, n) in items:
+            acc = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, k, [('le', _fmt_value(bound))])} {acc}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, k)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, k)} {n}")
+        return lines
+
+
+class Registry:
+    """
+    A minimal Prometheus text-format registry. Metrics are created once and
+    updated in place; ``collector`` functions are called at scrape time for
+    values that already live elsewhere (lock stats, queue depth, ...).
+    """
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, m):
+        self._metrics.append(m)
+        return m
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collector(self, fn):
+        """Register ``fn() -> iterable of metrics`` (fresh Gauge/Counter objects)."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for m in self._metrics:
+            lines += m.render()
+        for fn in self._collectors:
+            try:
+                for m in fn():
+                    lines += m.render()
+            except Exception as e:
+                lines.append(f"# collector {getattr(fn, '__name__', '?')} failed: {e}")
+        return "\n".join(lines) + "\n"
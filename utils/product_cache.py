@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+class ProductCache:
+    """
+    In-process cache of parsed ``products_<wh>.json`` files (app.py stores a
+    ProductIndex per file).
+
+    Each entry is stamped with the (mtime_ns, size, inode) of the file it
+    was read from. A stamp mismatch on lookup means the file changed on disk
+    (e.g. a GitHub pull, or another worker process, replaced it) and the
+    entry is dropped. The cache is bounded by the estimated memory of its
+    entries (ProductIndex.approx_bytes()) and evicts the least recently used
+    warehouse first. A max_bytes of 0 disables it.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (stamp, weight, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._oversized = set()  # keys already reported as bigger than max_bytes
+
+    @staticmethod
+    def stamp(path: Path):
+        """Return the freshness stamp for ``path`` or None if it is missing."""
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def get(self, key, stamp):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and stamp is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def peek(self, key, stamp):
+        """Like get() but without touching LRU order or hit/miss counts."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and stamp is not None and entry[0] == stamp:
+                return entry[2]
+            return None
+
+    def put(self, key, stamp, value, weight: int):
+        """
+        Cache ``value``, which takes about ``weight`` bytes of memory. An
+        entry bigger than max_bytes on its own is still kept, alone: the
+        alternative is re-parsing that warehouse on every request.
+        """
+        if stamp is None or self.max_bytes <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (stamp, weight, value)
+            self._bytes += weight
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+            warn = weight > self.max_bytes and key not in self._oversized
+            if warn:
+                self._oversized.add(key)
+        if warn:
+            print(f"[CACHE] {key} needs ~{weight >> 20} MB, over the {self.max_bytes >> 20} MB "
+                  f"cache bound; caching it alone")
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+            elif key in self._entries:
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _drop(self, key):
+        _, weight, _ = self._entries.pop(key)
+        self._bytes -= weight
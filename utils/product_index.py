@@ -0,0 +1,348 @@
+import heapq
+import threading
+import uuid
+from collections import OrderedDict
+from itertools import compress
+
+MAX_VIEWS = 16  # memoized filter/sort results kept per warehouse
+MAX_TOMBSTONES = 1000  # deletions remembered for changes_since()
+# memory per product once parsed and indexed (dict, strings, lookups); measured
+# at ~1.9 KB with bench/synth.py data, about 7x its share of the JSON file
+PRODUCT_BYTES = 2048
+
+# stock bucket codes, as stored in ProductIndex.stock
+STOCK_BUCKETS = ("optimal", "under_min", "over_max")
+OPTIMAL, UNDER_MIN, OVER_MAX = range(3)
+# bytes.translate tables turning the stock column into a 0/1 mask per bucket
+_BUCKET_MASKS = [bytes(int(c == code) for c in range(256)) for code in range(len(STOCK_BUCKETS))]
+
+
+def new_id():
+    """A fresh product ``id``: 16 random hex digits."""
+    return uuid.uuid4().hex[:16]
+
+
+def is_id(value):
+    """True if ``value`` is shaped like a ``new_id()`` (clients may pick ids for offline adds)."""
+    return isinstance(value, str) and len(value) == 16 and all(c in "0123456789abcdef" for c in value)
+
+
+def ensure_ids(products):
+    """
+    Give every product that lacks one (or shares it with an earlier product)
+    a fresh ``id``, and a ``version`` of 1 where it has none. Returns how
+    many products were changed; files from before product IDs get all of
+    theirs here, on first load.
+    """
+    seen = set()
+    changed = 0
+    for p in products:
+        pid, version = p.get("id"), p.get("version")
+        fix = not (isinstance(pid, str) and pid) or pid in seen
+        if fix:
+            pid = p["id"] = new_id()
+        if not (type(version) is int and version > 0):
+            p["version"] = 1
+            fix = True
+        seen.add(pid)
+        changed += fix
+    return changed
+
+
+def _keys_of(p):
+    """(barcode, name key, bin) exactly as they are indexed."""
+    return (
+        (p.get("barcode") or "").strip(),
+        ((p.get("internal_name") or "").strip().lower(),
+         (p.get("customer_name") or "").strip().lower()),
+        (p.get("bin") or "").strip().upper(),
+    )
+
+
+def _stock_of(p):
+    """
+    (qty, min, max, bucket code) for a product. Values that are not integers
+    count as 0 and put the product in 'optimal'.
+    """
+    qty, mn, mx = p.get("qty", 0), p.get("min", 0), p.get("max", 0)
+    if not (type(qty) is int and type(mn) is int and type(mx) is int):
+        try:
+            qty, mn, mx = int(qty), int(mn), int(mx)
+        except (TypeError, ValueError, OverflowError):
+            return 0, 0, 0, OPTIMAL
+    code = UNDER_MIN if qty < mn else OVER_MAX if qty > mx else OPTIMAL
+    return qty, mn, mx, code
+
+
+class ProductIndex:
+    """
+    A warehouse's product list plus secondary indexes on it:
+    barcode -> positions, lowercased (internal_name, customer_name) -> positions,
+    and upper-cased bin -> positions. Positions are list indexes into
+    ``products``; the API addresses products by their ``id`` instead, which
+    ``by_id`` maps to the current position.
+
+    Alongside sits ``stock``, a bytearray of each position's STOCK_BUCKETS
+    code, so stock filters never go back to the dicts; ``bucket_counts`` and
+    ``total_qty`` are kept in step with it for ``summary``. Quantities
+    themselves are only read from the dicts.
+
+    The indexes are kept in step with single adds/updates/deletes via
+    ``add``/``reindex``/``delete`` instead of being rebuilt; callers change
+    ``products`` first, replacing a changed product rather than editing it,
+    and pass the old dict along.
+    Every change bumps ``version`` and drops the memoized ``view`` results.
+
+    ``revision`` is the persisted, monotonically increasing warehouse revision;
+    products carry the revision they last changed at in ``rev``, and deletions
+    since ``tombstone_floor`` are remembered as (rev, id) tombstones.
+    """
+    def __init__(self, products):
+        self.products = products
+        self.by_barcode = {}
+        self.by_key = {}
+        self.by_bin = {}
+        self._keys = []  # position -> keys the product is indexed under
+        for i, p in enumerate(products):
+            self._insert(i, _keys_of(p))
+        self._ids = [p.get("id") for p in products]  # position -> id
+        self.by_id = {pid: i for i, pid in enumerate(self._ids)}
+        qty, _, _, stock = zip(*map(_stock_of, products)) if products else ((),) * 4
+        self.stock = bytearray(stock)
+        self.bucket_counts = [self.stock.count(code) for code in range(len(STOCK_BUCKETS))]
+        self.total_qty = sum(qty)
+        self.version = 0
+        self._views = OrderedDict()
+        self._views_lock = threading.Lock()
+        self.revision = 0
+        self.tombstones = []  # [(rev, deleted product id)]
+        self.tombstone_floor = 0
+
+    def copy(self):
+        """
+        An independent index over a copy of the product list (the product
+        dicts themselves are shared), cloned structure by structure rather
+        than rebuilt: O(n), so only for work that may be dropped half-way
+        (atomic batches, imports) or needs the index for a long time.
+        """
+        new = ProductIndex.__new__(ProductIndex)
+        new.products = list(self.products)
+        new.by_barcode, new.by_key, new.by_bin = (
+            {k: set(v) for k, v in m.items()} for m in self._maps())
+        new._keys = list(self._keys)
+        new._ids = list(self._ids)
+        new.by_id = dict(self.by_id)
+        new.stock = bytearray(self.stock)
+        new.bucket_counts = list(self.bucket_counts)
+        new.total_qty = self.total_qty
+        new.version = self.version
+        new._views = OrderedDict()
+        new._views_lock = threading.Lock()
+        new.revision = self.revision
+        new.tombstones = list(self.tombstones)
+        new.tombstone_floor = self.tombstone_floor
+        return new
+
+    def load_meta(self, doc):
+        """Pick up revision/tombstones saved in a snapshot by ``meta()``."""
+        self.revision = doc.get("revision", 0)
+        self.tombstone_floor = doc.get("tombstone_floor", 0)
+        self.tombstones = []
+        for t in doc.get("tombstones", []):
+            if "id" in t:
+                self.tombstones.append((t["rev"], t["id"]))
+            else:  # name-keyed, from before product IDs: too old to answer
+                self.tombstone_floor = max(self.tombstone_floor, t["rev"])
+        self.tombstones = [(r, pid) for r, pid in self.tombstones if r > self.tombstone_floor]
+
+    def meta(self):
+        return {
+            "revision": self.revision,
+            "tombstone_floor": self.tombstone_floor,
+            "tombstones": [{"rev": r, "id": pid} for r, pid in self.tombstones],
+        }
+
+    def approx_bytes(self):
+        """Estimated memory held by this index, for the product cache's bound."""
+        return len(self.products) * PRODUCT_BYTES
+
+    def name_key_at(self, i):
+        return list(self._keys[i][1])
+
+    def id_at(self, i):
+        return self._ids[i]
+
+    def bump(self, rev, deleted_id=None):
+        """Advance to revision ``rev``, remembering ``deleted_id`` if one was deleted."""
+        self.revision = max(self.revision, rev)
+        if deleted_id is not None:
+            self.tombstones.append((rev, deleted_id))
+            if len(self.tombstones) > MAX_TOMBSTONES:
+                dropped = self.tombstones[:-MAX_TOMBSTONES]
+                self.tombstones = self.tombstones[-MAX_TOMBSTONES:]
+                self.tombstone_floor = dropped[-1][0]
+
+    def reset_to(self, rev):
+        """Advance to ``rev`` after a bulk change: clients older than it must refetch."""
+        self.revision = self.tombstone_floor = max(self.revision, rev)
+        self.tombstones = []
+
+    def changes_since(self, since):
+        """
+        Return (changed_positions, deleted_ids) since revision ``since``, or
+        None if that is too old (or from elsewhere) to answer incrementally.
+        """
+        if since < self.tombstone_floor or since > self.revision:
+            return None
+        changed = [i for i, p in enumerate(self.products) if (p.get("rev") or 0) > since]
+        deleted = [k for r, k in self.tombstones if r > since]
+        return changed, deleted
+
+    def _touch(self):
+        with self._views_lock:
+            self.version += 1
+            self._views.clear()
+
+    def view(self, key, build):
+        """
+        Return ``build()`` (typically a list of positions), memoized under
+        ``key`` until the next change so paging through the same filter/sort
+        does not redo it per request.
+        """
+        with self._views_lock:
+            version = self.version
+            v = self._views.get(key)
+            if v is not None:
+                self._views.move_to_end(key)
+                return v
+        v = build()
+        with self._views_lock:
+            if self.version == version:
+                self._views[key] = v
+                if len(self._views) > MAX_VIEWS:
+                    self._views.popitem(last=False)
+        return v
+
+    def in_stock_bucket(self, bucket):
+        """Positions in stock ``bucket`` ('under_min', ...), ascending."""
+        if bucket not in STOCK_BUCKETS:
+            return []
+        mask = self.stock.translate(_BUCKET_MASKS[STOCK_BUCKETS.index(bucket)])
+        return list(compress(range(len(mask)), mask))
+
+    def summary(self):
+        """Product count, count per stock bucket, unbarcoded count and total qty."""
+        out = {"products": len(self.products), "unbarcoded": len(self.by_barcode.get("", ())),
+               "total_qty": self.total_qty}
+        out.update(zip(STOCK_BUCKETS, self.bucket_counts))
+        return out
+
+    def shortfalls(self, limit):
+        """Up to ``limit`` (position, qty, min) of under-min products, largest ``min - qty`` first."""
+        rows = ((i,) + _stock_of(self.products[i])[:2] for i in self.in_stock_bucket("under_min"))
+        return heapq.nlargest(limit, rows, key=lambda r: r[2] - r[1])
+
+    # ---- maintenance ----
+    def _maps(self):
+        return (self.by_barcode, self.by_key, self.by_bin)
+
+    def _insert(self, i, keys):
+        for m, k in zip(self._maps(), keys):
+            m.setdefault(k, set()).add(i)
+        if i == len(self._keys):
+            self._keys.append(keys)
+        else:
+            self._keys[i] = keys
+
+    def _set_stock(self, i, p, old=None):
+        qty, _, _, code = _stock_of(p)
+        if i == len(self.stock):
+            self.stock.append(code)
+        else:
+            self.bucket_counts[self.stock[i]] -= 1
+            self.total_qty -= _stock_of(old)[0]
+            self.stock[i] = code
+        self.bucket_counts[code] += 1
+        self.total_qty += qty
+
+    def _remove(self, i, keys):
+        for m, k in zip(self._maps(), keys):
+            s = m.get(k)
+            if s is not None:
+                s.discard(i)
+                if not s:
+                    del m[k]
+
+    def _set_id(self, i, pid):
+        if i == len(self._ids):
+            self._ids.append(pid)
+        else:
+            if self.by_id.get(self._ids[i]) == i:
+                del self.by_id[self._ids[i]]
+            self._ids[i] = pid
+        self.by_id[pid] = i
+
+    def add(self):
+        """Index the product just appended to ``products``."""
+        i = len(self._keys)
+        self._insert(i, _keys_of(self.products[i]))
+        self._set_stock(i, self.products[i])
+        self._set_id(i, self.products[i].get("id"))
+        self._touch()
+
+    def reindex(self, i, old):
+        """Refresh position ``i`` after its product ``old`` was replaced in ``products``."""
+        keys = _keys_of(self.products[i])
+        if keys != self._keys[i]:
+            self._remove(i, self._keys[i])
+            self._insert(i, keys)
+        self._set_stock(i, self.products[i], old)
+        if self.products[i].get("id") != self._ids[i]:
+            self._set_id(i, self.products[i].get("id"))
+        self._touch()
+
+    def delete(self, i, old):
+        """Drop position ``i`` (product ``old``, already popped from ``products``) and shift the rest down."""
+        self._remove(i, self._keys[i])
+        for j in range(i + 1, len(self._keys)):
+            for m, k in zip(self._maps(), self._keys[j]):
+                s = m[k]
+                s.discard(j)
+                s.add(j - 1)
+            self.by_id[self._ids[j]] = j - 1
+        self._keys.pop(i)
+        if self.by_id.get(self._ids[i]) == i:
+            del self.by_id[self._ids[i]]
+        self._ids.pop(i)
+        self.bucket_counts[self.stock[i]] -= 1
+        self.total_qty -= _stock_of(old)[0]
+        del self.stock[i]
+        self._touch()
+
+    # ---- lookups ----
+    def position_of(self, pid):
+        """Current position of the product with ``id`` ``pid``, or None."""
+        return self.by_id.get(pid) if isinstance(pid, str) else None
+
+    def get(self, pid):
+        """The product with ``id`` ``pid``, or None."""
+        i = self.position_of(pid)
+        return None if i is None else self.products[i]
+
+    def find_barcode(self, code):
+        """Positions carrying ``code`` (stripped), ascending."""
+        return sorted(self.by_barcode.get((code or "").strip(), ()))
+
+    def find_key(self, internal_name, customer_name):
+        """First position with this (case-insensitive) name pair, or None."""
+        s = self.by_key.get(((internal_name or "").strip().lower(),
+                             (customer_name or "").strip().lower()))
+        return min(s) if s else None
+
+    def in_bin(self, bin_name):
+        return sorted(self.by_bin.get((bin_name or "").strip().upper(), ()))
+
+    def duplicate_barcodes(self):
+        """{barcode: [positions]} for every non-empty barcode on more than one product."""
+        return {code: sorted(pos) for code, pos in list(self.by_barcode.items())
+                if code and len(pos) > 1}
@@ -0,0 +1,80 @@
+import json
+from pathlib import Path
+
+
+def apply_record(products: list, rec: dict):
+    """Apply one journal record to ``products`` in place."""
+    op = rec.get("op")
+    i = rec.get("index")
+    if op == "add":
+        products.append(rec["product"])
+    elif op == "update" and isinstance(i, int) and 0 <= i < len(products):
+        products[i] = rec["product"]
+    elif op == "delete" and isinstance(i, int) and 0 <= i < len(products):
+        products.pop(i)
+
+
+class ProductJournal:
+    """
+    Append-only log of single-product mutations for one warehouse.
+
+    Each line is a JSON record ``{"seq": n, "rev": r, "op": "add"|"update"|"delete",
+    "index": i, "id": pid, "product": {...}}``. The snapshot remembers the
+    last folded ``seq`` (``journal_seq``), and replay skips anything at or
+    below it, so a crash between writing the snapshot and truncating the
+    journal cannot apply a change twice.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+
+    def extend(self, records):
+        """Append records (one or several) with a single write."""
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+
+    def records(self):
+        """Yield records in order, skipping a torn/garbled line."""
+        try:
+            f = open(self.path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def replay(self, products: list, after_seq: int = 0, on_record=None):
+        """
+        Apply records newer than ``after_seq``; return (last_seq, applied).
+        ``on_record`` is called with each applied record.
+        """
+        last, applied = after_seq, 0
+        for rec in self.records():
+            seq = rec.get("seq", 0)
+            if seq <= after_seq:
+                continue
+            apply_record(products, rec)
+            if on_record:
+                on_record(rec)
+            last, applied = seq, applied + 1
+        return last, applied
+
+    def last_seq(self):
+        """Highest ``seq`` in the journal, 0 if it is empty."""
+        return max((rec.get("seq", 0) for rec in self.records()), default=0)
+
+    def size(self):
+        try:
+            return self.path.stat().st_size
+        except OSError:
+            return 0
+
+    def clear(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
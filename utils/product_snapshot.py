@@ -0,0 +1,204 @@
+"""
+Compact columnar encoding of a products document ({"products": [...], ...}).
+
+Layout: MAGIC, a little-endian u32 header length, a JSON header, then the
+shape ids and one block per column. The header holds the non-product keys
+of the document, the product count, the columns (name, type) and the
+shapes: each distinct key order among the products, as column numbers.
+Blocks:
+
+    shapes  n x uint32 shape ids (left out when every product has one shape)
+    int     n x int64
+    str     u32 byte length + the column's distinct values, NUL-joined UTF-8,
+            then n x uint32 indexes into them
+    json    like str, but the distinct values are JSON-encoded (mixed types,
+            or strings containing NUL)
+
+Products lacking a key get a filler in its column, which their shape skips,
+so a decode gives back exactly the products that were encoded: same keys,
+in the same order, with their values' types intact. Repeated strings (bins,
+names' common words, empty codes) are stored and loaded once and shared
+between products. Files from the first version (MAGIC_V1, per-column
+presence masks instead of shapes) still decode.
+
+    python -m utils.product_snapshot to-json  products_X.snap products_X.json
+    python -m utils.product_snapshot from-json products_X.json products_X.snap
+"""
+import json
+import struct
+import sys
+from array import array
+from itertools import repeat
+from pathlib import Path
+
+MAGIC = b"INVSNAP2"
+MAGIC_V1 = b"INVSNAP1"
+_INT64 = (-(1 << 63), (1 << 63) - 1)
+
+
+def _column_type(values):
+    if all(type(v) is int and _INT64[0] <= v <= _INT64[1] for v in values):
+        return "int"
+    if all(type(v) is str for v in values):
+        return "str"
+    return "json"
+
+
+def _json_values(values):
+    """JSON-encode each value, encoding each distinct hashable value once."""
+    memo, out = {}, []
+    for v in values:
+        try:
+            key = (type(v), v)
+            s = memo.get(key)
+            if s is None:
+                s = memo[key] = json.dumps(v, separators=(",", ":"))
+        except TypeError:  # unhashable (dict/list)
+            s = json.dumps(v, separators=(",", ":"))
+        out.append(s)
+    return out
+
+
+def _le(a):
+    if sys.byteorder != "little":
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+
+def _from_le(typecode, data):
+    a = array(typecode)
+    a.frombytes(data)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a
+
+
+def encode(doc):
+    """Encode a products document to bytes (see module docstring)."""
+    products = doc.get("products", [])
+    n = len(products)
+    names, columns = [], {}
+    shapes, shape_ids = {}, array("I")
+    for p in products:
+        keys = tuple(p)
+        sid = shapes.get(keys)
+        if sid is None:
+            for k in keys:
+                if k not in columns:
+                    columns[k] = len(names)
+                    names.append(k)
+            sid = shapes[keys] = len(shapes)
+        shape_ids.append(sid)
+    header = {"count": n, "doc": {k: v for k, v in doc.items() if k != "products"},
+              "columns": [], "shapes": [[columns[k] for k in keys] for keys in shapes]}
+    blocks = [_le(shape_ids)] if len(shapes) > 1 else []
+    for name in names:
+        values = [p[name] for p in products if name in p]
+        kind = _column_type(values)
+        if kind == "str" and any("\0" in v for v in values):
+            kind = "json"
+        header["columns"].append({"name": name, "type": kind})
+        if len(values) < n:
+            values = [p.get(name, 0 if kind == "int" else "" if kind == "str" else None)
+                      for p in products]
+        if kind == "int":
+            blocks.append(_le(array("q", values)))
+            continue
+        if kind == "json":
+            values = _json_values(values)
+        table = {}
+        ids = array("I", [table.setdefault(v, len(table)) for v in values])
+        text = "\0".join(table).encode("utf-8")
+        blocks += [struct.pack("<I", len(text)), text, _le(ids)]
+    head = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return b"".join([MAGIC, struct.pack("<I", len(head)), head] + blocks)
+
+
+def _v1_shapes(n, masks):
+    """Shapes and shape ids equivalent to a first-version file's presence masks."""
+    if all(m is None for m in masks):
+        return [list(range(len(masks)))], None
+    shapes, shape_ids = {}, array("I")
+    for i in range(n):
+        keys = tuple(c for c, m in enumerate(masks) if m is None or m[i])
+        shape_ids.append(shapes.setdefault(keys, len(shapes)))
+    return [list(keys) for keys in shapes], shape_ids
+
+
+def decode(data):
+    """Decode bytes from ``encode`` back to the products document."""
+    version = data[:len(MAGIC)]
+    if version not in (MAGIC, MAGIC_V1):
+        raise ValueError("not a product snapshot")
+    pos = len(MAGIC) + 4
+    (hlen,) = struct.unpack_from("<I", data, len(MAGIC))
+    header = json.loads(data[pos:pos + hlen].decode("utf-8"))
+    pos += hlen
+    n = header["count"]
+    shapes, shape_ids = header.get("shapes"), None
+    if shapes is not None and len(shapes) > 1:
+        shape_ids = _from_le("I", data[pos:pos + 4 * n])
+        pos += 4 * n
+    names, columns, masks = [], [], []
+    for col in header["columns"]:
+        kind = col["type"]
+        mask = None
+        if col.get("masked"):
+            mask = data[pos:pos + n]
+            pos += n
+        if kind == "int":
+            values = _from_le("q", data[pos:pos + 8 * n]).tolist()
+            pos += 8 * n
+        else:
+            (tlen,) = struct.unpack_from("<I", data, pos)
+            pos += 4
+            table = data[pos:pos + tlen].decode("utf-8").split("\0")
+            pos += tlen
+            if kind == "json":
+                table = [json.loads(v) for v in table]
+            ids = _from_le("I", data[pos:pos + 4 * n])
+            pos += 4 * n
+            values = list(map(table.__getitem__, ids))
+        names.append(col["name"])
+        columns.append(values)
+        masks.append(mask)
+    if version == MAGIC_V1:
+        shapes, shape_ids = _v1_shapes(n, masks)
+    if shape_ids is None:
+        groups = [range(n)] if n else []
+    else:
+        groups = [[] for _ in shapes]
+        for i, sid in enumerate(shape_ids):
+            groups[sid].append(i)
+    products = [None] * n
+    for cols, positions in zip(shapes, groups):
+        keys = [names[c] for c in cols]
+        if shape_ids is None:
+            rows = zip(*(columns[c] for c in cols)) if cols else repeat((), n)
+            products = list(map(dict, map(zip, repeat(keys), rows)))
+            break
+        rows = zip(*(map(columns[c].__getitem__, positions) for c in cols)) if cols else repeat(())
+        for i, row in zip(positions, rows):
+            products[i] = dict(zip(keys, row))
+    doc = {"products": products}
+    doc.update(header["doc"])
+    return doc
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 3 or argv[0] not in ("to-json", "from-json"):
+        print(__doc__.strip().splitlines()[-2].strip())
+        print(__doc__.strip().splitlines()[-1].strip())
+        return 2
+    cmd, src, dst = argv[0], Path(argv[1]), Path(argv[2])
+    if cmd == "to-json":
+        dst.write_text(json.dumps(decode(src.read_bytes()), indent=2), encoding="utf-8")
+    else:
+        dst.write_bytes(encode(json.loads(src.read_text(encoding="utf-8"))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,387 @@
+import json
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+from .fileio import replace_file
+from .product_index import ensure_ids
+
+# Columns stored natively; anything else on a product round-trips through ``extra``.
+PRODUCT_FIELDS = ["id", "version", "internal_name", "customer_name", "internal_code",
+                  "customer_code", "bin", "qty", "min", "max", "barcode", "updated_at"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS warehouses (
+    pos INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    created_at INTEGER,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS products (
+    warehouse TEXT NOT NULL,
+    pos INTEGER NOT NULL,
+    id TEXT,
+    version INTEGER,
+    internal_name TEXT NOT NULL DEFAULT '',
+    customer_name TEXT NOT NULL DEFAULT '',
+    internal_code TEXT NOT NULL DEFAULT '',
+    customer_code TEXT NOT NULL DEFAULT '',
+    bin TEXT NOT NULL DEFAULT '',
+    qty INTEGER DEFAULT 0,
+    min INTEGER DEFAULT 0,
+    max INTEGER DEFAULT 0,
+    barcode TEXT NOT NULL DEFAULT '',
+    updated_at INTEGER,
+    extra TEXT,
+    bucket TEXT GENERATED ALWAYS AS (
+        CASE
+            WHEN typeof(qty) != 'integer' OR typeof(min) != 'integer'
+                 OR typeof(max) != 'integer' THEN 'optimal'
+            WHEN qty < min THEN 'under_min'
+            WHEN qty > max THEN 'over_max'
+            ELSE 'optimal'
+        END) VIRTUAL
+);
+CREATE TABLE IF NOT EXISTS revisions (
+    warehouse TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_products_pos ON products (warehouse, pos);
+CREATE INDEX IF NOT EXISTS ix_products_barcode ON products (warehouse, barcode);
+CREATE INDEX IF NOT EXISTS ix_products_bin ON products (warehouse, bin COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS ix_products_names ON products (
+    warehouse, internal_name COLLATE NOCASE, customer_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS ix_products_stock ON products (warehouse, qty, min, max);
+CREATE INDEX IF NOT EXISTS ix_products_bucket ON products (warehouse, bucket, pos);
+"""
+# after _migrate has added the id column to a database from before product IDs
+ID_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS ix_products_id ON products (warehouse, id)"
+
+SORTABLE = {"internal_name", "customer_name", "bin"}
+
+
+def _row_to_product(row):
+    p = {k: row[k] for k in PRODUCT_FIELDS}
+    if row["extra"]:
+        p.update(json.loads(row["extra"]))
+    return p
+
+
+def _extra_json(d, known):
+    extra = {k: v for k, v in d.items() if k not in known}
+    return json.dumps(extra) if extra else None
+
+
+def _product_params(warehouse, pos, p):
+    return (warehouse, pos, p.get("id"), p.get("version", 1),
+            p.get("internal_name") or "", p.get("customer_name") or "",
+            p.get("internal_code") or "", p.get("customer_code") or "",
+            p.get("bin") or "", p.get("qty", 0), p.get("min", 0), p.get("max", 0),
+            p.get("barcode") or "", p.get("updated_at"),
+            _extra_json(p, PRODUCT_FIELDS))
+
+
+_INSERT = ("INSERT INTO products (warehouse, pos, id, version, internal_name, customer_name, "
+           "internal_code, customer_code, bin, qty, min, max, barcode, updated_at, extra) "
+           "VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)")
+_SELECT = "SELECT " + ", ".join(PRODUCT_FIELDS) + ", extra, pos FROM products"
+
+
+class SqliteStore:
+    """
+    Products and warehouses in one SQLite database (WAL mode, one connection
+    per thread). Products keep their list position in ``pos``, so they come
+    back in the order of the JSON files, and are looked up by ``id``.
+    ``warehouse`` is the file key, i.e. the ``<wh>`` in ``products_<wh>.json``.
+
+    ``assigned_ids`` lists the warehouses whose products were only given ids
+    when this database was opened; their JSON exports are out of date.
+    """
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        self.assigned_ids = self._migrate()
+        self._conn().execute(ID_INDEX)
+
+    def _migrate(self):
+        """Add id/version to a database from before product IDs and fill them in."""
+        with self._tx() as c:
+            cols = {r["name"] for r in c.execute("PRAGMA table_info(products)")}
+            for col, kind in (("id", "TEXT"), ("version", "INTEGER")):
+                if col not in cols:
+                    c.execute(f"ALTER TABLE products ADD COLUMN {col} {kind}")
+            keys = [r[0] for r in c.execute(
+                "SELECT DISTINCT warehouse FROM products WHERE id IS NULL OR id = '' OR version IS NULL")]
+            # randomblob() is evaluated per row: 16 random hex digits, like new_id()
+            c.execute("UPDATE products SET id = lower(hex(randomblob(8))) WHERE id IS NULL OR id = ''")
+            c.execute("UPDATE products SET version = 1 WHERE version IS NULL")
+            for key in keys:
+                self._bump(c, key)
+        return keys
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _tx(self):
+        return _Transaction(self._conn())
+
+    @staticmethod
+    def _bump(c, warehouse):
+        # millisecond clock pushed past the previous value, like the JSON backend
+        c.execute("INSERT INTO revisions (warehouse, revision) VALUES (?, ?) "
+                  "ON CONFLICT(warehouse) DO UPDATE SET "
+                  "revision = max(revision + 1, excluded.revision)",
+                  (warehouse, int(time.time() * 1000)))
+
+    def revision(self, warehouse):
+        row = self._conn().execute("SELECT revision FROM revisions WHERE warehouse=?",
+                                   (warehouse,)).fetchone()
+        return row[0] if row else 0
+
+    # ---- warehouses ----
+    def load_warehouses(self):
+        out = []
+        for row in self._conn().execute("SELECT name, created_at, extra FROM warehouses ORDER BY pos"):
+            w = {"name": row["name"], "created_at": row["created_at"]}
+            if row["extra"]:
+                w.update(json.loads(row["extra"]))
+            out.append(w)
+        return out
+
+    def save_warehouses(self, warehouses):
+        with self._tx() as c:
+            c.execute("DELETE FROM warehouses")
+            c.executemany(
+                "INSERT INTO warehouses (pos, name, created_at, extra) VALUES (?,?,?,?)",
+                [(i, w.get("name", ""), w.get("created_at"), _extra_json(w, ("name", "created_at")))
+                 for i, w in enumerate(warehouses)])
+
+    # ---- products ----
+    def load_products(self, warehouse):
+        rows = self._conn().execute(_SELECT + " WHERE warehouse=? ORDER BY pos", (warehouse,))
+        return [_row_to_product(r) for r in rows]
+
+    def save_products(self, warehouse, products):
+        """Replace the warehouse's products; returns how many had to be given an id."""
+        assigned = ensure_ids(products)
+        with self._tx() as c:
+            c.execute("DELETE FROM products WHERE warehouse=?", (warehouse,))
+            c.executemany(_INSERT, (_product_params(warehouse, i, p) for i, p in enumerate(products)))
+            self._bump(c, warehouse)
+        return assigned
+
+    def delete_products(self, warehouse):
+        with self._tx() as c:
+            c.execute("DELETE FROM products WHERE warehouse=?", (warehouse,))
+
+    def apply_change(self, warehouse, op, index=None, product=None):
+        """Apply one add/update/delete without touching the other rows."""
+        self.apply_changes(warehouse, [(op, index, product)])
+
+    def apply_changes(self, warehouse, changes):
+        """Apply (op, index, product) changes in order, in one transaction."""
+        with self._tx() as c:
+            n = None
+            for op, index, product in changes:
+                if op == "add":
+                    if n is None:
+                        n = c.execute("SELECT COUNT(*) FROM products WHERE warehouse=?",
+                                      (warehouse,)).fetchone()[0]
+                    c.execute(_INSERT, _product_params(warehouse, n, product))
+                    n += 1
+                elif op == "update":
+                    c.execute("DELETE FROM products WHERE warehouse=? AND pos=?", (warehouse, index))
+                    c.execute(_INSERT, _product_params(warehouse, index, product))
+                elif op == "delete":
+                    c.execute("DELETE FROM products WHERE warehouse=? AND pos=?", (warehouse, index))
+                    c.execute("UPDATE products SET pos = pos - 1 WHERE warehouse=? AND pos > ?",
+                              (warehouse, index))
+                    if n is not None:
+                        n -= 1
+            self._bump(c, warehouse)
+
+    def query_products(self, warehouse, stock=None, sort=None):
+        """Filter by stock bucket and sort (case-insensitive) in SQL."""
+        sql, args = _SELECT + " WHERE warehouse=?", [warehouse]
+        if stock:
+            sql += " AND bucket=?"
+            args.append(stock)
+        if sort in SORTABLE:
+            sql += f" ORDER BY upper({sort}), pos"
+        else:
+            sql += " ORDER BY pos"
+        return [_row_to_product(r) for r in self._conn().execute(sql, args)]
+
+    def query_page(self, warehouse, stock=None, sort=None, q="", offset=0, limit=None):
+        """
+        Like query_products, plus a case-insensitive substring search ``q``
+        over names, codes, bin and barcode, and LIMIT/OFFSET paging.
+        Returns (total, [(pos, product), ...]).
+        """
+        where, args = " WHERE warehouse=?", [warehouse]
+        if stock:
+            where += " AND bucket=?"
+            args.append(stock)
+        if q:
+            cols = ["internal_name", "customer_name", "bin", "internal_code", "customer_code", "barcode"]
+            where += " AND (" + " OR ".join(f"instr(lower({c}), ?) > 0" for c in cols) + ")"
+            args += [q.lower()] * len(cols)
+        total = self._conn().execute("SELECT COUNT(*) FROM products" + where, args).fetchone()[0]
+        sql = _SELECT + where
+        sql += f" ORDER BY upper({sort}), pos" if sort in SORTABLE else " ORDER BY pos"
+        sql += " LIMIT ? OFFSET ?"
+        rows = self._conn().execute(sql, args + [-1 if limit is None else limit, offset])
+        return total, [(r["pos"], _row_to_product(r)) for r in rows]
+
+    def iter_products(self, warehouse, stock=None, bin_prefix="", barcoded=None, sort=None):
+        """Stream products matching stock bucket, bin prefix and barcoded filters off a cursor."""
+        sql, args = _SELECT + " WHERE warehouse=?", [warehouse]
+        if stock:
+            sql += " AND bucket=?"
+            args.append(stock)
+        if bin_prefix:
+            sql += " AND upper(substr(bin, 1, ?)) = ?"
+            args += [len(bin_prefix), bin_prefix.upper()]
+        if barcoded is not None:
+            sql += " AND barcode != ''" if barcoded else " AND barcode = ''"
+        sql += f" ORDER BY upper({sort}), pos" if sort in SORTABLE else " ORDER BY pos"
+        for r in self._conn().execute(sql, args):
+            yield _row_to_product(r)
+
+    def stock_summary(self, warehouse):
+        """Same shape as ProductIndex.summary()."""
+        row = self._conn().execute(
+            "SELECT COUNT(*), "
+            "COALESCE(SUM(trim(barcode) = ''), 0), "
+            "COALESCE(SUM(CASE WHEN typeof(qty) = 'integer' THEN qty ELSE 0 END), 0), "
+            "COALESCE(SUM(bucket = 'optimal'), 0), "
+            "COALESCE(SUM(bucket = 'under_min'), 0), "
+            "COALESCE(SUM(bucket = 'over_max'), 0) "
+            "FROM products WHERE warehouse=?", (warehouse,)).fetchone()
+        return dict(zip(["products", "unbarcoded", "total_qty", "optimal", "under_min", "over_max"], row))
+
+    def shortfalls(self, warehouse, limit):
+        """Up to ``limit`` under-min (pos, product) pairs, largest ``min - qty`` first."""
+        rows = self._conn().execute(
+            _SELECT + " WHERE warehouse=? AND bucket='under_min' ORDER BY min - qty DESC, pos LIMIT ?",
+            (warehouse, limit))
+        return [(r["pos"], _row_to_product(r)) for r in rows]
+
+    def get_product(self, warehouse, pid):
+        """Return (index, product) for the product with id ``pid``, or (None, None)."""
+        row = self._conn().execute(_SELECT + " WHERE warehouse=? AND id=?", (warehouse, pid)).fetchone()
+        if row is None:
+            return None, None
+        return row["pos"], _row_to_product(row)
+
+    def find_by_barcode(self, warehouse, code):
+        """Return (index, product) for the first product with ``code``, or (None, None)."""
+        row = self._conn().execute(
+            _SELECT + " WHERE warehouse=? AND barcode=? ORDER BY pos LIMIT 1",
+            (warehouse, code)).fetchone()
+        if row is None:
+            return None, None
+        return row["pos"], _row_to_product(row)
+
+    def barcode_ids(self, warehouse, code):
+        return [r[0] for r in self._conn().execute(
+            "SELECT id FROM products WHERE warehouse=? AND barcode=? ORDER BY pos",
+            (warehouse, code))]
+
+    def key_position(self, warehouse, internal_name, customer_name):
+        """First position with this (case-insensitive) name pair, or None."""
+        row = self._conn().execute(
+            "SELECT pos FROM products WHERE warehouse=? AND internal_name=? COLLATE NOCASE "
+            "AND customer_name=? COLLATE NOCASE ORDER BY pos LIMIT 1",
+            (warehouse, internal_name.strip(), customer_name.strip())).fetchone()
+        return row[0] if row else None
+
+    def duplicate_barcodes(self, warehouse):
+        """{barcode: [ids]} for every non-empty barcode on more than one product."""
+        out = {}
+        for r in self._conn().execute(
+                "SELECT barcode, id FROM products WHERE warehouse=? AND barcode != '' AND barcode IN "
+                "(SELECT barcode FROM products WHERE warehouse=? GROUP BY barcode HAVING COUNT(*) > 1) "
+                "ORDER BY barcode, pos", (warehouse, warehouse)):
+            out.setdefault(r[0], []).append(r[1])
+        return out
+
+    def product_keys(self):
+        return [r[0] for r in self._conn().execute("SELECT DISTINCT warehouse FROM products")]
+
+    # ---- JSON interop (keeps GithubSync's file layout working) ----
+    def import_json_file(self, path: Path):
+        """
+        Load one products_<wh>.json or warehouses.json into the database.
+        Returns how many products had to be given an id (see save_products).
+        """
+        doc = json.loads(path.read_text(encoding="utf-8"))
+        if path.name == "warehouses.json":
+            self.save_warehouses(doc.get("warehouses", []))
+        elif path.name.startswith("products_") and path.suffix == ".json":
+            return self.save_products(path.stem[len("products_"):], doc.get("products", []))
+        return 0
+
+    def export_products_json(self, warehouse, path: Path):
+        replace_file(path, json.dumps({"products": self.load_products(warehouse)}, indent=2))
+
+    def export_warehouses_json(self, path: Path):
+        replace_file(path, json.dumps({"warehouses": self.load_warehouses()}, indent=2))
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def migrate_from_json(data_dir: Path, db_path: Path):
+    """One-shot import of warehouses.json and every products_*.json."""
+    store = SqliteStore(db_path)
+    data_dir = Path(data_dir)
+    wh = data_dir / "warehouses.json"
+    if wh.exists():
+        store.import_json_file(wh)
+    for p in sorted(data_dir.glob("products_*.json")):
+        store.import_json_file(p)
+    return store
+
+
+def export_to_json(db_path: Path, data_dir: Path):
+    """Write warehouses.json and products_<wh>.json back out of the database."""
+    store = SqliteStore(db_path)
+    data_dir = Path(data_dir)
+    store.export_warehouses_json(data_dir / "warehouses.json")
+    for key in store.product_keys():
+        store.export_products_json(key, data_dir / f"products_{key}.json")
+    return store
+
+
+if __name__ == "__main__":
+    # python -m utils.sqlite_store migrate|export <data_dir> <db_path>
+    if len(sys.argv) != 4 or sys.argv[1] not in ("migrate", "export"):
+        print("usage: python -m utils.sqlite_store migrate|export <data_dir> <db_path>")
+        sys.exit(2)
+    cmd, data_dir, db_path = sys.argv[1:]
+    if cmd == "migrate":
+        migrate_from_json(Path(data_dir), Path(db_path))
+    else:
+        export_to_json(Path(db_path), Path(data_dir))
@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from .fileio import replace_file
+from .github_sync import git_blob_sha
+from .locks import flocked
+
+
+def _file_sha(path: Path):
+    try:
+        return git_blob_sha(path.read_bytes())
+    except FileNotFoundError:
+        return None
+
+
+class SyncQueue:
+    """
+    Durable record of which data files still have to reach GitHub.
+
+    ``mark`` sets a dirty marker for a file; ``done`` clears it once a push
+    succeeded and remembers the blob SHA that was pushed. Markers carry a
+    generation so a file re-marked while its push was in flight stays dirty.
+    Everything is rewritten atomically to one small JSON file on each
+    change, so markers survive restarts and crashes; ``recover`` also flags
+    files whose bytes no longer match the last pushed SHA (e.g. written just
+    before a crash, before their marker was).
+
+    With ``shared`` several processes use the same file: every call takes
+    an OS lock on it and re-reads it first, so markers set by one process
+    are seen (and pushed) by another.
+    """
+    def __init__(self, path: Path, shared=False):
+        self.path = path
+        self.shared = shared
+        self._thread_lock = threading.Lock()
+        self._load()
+        self.last_failure = None
+        self.last_error = None
+        self.failures = 0          # consecutive failed pushes
+        self.total_failures = 0
+
+    def _load(self):
+        try:
+            doc = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            doc = {}
+        self.dirty = doc.get("dirty", {})     # file name -> {"gen": n, "since": t}
+        self.synced = doc.get("synced", {})   # file name -> blob sha last pushed
+        self.last_success = doc.get("last_success")
+        self._gen = max([d.get("gen", 0) for d in self.dirty.values()] + [doc.get("gen", 0)])
+
+    @contextmanager
+    def _lock(self):
+        with self._thread_lock:
+            if not self.shared:
+                yield
+                return
+            with flocked(self.path.with_name(f".{self.path.name}.lock")):
+                self._load()
+                yield
+
+    def _save(self):
+        doc = {"dirty": self.dirty, "synced": self.synced, "last_success": self.last_success,
+               "gen": self._gen}
+        replace_file(self.path, json.dumps(doc, separators=(",", ":")))
+
+    def mark(self, name):
+        with self._lock():
+            self._gen += 1
+            since = self.dirty.get(name, {}).get("since") or time.time()
+            self.dirty[name] = {"gen": self._gen, "since": since}
+            self._save()
+
+    def is_dirty(self, name):
+        with self._lock():
+            return name in self.dirty
+
+    def generations(self, names):
+        """{name: gen} for a batch about to be pushed; pass it back to ``done``."""
+        with self._lock():
+            return {n: self.dirty.get(n, {}).get("gen", 0) for n in names}
+
+    def done(self, gens, shas):
+        """
+        A push of ``gens`` (from ``generations``) succeeded; ``shas`` maps
+        name -> blob sha now on GitHub (None once deleted).
+        """
+        with self._lock():
+            for name, gen in gens.items():
+                if self.dirty.get(name, {}).get("gen", 0) == gen:
+                    self.dirty.pop(name, None)
+                if shas.get(name):
+                    self.synced[name] = shas[name]
+                else:
+                    self.synced.pop(name, None)
+            self.failures = 0
+            self.last_success = time.time()
+            self._save()
+
+    def synced_as(self, name, sha):
+        """Record that the local ``name`` now matches GitHub at ``sha`` (after a pull)."""
+        with self._lock():
+            if sha:
+                self.synced[name] = sha
+                self._save()
+
+    def failed(self, error):
+        with self._lock():
+            self.failures += 1
+            self.total_failures += 1
+            self.last_failure = time.time()
+            self.last_error = str(error)[:200]
+
+    def dirty_since(self):
+        """{name: time it was first marked} for every dirty file."""
+        with self._lock():
+            return {n: d.get("since") or 0 for n, d in self.dirty.items()}
+
+    def recover(self, files):
+        """
+        Return the names still dirty after a restart: every marked file plus
+        any of ``files`` whose content differs from what was last pushed.
+        """
+        with self._lock():
+            names = set(self.dirty)
+            for f in files:
+                if f.name not in names and self.synced.get(f.name) != _file_sha(f):
+                    names.add(f.name)
+            return sorted(names)
+
+    def stats(self):
+        with self._lock():
+            oldest = min((d["since"] for d in self.dirty.values()), default=None)
+            return {
+                "depth": len(self.dirty),
+                "oldest_dirty_age": round(time.time() - oldest, 1) if oldest else None,
+                "last_success": self.last_success,
+                "last_failure": self.last_failure,
+                "last_error": self.last_error,
+                "consecutive_failures": self.failures,
+                "total_failures": self.total_failures,
+            }